@@ -0,0 +1,266 @@
+import argparse
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from . import config
+from .like_matrix import LikeMatrix
+
+
+def _solve_side(likes, fixed, regularization, alpha, chunk_likes=65536, chunk_values=1 << 24):
+    """
+    One half-step of implicit ALS: the best factors of every row of likes given
+    the fixed factors of the columns.
+
+    For a row u with liked columns I(u) and confidence c = 1 + alpha:
+        (YᵀY + alpha·Σ y_i y_iᵀ + λI) x_u = (1 + alpha)·Σ y_i   (i in I(u))
+    Rows are taken in order of like count, so a chunk of rows pads to nearly
+    equal lengths; Σ y_i y_iᵀ is then one batched matmul and the systems are
+    solved with one batched np.linalg.solve.
+
+    A chunk holds at most chunk_likes padded likes and, since every row gets a
+    factors × factors system, at most chunk_values // factors² rows (16M
+    float64 values, 128 MB per temporary).
+    """
+    factors = fixed.shape[1]
+    max_rows = max(1, chunk_values // factors ** 2)
+    gram = fixed.T @ fixed + regularization * np.eye(factors)
+    # Padding points at an extra zero row
+    padded = np.vstack([fixed, np.zeros((1, factors))])
+    solved = np.zeros((likes.shape[0], factors), dtype=np.float64)
+
+    counts = np.diff(likes.indptr)
+    order = np.argsort(counts, kind="stable")
+    sorted_counts = counts[order]
+
+    first = 0
+    while first < len(order):
+        # Largest chunk whose padded size (rows × longest row) fits in chunk_likes
+        last = min(len(order), first + min(max_rows, max(1, chunk_likes // max(1, sorted_counts[first]))))
+        while last > first + 1 and (last - first) * sorted_counts[last - 1] > chunk_likes:
+            last = first + (last - first) // 2
+        rows, lengths = order[first:last], sorted_counts[first:last]
+        width = max(1, int(lengths[-1]))
+
+        # Column index of every like of the chunk, row by row
+        total = int(lengths.sum())
+        positions = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        columns = np.full((len(rows), width), len(fixed), dtype=np.int64)
+        columns[np.arange(width)[None, :] < lengths[:, None]] = likes.indices[
+            np.repeat(likes.indptr[rows], lengths) + positions
+        ]
+
+        liked = padded[columns]
+        lhs = gram + alpha * np.matmul(liked.transpose(0, 2, 1), liked)
+        rhs = (1 + alpha) * liked.sum(axis=1)
+        solved[rows] = np.linalg.solve(lhs, rhs[:, :, None])[:, :, 0]
+        first = last
+    return solved
+
+
+def train(like_matrix, factors=None, regularization=None, alpha=None, iterations=None, seed=0, verbose=False):
+    """
+    Fit implicit-feedback ALS (Hu, Koren, Volinsky 2008) on the binary likes.
+
+    Returns:
+        tuple: (user_factors, item_factors) float32 arrays in the LikeMatrix row
+            and column order
+    """
+    factors = factors or config.ALS_FACTORS
+    regularization = regularization if regularization is not None else config.ALS_REGULARIZATION
+    alpha = alpha if alpha is not None else config.ALS_ALPHA
+    iterations = iterations or config.ALS_ITERATIONS
+
+    user_likes = like_matrix.matrix.tocsr()
+    item_likes = user_likes.T.tocsr()
+    rng = np.random.default_rng(seed)
+    user_factors = rng.normal(0, 0.01, size=(user_likes.shape[0], factors))
+    item_factors = rng.normal(0, 0.01, size=(user_likes.shape[1], factors))
+
+    for iteration in range(iterations):
+        start = time.perf_counter()
+        user_factors = _solve_side(user_likes, item_factors, regularization, alpha)
+        item_factors = _solve_side(item_likes, user_factors, regularization, alpha)
+        if verbose:
+            print(f"Iteration {iteration + 1}/{iterations} in {time.perf_counter() - start:.1f}s")
+    return user_factors.astype(np.float32), item_factors.astype(np.float32)
+
+
+def save_model(path, like_matrix, user_factors, item_factors):
+    """
+    Write a model directory atomically: the factors and ids as .npy files (so
+    they can be memory-mapped) and the training likes, used to leave out
+    movies a user already liked.
+    """
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    matrix = like_matrix.matrix.tocsr()
+    np.save(os.path.join(tmp_path, "user_factors.npy"), user_factors)
+    np.save(os.path.join(tmp_path, "item_factors.npy"), item_factors)
+    np.save(os.path.join(tmp_path, "movie_ids.npy"), like_matrix.movie_ids.astype(np.int64))
+    np.save(os.path.join(tmp_path, "likes_indptr.npy"), matrix.indptr.astype(np.int64))
+    np.save(os.path.join(tmp_path, "likes_indices.npy"), matrix.indices.astype(np.int32))
+    with open(os.path.join(tmp_path, "users.json"), "w") as f:
+        json.dump({"usernames": list(like_matrix.usernames), "trained_at": time.time()}, f)
+
+    # Swap the directories; readers that already mapped the old files keep them
+    old_path = f"{path}.old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+class ALSModel:
+    """
+    Trained factors for serving get_recommendations_for_me.
+
+    The factor matrices are memory-mapped read-only, so every worker shares the
+    same pages. A user's scores are one matrix-vector product over all movies,
+    and the top k come from argpartition.
+    """
+
+    def __init__(self, usernames, movie_ids, user_factors, item_factors, likes_indptr, likes_indices):
+        self.user_index = {username: i for i, username in enumerate(usernames)}
+        self.movie_ids = movie_ids
+        self.user_factors = user_factors
+        self.item_factors = item_factors
+        self.likes_indptr = likes_indptr
+        self.likes_indices = likes_indices
+
+    @classmethod
+    def load(cls, path=None):
+        path = path or config.ALS_MODEL_PATH
+        with open(os.path.join(path, "users.json")) as f:
+            usernames = json.load(f)["usernames"]
+
+        def array(name):
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+
+        return cls(usernames, array("movie_ids"), array("user_factors"), array("item_factors"),
+                   array("likes_indptr"), array("likes_indices"))
+
+    def recommend(self, username, limit=10):
+        """
+        Highest-scoring movies the user has not liked.
+
+        Returns:
+            list: [(movie_id, score), ...], or None if the user was not in the
+                training data so the caller can fall back to the neighbours
+        """
+        row = self.user_index.get(username)
+        if row is None:
+            return None
+
+        scores = self.item_factors @ self.user_factors[row]
+        scores[self.likes_indices[self.likes_indptr[row]:self.likes_indptr[row + 1]]] = -np.inf
+
+        limit = min(limit, len(scores))
+        top = np.argpartition(-scores, limit - 1)[:limit] if limit < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(self.movie_ids[j]), float(scores[j])) for j in top if np.isfinite(scores[j])]
+
+
+def hit_rate(likes, recommenders, k=10, users=1000, seed=0):
+    """
+    Leave-one-out hit rate@k: one like of each sampled user is hidden, the
+    recommenders are built on the remaining likes, and a hit is the hidden
+    movie appearing in the user's top k.
+
+    Args:
+        likes (dict): {username: movie ids}
+        recommenders (dict): {name: build(LikeMatrix) -> recommend(username, k)}
+
+    Returns:
+        dict: {name: hit rate}, plus "users" (number of evaluated users)
+    """
+    rng = np.random.default_rng(seed)
+    eligible = sorted(username for username, movie_ids in likes.items() if len(set(movie_ids)) >= 2)
+    sampled = [eligible[i] for i in rng.choice(len(eligible), size=min(users, len(eligible)), replace=False)]
+
+    training = {username: set(movie_ids) for username, movie_ids in likes.items()}
+    held_out = {}
+    for username in sampled:
+        movie_id = sorted(training[username])[rng.integers(0, len(training[username]))]
+        training[username].discard(movie_id)
+        held_out[username] = movie_id
+
+    like_matrix = LikeMatrix(training)
+    results = {"users": len(sampled)}
+    for name, build in recommenders.items():
+        recommend = build(like_matrix)
+        hits = sum(
+            1 for username in sampled
+            if held_out[username] in [movie_id for movie_id, _ in recommend(username, k) or []]
+        )
+        results[name] = hits / len(sampled) if sampled else 0.0
+    return results
+
+
+def _als_recommender(like_matrix, **options):
+    user_factors, item_factors = train(like_matrix, **options)
+    model = ALSModel(like_matrix.usernames, like_matrix.movie_ids, user_factors, item_factors,
+                     like_matrix.matrix.indptr, like_matrix.matrix.indices)
+    return model.recommend
+
+
+def _jaccard_recommender(like_matrix):
+    # LikeMatrix.recommend ranks like the Cypher RECOMMENDATION_QUERY
+    return lambda username, k: like_matrix.recommend(username, limit=k)
+
+
+def _load_likes(csv_path):
+    if csv_path:
+        like_matrix = LikeMatrix.from_csv(csv_path)
+    else:
+        from .clients import get_neo4j_driver
+        like_matrix = LikeMatrix.from_neo4j(get_neo4j_driver())
+    return {username: like_matrix.liked_movies(username) for username in like_matrix.usernames}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the ALS recommender or compare it with the Jaccard method")
+    parser.add_argument("mode", choices=["train", "evaluate"], nargs="?", default="train")
+    parser.add_argument("--csv", help="Read likes from a movies_likes.csv file instead of Neo4j")
+    parser.add_argument("--path", default=config.ALS_MODEL_PATH)
+    parser.add_argument("--factors", type=int)
+    parser.add_argument("--regularization", type=float)
+    parser.add_argument("--alpha", type=float)
+    parser.add_argument("--iterations", type=int)
+    parser.add_argument("--users", type=int, default=1000, help="evaluate: users sampled for leave-one-out")
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+    options = {"factors": args.factors, "regularization": args.regularization, "alpha": args.alpha,
+               "iterations": args.iterations}
+
+    from .clients import close_all
+
+    try:
+        likes = _load_likes(args.csv)
+        if args.mode == "train":
+            like_matrix = LikeMatrix(likes)
+            start = time.perf_counter()
+            user_factors, item_factors = train(like_matrix, verbose=True, **options)
+            save_model(args.path, like_matrix, user_factors, item_factors)
+            print(f"Trained on {len(like_matrix.usernames)} users and {len(like_matrix.movie_ids)} movies "
+                  f"in {time.perf_counter() - start:.1f}s, written to {args.path}")
+        else:
+            results = hit_rate(likes, {
+                "jaccard": _jaccard_recommender,
+                "als": lambda like_matrix: _als_recommender(like_matrix, **options),
+            }, k=args.k, users=args.users)
+            print(f"Hit rate@{args.k} over {results.pop('users')} users: " + ", ".join(
+                f"{name} {rate:.3f}" for name, rate in results.items()
+            ))
+    finally:
+        close_all()
+
+
+if __name__ == "__main__":
+    main()
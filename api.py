@@ -0,0 +1,275 @@
+import base64
+import datetime
+import gzip
+import hashlib
+
+from flask import Blueprint, abort, current_app, jsonify, request, session
+
+from . import config, service
+from .cache import dumps, loads
+from .cached_service import (
+    get_movie_cards,
+    get_movie_details,
+    get_recent_released_movies,
+    get_recommendations_for_me,
+    get_similar_movies,
+    get_top_rated_movies,
+)
+
+try:
+    import brotli
+except ImportError:
+    # Brotli is optional; without it responses are gzip compressed only
+    brotli = None
+
+# JSON endpoints, registered on the Flask app in app.py
+api = Blueprint("api", __name__, url_prefix="/api")
+
+# Versioned JSON API: conditional GET, compression and keyset pagination
+api_v1 = Blueprint("api_v1", __name__, url_prefix="/api/v1")
+
+
+def to_json(value):
+    """Datetimes as ISO 8601 strings, recursively (the default provider uses HTTP dates)"""
+    if isinstance(value, dict):
+        return {key: to_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [to_json(item) for item in value]
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+def parse_movie_ids(text, limit):
+    """Comma-separated movie ids; aborts with 400 if malformed or more than limit"""
+    try:
+        movie_ids = [int(movie_id) for movie_id in text.split(",") if movie_id.strip()]
+    except ValueError:
+        abort(400, description="ids must be comma-separated integers")
+    if len(movie_ids) > limit:
+        abort(400, description=f"At most {limit} ids per request")
+    return movie_ids
+
+
+@api.errorhandler(400)
+def bad_request(error):
+    return jsonify(error=error.description), 400
+
+
+@api.route("/movies")
+def movies():
+    """Cards of several movies: /api/movies?ids=550,680,13 (unknown ids are left out)"""
+    movie_ids = parse_movie_ids(request.args.get("ids", ""), config.API_MAX_IDS)
+    return jsonify(movies=to_json(get_movie_cards(movie_ids)))
+
+
+def encode_cursor(after):
+    """Opaque cursor for a keyset position (list of sort values)"""
+    return base64.urlsafe_b64encode(dumps(after)).decode().rstrip("=") if after is not None else None
+
+
+# Types of the cursor values of each sort field; other fields are numbers, and
+# every field but _id may be missing from a document (None)
+CURSOR_TYPES = {
+    "_id": (int,),
+    "release_date": (datetime.datetime, type(None)),
+}
+_NUMBER_OR_NONE = (int, float, type(None))
+
+
+def decode_cursor(cursor, sort):
+    """
+    Keyset position of a cursor for a sort order; aborts with 400 unless it
+    holds one value of the expected type per sort field.
+    """
+    if not cursor:
+        return None
+    try:
+        after = loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        abort(400, description="Invalid cursor")
+    if not isinstance(after, list) or len(after) != len(sort) or not all(
+        isinstance(value, CURSOR_TYPES.get(field, _NUMBER_OR_NONE)) and not isinstance(value, bool)
+        for (field, _), value in zip(sort, after)
+    ):
+        abort(400, description="Invalid cursor")
+    return after
+
+
+def parse_limit(default=None):
+    default = default or config.API_PAGE_SIZE
+    try:
+        limit = int(request.args.get("limit", default))
+    except ValueError:
+        abort(400, description="limit must be an integer")
+    if not 1 <= limit <= config.API_MAX_PAGE_SIZE:
+        abort(400, description=f"limit must be between 1 and {config.API_MAX_PAGE_SIZE}")
+    return limit
+
+
+def entry_validators(key, entry):
+    """
+    Weak ETag and Last-Modified of a response built from a cache entry.
+
+    The ETag covers the entry version (feeds) or build time, and the query
+    string, so every page and page size of a snapshot has its own tag. Entries
+    written before built_at was stored have no validators (None, None).
+    """
+    if "built_at" not in entry:
+        return None, None
+    version = entry.get("version") or int(entry["built_at"] * 1000)
+    digest = hashlib.sha1(f"{key}|{version}|{request.query_string.decode()}".encode()).hexdigest()[:20]
+    last_modified = datetime.datetime.fromtimestamp(int(entry["built_at"]), datetime.timezone.utc)
+    return digest, last_modified
+
+
+def not_modified(etag, last_modified):
+    """True if the client's copy (If-None-Match / If-Modified-Since) is current"""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def cached_response(key, entry, build, private=False):
+    """
+    JSON response for data from a cache entry, or 304 when the client's copy is
+    current; build() is only called (and the payload serialized) otherwise.
+    """
+    etag, last_modified = entry_validators(key, entry)
+    if etag is None:
+        response = uncached_response(build())
+        if private:
+            response.headers["Cache-Control"] = "private, no-cache"
+        return response
+    if not_modified(etag, last_modified):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(to_json(build()))
+    response.set_etag(etag, weak=True)
+    response.last_modified = last_modified
+    response.headers["Cache-Control"] = "private, no-cache" if private else "no-cache"
+    return response
+
+
+def uncached_response(payload):
+    """JSON response with a content-hash ETag, answered with 304 if it matches"""
+    response = jsonify(to_json(payload))
+    response.add_etag(weak=True)
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+
+def page(items, next_after):
+    return {"items": items, "next_cursor": encode_cursor(next_after)}
+
+
+def cached_page(key, entry, sort, limit):
+    """First page served from a cached list; the cursor continues with keyset queries"""
+    items = entry["value"][:limit]
+    next_after = service.sort_values(items[-1], sort) if len(items) == limit else None
+    return page(items, next_after)
+
+
+@api_v1.errorhandler(400)
+@api_v1.errorhandler(401)
+@api_v1.errorhandler(404)
+def client_error(error):
+    return jsonify(error=error.description), error.code
+
+
+@api_v1.after_request
+def compress(response):
+    """gzip/brotli large JSON bodies for clients that accept them"""
+    response.vary.add("Accept-Encoding")
+    if (response.status_code != 200 or response.direct_passthrough or "Content-Encoding" in response.headers
+            or response.content_length is None or response.content_length < config.API_COMPRESS_MIN_BYTES):
+        return response
+
+    encodings = request.accept_encodings
+    if brotli is not None and encodings["br"] and encodings["br"] >= encodings["gzip"]:
+        response.set_data(brotli.compress(response.get_data(), quality=4))
+        response.headers["Content-Encoding"] = "br"
+    elif encodings["gzip"]:
+        response.set_data(gzip.compress(response.get_data(), compresslevel=5))
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
+@api_v1.route("/search")
+def search():
+    """Search results, ranked like /search: /api/v1/search?q=matrix&limit=20&cursor=..."""
+    text = request.args.get("q", "").strip()
+    if not text:
+        abort(400, description="q is required")
+    results, next_after = service.search_movie_page(
+        text, decode_cursor(request.args.get("cursor"), service.SEARCH_SORT), parse_limit()
+    )
+    return uncached_response(page(results, next_after))
+
+
+@api_v1.route("/movies")
+def movies_v1():
+    """Cards of several movies: /api/v1/movies?ids=550,680,13 (unknown ids are left out)"""
+    movie_ids = parse_movie_ids(request.args.get("ids", ""), config.API_MAX_IDS)
+    return uncached_response({"items": get_movie_cards(movie_ids)})
+
+
+def _movie_or_404(movie_id):
+    entry = get_movie_details.get_entry(movie_id)
+    if entry["value"] is None:
+        abort(404, description=f"Movie {movie_id} not found")
+    return entry
+
+
+@api_v1.route("/movies/<int:movie_id>")
+def movie(movie_id):
+    entry = _movie_or_404(movie_id)
+    return cached_response(get_movie_details.key(movie_id), entry, lambda: entry["value"])
+
+
+@api_v1.route("/movies/<int:movie_id>/similar")
+def similar(movie_id):
+    """Similar movies; the first page (up to 10) is the cached list"""
+    genres = _movie_or_404(movie_id)["value"]["genres"]
+    after, limit = decode_cursor(request.args.get("cursor"), service.SIMILAR_SORT), parse_limit(10)
+    if after is None:
+        entry = get_similar_movies.get_entry(movie_id, genres)
+        if limit <= len(entry["value"]) or len(entry["value"]) < 10:
+            key = get_similar_movies.key(movie_id, genres)
+            return cached_response(key, entry, lambda: cached_page(key, entry, service.SIMILAR_SORT, limit))
+    return uncached_response(page(*service.get_similar_movies_page(movie_id, genres, after, limit)))
+
+
+def _feed_endpoint(cached_feed, page_function, sort):
+    """First page from the feed snapshot when it is long enough, later pages from keyset queries"""
+    after, limit = decode_cursor(request.args.get("cursor"), sort), parse_limit()
+    if after is None:
+        entry = cached_feed.get_entry()
+        if limit <= len(entry["value"]):
+            key = cached_feed.key()
+            return cached_response(key, entry, lambda: cached_page(key, entry, sort, limit))
+    return uncached_response(page(*page_function(after, limit)))
+
+
+@api_v1.route("/movies/top-rated")
+def top_rated():
+    return _feed_endpoint(get_top_rated_movies, service.get_top_rated_movies_page, service.TOP_RATED_SORT)
+
+
+@api_v1.route("/movies/recent")
+def recent():
+    return _feed_endpoint(get_recent_released_movies, service.get_recent_released_movies_page, service.RECENT_SORT)
+
+
+@api_v1.route("/me/recommendations")
+def recommendations():
+    """Recommendations of the logged-in user (session cookie)"""
+    if "username" not in session:
+        abort(401, description="Log in to get recommendations")
+    username = session["username"]
+    entry = get_recommendations_for_me.get_entry(username)
+    return cached_response(
+        get_recommendations_for_me.key(username), entry, lambda: {"items": entry["value"]}, private=True
+    )
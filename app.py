@@ -1,31 +1,121 @@
-from flask import Flask, render_template, request, session, redirect
-import redis
-import json
-from datetime import datetime
+import os
+import time
+
+from flask import Flask, g, render_template, request, session, redirect
 
 # from .service_impl import (
-from .service import (
+from .cached_service import (
     get_top_rated_movies,
     get_movie_details,
     get_recent_released_movies,
     get_recommendations_for_me,
     get_similar_movies,
     search_movie,
-    get_movie_likes
+    get_movie_likes,
+    get_also_liked_movies,
+    FEEDS
 )
-
-# Setting up Redis connection
-redis_client = redis.Redis(host='localhost', port=6379, db=0)
+from . import config, metrics, service
+from .api import api, api_v1
+from .cache import CacheBatch
+from .clients import get_movies_collection, get_neo4j_driver
+from .feeds import FeedRefresher, print_status
+from .genre_index import GenreIndex
+from .als import ALSModel
+from .catalog_snapshot import SnapshotReloader
+from .indexes import IndexManager
+from .item_similarity import CoLikeTable
+from .like_matrix import LikeMatrix
+from .metrics import REQUEST_LATENCY
+from .neighbour_index import UserNeighbourIndex
+from .search_engine import SearchEngine
+from .timing import get_timings, server_timing_header, timed
 
 app = Flask(__name__)
 app.secret_key = b'_5#y2L"F4Q8z\n\xec]/'
+app.register_blueprint(api)
+app.register_blueprint(api_v1)
+
+# "People who liked this also liked", once item_similarity has written its table;
+# workers pick up tables written later without a restart
+if os.path.exists(config.ALSO_LIKED_PATH):
+    service.use_also_liked_table(
+        SnapshotReloader(config.ALSO_LIKED_PATH, config.ALSO_LIKED_CHECK_INTERVAL, CoLikeTable.load)
+    )
+
+# Precomputed similar users, once neighbour_index.py has built them; populate_neo4j
+# sync rewrites the file when likes change and workers pick it up
+if os.path.exists(config.NEIGHBOUR_INDEX_PATH):
+    service.use_neighbour_index(
+        SnapshotReloader(config.NEIGHBOUR_INDEX_PATH, config.NEIGHBOUR_INDEX_CHECK_INTERVAL, UserNeighbourIndex.load)
+    )
+
+# In-memory engines, opt-in: each loads its data once at startup
+if config.SEARCH_BACKEND == "memory":
+    service.use_search_engine(SearchEngine.from_mongodb(get_movies_collection()))
+
+if config.SIMILAR_MOVIES_BACKEND == "memory":
+    service.use_genre_index(GenreIndex.from_mongodb(get_movies_collection()))
+elif config.SIMILAR_MOVIES_BACKEND == "precomputed":
+    service.use_precomputed_similar()
+
+if config.LIKE_MATRIX_ENABLED:
+    service.use_like_matrix(LikeMatrix.from_neo4j(get_neo4j_driver()))
+
+if config.RECOMMENDER == "als":
+    if os.path.exists(config.ALS_MODEL_PATH):
+        service.use_als_model(ALSModel.load())
+    else:
+        print(f"No ALS model at {config.ALS_MODEL_PATH} (run als.py train); recommending with jaccard")
+
+# Card-level reads from the catalog snapshot, once one has been exported
+if os.path.exists(config.CATALOG_SNAPSHOT_PATH):
+    service.use_catalog_snapshot(SnapshotReloader())
+
+
+@app.cli.command("ensure-indexes")
+def ensure_indexes_command():
+    """Create the MongoDB indexes and Neo4j constraints the queries need"""
+    created = IndexManager().ensure_indexes()
+    print(f"Created: {', '.join(created)}" if created else "All indexes already exist")
+
+
+@app.cli.command("refresh-feeds")
+def refresh_feeds_command():
+    """Precompute the global feeds once and print their status"""
+    FeedRefresher(FEEDS).refresh_all()
+    print_status()
+
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def add_server_timing(response):
+    # Per-lookup breakdown (cache, each service function, render) for the browser devtools / load tests
+    if config.SERVER_TIMING and "request_start" in g:
+        timings = get_timings()
+        timings["total"] = time.perf_counter() - g.request_start
+        response.headers["Server-Timing"] = server_timing_header(timings)
+    return response
+
+
+@app.after_request
+def record_request_metrics(response):
+    if config.METRICS_ENABLED and "request_start" in g:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_LATENCY.observe(
+            time.perf_counter() - g.request_start, route=route, method=request.method, status=response.status_code
+        )
+    return response
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return metrics.render(), 200, {"Content-Type": metrics.CONTENT_TYPE}
 
-# Function for serializing datetime objects
-class DateTimeEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        return super().default(obj)
 
 @app.route("/", methods=["GET", "POST"])
 def index():
@@ -34,43 +124,34 @@ def index():
         session["username"] = request.form["username"]
         return redirect("/")
 
-    # Attempt to retrieve movies from Redis
-    cached_top_rated = redis_client.get("top_rated_movies")
-    if cached_top_rated:
-        top_rated_movies = json.loads(cached_top_rated)
-    else:
-        top_rated_movies = get_top_rated_movies()
-        redis_client.setex("top_rated_movies", 300, json.dumps(top_rated_movies, cls=DateTimeEncoder))
+    # All cache keys of the page in one MGET, misses written back in one pipeline
+    with CacheBatch() as batch:
+        top_rated = batch.add(get_top_rated_movies)
+        recent = batch.add(get_recent_released_movies)
+        if username := session.get("username"):
+            user_recommendations = batch.add(get_recommendations_for_me, username)
 
-    cached_recent_movies = redis_client.get("recent_movies")
-    if cached_recent_movies:
-        recent_movies = json.loads(cached_recent_movies)
-    else:
-        recent_movies = get_recent_released_movies()
-        redis_client.setex("recent_movies", 300, json.dumps(recent_movies, cls=DateTimeEncoder))
+        # Cache misses are computed concurrently (see fanout.py)
+        batch.prefetch(top_rated, recent, *([user_recommendations] if username else []))
 
-    if username := session.get("username"):
-        cached_recommendations = redis_client.get(f"recommendations_{username}")
-        if cached_recommendations:
-            recommendations = json.loads(cached_recommendations)
-        else:
-            recommendations = get_recommendations_for_me(username)
-            redis_client.setex(f"recommendations_{username}", 300, json.dumps(recommendations, cls=DateTimeEncoder))
-    else:
-        recommendations = []
+        top_rated_movies = batch.result(top_rated)
+        recent_movies = batch.result(recent)
+        recommendations = batch.result(user_recommendations) if username else []
 
-    return render_template(
-        "index.html",
-        top_rated_movies=top_rated_movies,
-        recent_movies=recent_movies,
-        recommendations=recommendations,
-    )
+    with timed("render"):
+        return render_template(
+            "index.html",
+            top_rated_movies=top_rated_movies,
+            recent_movies=recent_movies,
+            recommendations=recommendations,
+        )
 
 
 @app.route("/search")
 def search_results():
     text = request.args["query"]
-    result = search_movie(text)
+    with timed("search_movie"):
+        result = search_movie(text)
     search_results = result.pop("searchResults")
     
     # Debug print to verify data before rendering
@@ -79,48 +160,57 @@ def search_results():
     #print("votes_facet:", result.get("votesFacet"))
     #print("genre_facet:", result.get("genreFacet"))
     
-    return render_template(
-        "list.html",
-        search_results=search_results,
-        votes_facet=result["votesFacet"],
-        releaseYearFacet=result["releaseYearFacet"],
-        genre_facet=result["genreFacet"],
-    )
+    with timed("render"):
+        return render_template(
+            "list.html",
+            search_results=search_results,
+            votes_facet=result["votesFacet"],
+            releaseYearFacet=result["releaseYearFacet"],
+            genre_facet=result["genreFacet"],
+        )
 
 
 @app.route("/movie/<movie_id>")
 def movie_details(movie_id):
     movie_id = int(movie_id)
 
-    cached_movie = redis_client.get(f"movie_details_{movie_id}")
-    if cached_movie:
-        movie = json.loads(cached_movie)
-    else:
-        movie = get_movie_details(movie_id)
-        if movie:
-            redis_client.setex(f"movie_details_{movie_id}", 300, json.dumps(movie, cls=DateTimeEncoder))
+    with CacheBatch() as batch:
+        details = batch.add(get_movie_details, movie_id)
+        if username := session.get("username"):
+            movie_likes = batch.add(get_movie_likes, username, movie_id)
+        # The genres are only known once the details are loaded
+        similar_movies = batch.add(get_similar_movies, movie_id, None)
+        also_liked_movies = batch.add(get_also_liked_movies, movie_id)
+
+        if batch.is_cached(details):
+            movie = batch.result(details)
+            # The genres are known, so similar movies can run alongside the likes
+            calls = [(similar_movies, (movie_id, movie["genres"]))]
+        else:
+            calls = [details]
+        calls.append(also_liked_movies)
+        if username:
+            calls.append(movie_likes)
+        batch.prefetch(*calls)
 
-    if movie and (username := session.get("username")):
-        cached_likes = redis_client.get(f"likes_{username}_{movie_id}")
-        if cached_likes:
-            likes = json.loads(cached_likes)
+        movie = batch.result(details)
+
+        if movie and username:
+            likes = batch.result(movie_likes)
         else:
-            likes = get_movie_likes(username, movie_id)
-            redis_client.setex(f"likes_{username}_{movie_id}", 300, json.dumps(likes, cls=DateTimeEncoder))
-    else:
-        likes = []
+            likes = []
 
-    if movie:
-        cached_similar = redis_client.get(f"similar_movies_{movie_id}")
-        if cached_similar:
-            similar = json.loads(cached_similar)
+        if movie:
+            similar = batch.result(similar_movies, movie_id, movie["genres"])
+            also_liked = batch.result(also_liked_movies)
         else:
-            similar = get_similar_movies(movie_id, movie["genres"])
-            redis_client.setex(f"similar_movies_{movie_id}", 300, json.dumps(similar, cls=DateTimeEncoder))
-    else:
-        similar = []
+            similar = []
+            also_liked = []
 
-    return render_template("details.html", movie=movie, similar=similar, likes=likes)
+    with timed("render"):
+        return render_template("details.html", movie=movie, similar=similar, likes=likes, also_liked=also_liked)
 
 if __name__ == "__main__":
+    # Create or verify indexes once at startup, never on the request path
+    IndexManager().ensure_indexes()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,133 @@
+import time
+
+from quart import Quart, g, render_template, request, session, redirect
+
+from . import async_service, config, metrics
+from . import cached_service
+from .cache import AsyncCacheBatch
+from .clients import close_all_async
+from .metrics import REQUEST_LATENCY
+
+# Async entry point for the HTML pages of app.py (/, /search and /movie/<id>,
+# with the same templates) and /metrics. The JSON API (/api, /api/v1), the
+# "also liked" list on the details page and the Server-Timing header are only
+# served by app.py. Backend calls go through async_service (async MongoDB,
+# Neo4j and Redis clients), so one process can hold many requests in flight
+# while they wait on the databases. Cache keys and encoding are shared with the
+# Flask app.
+#
+# Run with an ASGI server, e.g.:
+#     hypercorn <package>.asgi_app:app --workers 4
+
+app = Quart(__name__)
+# Same key as app.py so sessions work across both entry points
+app.secret_key = b'_5#y2L"F4Q8z\n\xec]/'
+
+
+@app.after_serving
+async def close_clients():
+    await close_all_async()
+
+
+@app.before_request
+async def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+async def record_request_metrics(response):
+    if config.METRICS_ENABLED and "request_start" in g:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_LATENCY.observe(
+            time.perf_counter() - g.request_start, route=route, method=request.method, status=response.status_code
+        )
+    return response
+
+
+@app.route("/metrics")
+async def metrics_endpoint():
+    return metrics.render(), 200, {"Content-Type": metrics.CONTENT_TYPE}
+
+
+@app.route("/", methods=["GET", "POST"])
+async def index():
+    if request.method == "POST":
+        # Save the form data to the session object
+        form = await request.form
+        session["username"] = form["username"]
+        return redirect("/")
+
+    async with AsyncCacheBatch() as batch:
+        top_rated = batch.add(cached_service.get_top_rated_movies, async_service.get_top_rated_movies)
+        recent = batch.add(cached_service.get_recent_released_movies, async_service.get_recent_released_movies)
+        if username := session.get("username"):
+            user_recommendations = batch.add(
+                cached_service.get_recommendations_for_me, async_service.get_recommendations_for_me, username
+            )
+
+        await batch.prefetch(top_rated, recent, *([user_recommendations] if username else []))
+
+        top_rated_movies = await batch.result(top_rated)
+        recent_movies = await batch.result(recent)
+        recommendations = await batch.result(user_recommendations) if username else []
+
+    return await render_template(
+        "index.html",
+        top_rated_movies=top_rated_movies,
+        recent_movies=recent_movies,
+        recommendations=recommendations,
+    )
+
+
+@app.route("/search")
+async def search_results():
+    text = request.args["query"]
+    result = await async_service.search_movie(text)
+    search_results = result.pop("searchResults")
+
+    return await render_template(
+        "list.html",
+        search_results=search_results,
+        votes_facet=result["votesFacet"],
+        releaseYearFacet=result["releaseYearFacet"],
+        genre_facet=result["genreFacet"],
+    )
+
+
+@app.route("/movie/<movie_id>")
+async def movie_details(movie_id):
+    movie_id = int(movie_id)
+
+    async with AsyncCacheBatch() as batch:
+        details = batch.add(cached_service.get_movie_details, async_service.get_movie_details, movie_id)
+        if username := session.get("username"):
+            movie_likes = batch.add(
+                cached_service.get_movie_likes, async_service.get_movie_likes, username, movie_id
+            )
+        # The genres are only known once the details are loaded
+        similar_movies = batch.add(
+            cached_service.get_similar_movies, async_service.get_similar_movies, movie_id, None
+        )
+
+        if await batch.is_cached(details):
+            movie = await batch.result(details)
+            calls = [(similar_movies, (movie_id, movie["genres"]))]
+        else:
+            calls = [details]
+        if username:
+            calls.append(movie_likes)
+        await batch.prefetch(*calls)
+
+        movie = await batch.result(details)
+
+        if movie and username:
+            likes = await batch.result(movie_likes)
+        else:
+            likes = []
+
+        if movie:
+            similar = await batch.result(similar_movies, movie_id, movie["genres"])
+        else:
+            similar = []
+
+    return await render_template("details.html", movie=movie, similar=similar, likes=likes)
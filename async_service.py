@@ -0,0 +1,161 @@
+from . import service
+from .clients import get_async_db, get_async_movies_collection, get_async_neo4j_driver
+from .metrics import SERVICE_ERRORS, observed
+from .slowlog import watch_cypher
+from .service import (
+    CARD_PROJECTION,
+    DETAILS_PROJECTION,
+    MOVIE_LIKES_QUERY,
+    RECENT_SORT,
+    TOP_RATED_FILTER,
+    TOP_RATED_SORT,
+    empty_search_result,
+    format_search_result,
+    movie_card,
+    movie_details_doc,
+    recent_movies_filter,
+    recommendation_plan,
+    search_pipeline,
+    similar_movie_card,
+    similar_movies_pipeline,
+    start_of_today,
+)
+
+# Async versions of the service.py functions for asgi_app. They run the same
+# queries (built by the helpers in service.py) on the async MongoDB and Neo4j
+# drivers, and use the same optional in-memory engines.
+
+
+@observed
+async def search_movie(text):
+    try:
+        if service._search_engine is not None:
+            return service._search_engine.search(text)
+
+        cursor = await get_async_movies_collection().aggregate(search_pipeline(text))
+        result = await cursor.to_list(None)
+        return format_search_result(result[0])
+
+    except Exception as e:
+        print(f"Error searching movies: {e}")
+        SERVICE_ERRORS.inc(function="search_movie")
+        return empty_search_result()
+
+
+@observed
+async def get_top_rated_movies():
+    try:
+        top_movies = await get_async_movies_collection().find(
+            TOP_RATED_FILTER,
+            projection=CARD_PROJECTION
+        ).sort(TOP_RATED_SORT).limit(25).to_list(None)
+
+        return [movie_card(movie) for movie in top_movies]
+
+    except Exception as e:
+        print(f"Error retrieving top rated movies: {e}")
+        SERVICE_ERRORS.inc(function="get_top_rated_movies")
+        return []
+
+
+@observed
+async def get_recent_released_movies():
+    try:
+        recent_movies = await get_async_movies_collection().find(
+            recent_movies_filter(start_of_today()),
+            projection=CARD_PROJECTION
+        ).sort(RECENT_SORT).limit(25).to_list(None)
+
+        return [movie_card(movie) for movie in recent_movies]
+
+    except Exception as e:
+        print(f"Error retrieving recent movies: {e}")
+        SERVICE_ERRORS.inc(function="get_recent_released_movies")
+        return []
+
+
+@observed
+async def get_movie_details(movie_id):
+    try:
+        movie = await get_async_movies_collection().find_one({"_id": movie_id}, projection=DETAILS_PROJECTION)
+
+        # Return None if movie not found
+        if not movie:
+            return None
+
+        return movie_details_doc(movie)
+
+    except Exception as e:
+        print(f"Error retrieving movie details: {e}")
+        SERVICE_ERRORS.inc(function="get_movie_details")
+        return None
+
+
+@observed
+async def get_similar_movies(movie_id, genres):
+    try:
+        # In-memory index: same top 10 without touching Mongo
+        if service._genre_index is not None:
+            return service._genre_index.similar(movie_id, genres)
+
+        # Offline mode: results stored for every movie with vote_count >= 500
+        if service._use_precomputed_similar:
+            precomputed = await get_async_db().similar_movies.find_one({"_id": movie_id})
+            if precomputed:
+                return precomputed["similar"]
+
+        cursor = await get_async_movies_collection().aggregate(similar_movies_pipeline(movie_id, genres))
+        return [similar_movie_card(movie) async for movie in cursor]
+
+    except Exception as e:
+        print(f"Error retrieving similar movies: {e}")
+        SERVICE_ERRORS.inc(function="get_similar_movies")
+        return []
+
+
+@observed
+async def get_movie_likes(username, movie_id):
+    try:
+        async with get_async_neo4j_driver().session() as session:
+            with watch_cypher(MOVIE_LIKES_QUERY, {"movie_id": movie_id, "username": username}):
+                result = await session.run(MOVIE_LIKES_QUERY, movie_id=movie_id, username=username)
+                return [record["username"] async for record in result]
+
+    except Exception as e:
+        print(f"Error getting movie likes: {e}")
+        SERVICE_ERRORS.inc(function="get_movie_likes")
+        return []
+
+
+async def _recommended_movie_ids(username):
+    movie_ids, query, parameters = recommendation_plan(username)
+    if movie_ids is not None:
+        return movie_ids
+
+    async with get_async_neo4j_driver().session() as session:
+        with watch_cypher(query, parameters):
+            result = await session.run(query, **parameters)
+            return [record["movie_id"] async for record in result]
+
+
+@observed
+async def get_recommendations_for_me(username):
+    """Async service.get_recommendations_for_me"""
+    try:
+        movie_ids = await _recommended_movie_ids(username)
+        if not movie_ids:
+            return []
+
+        movies = await get_async_movies_collection().find(
+            {"_id": {"$in": movie_ids}},
+            projection=CARD_PROJECTION
+        ).to_list(None)
+
+        # Maintain the order from the recommendation ranking
+        movie_dict = {movie["_id"]: movie_card(movie) for movie in movies}
+        return [movie_dict[movie_id] for movie_id in movie_ids if movie_id in movie_dict]
+
+    except Exception as e:
+        print(f"Error getting recommendations: {e}")
+        SERVICE_ERRORS.inc(function="get_recommendations_for_me")
+        return []
@@ -0,0 +1,89 @@
+"""
+Side-by-side throughput comparison of the Flask (app.py) and ASGI (asgi_app.py)
+entry points.
+
+Start both servers against the same databases, for example:
+
+    gunicorn -w 4 --threads 8 -b :8000 <package>.app:app
+    hypercorn -w 4 -b :8001 <package>.asgi_app:app
+
+then run:
+
+    python -m <package>.benchmarks.compare_serving \
+        --target flask=http://localhost:8000 --target asgi=http://localhost:8001 \
+        --path / --path /movie/550 --concurrency 50 --duration 30
+"""
+import argparse
+import statistics
+import threading
+import time
+import urllib.request
+
+
+def _worker(base_url, paths, deadline, latencies, errors, lock):
+    index = 0
+    while time.perf_counter() < deadline:
+        path = paths[index % len(paths)]
+        index += 1
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(base_url + path, timeout=30) as response:
+                response.read()
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+        except Exception:
+            with lock:
+                errors.append(path)
+
+
+def run(base_url, paths, concurrency, duration):
+    """
+    Hit base_url with `concurrency` closed-loop clients for `duration` seconds.
+
+    Returns:
+        dict: requests, errors, throughput (req/s) and latency percentiles (ms)
+    """
+    latencies, errors, lock = [], [], threading.Lock()
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=_worker, args=(base_url, paths, deadline, latencies, errors, lock))
+        for _ in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    percentile = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000 if latencies else 0.0
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "throughput": len(latencies) / duration,
+        "mean": statistics.mean(latencies) * 1000 if latencies else 0.0,
+        "p50": percentile(0.50),
+        "p95": percentile(0.95),
+        "p99": percentile(0.99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", action="append", required=True, help="name=base_url, repeat per server")
+    parser.add_argument("--path", action="append", default=None, help="Request path, repeat to mix (default /)")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30)
+    args = parser.parse_args()
+
+    paths = args.path or ["/"]
+    print(f"{'target':<10}{'req/s':>10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for target in args.target:
+        name, _, base_url = target.partition("=")
+        stats = run(base_url.rstrip("/"), paths, args.concurrency, args.duration)
+        print(f"{name:<10}{stats['throughput']:>10.1f}{stats['mean']:>10.1f}{stats['p50']:>10.1f}"
+              f"{stats['p95']:>10.1f}{stats['p99']:>10.1f}{stats['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
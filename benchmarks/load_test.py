@@ -0,0 +1,240 @@
+"""
+End-to-end HTTP load test of the Flask routes.
+
+Virtual users replay a traffic mix over /, /search and /movie/<id>: movie pages
+follow a Zipf distribution over the catalog ranked by popularity, searches come
+from a query log, and a fixed share of users log in first. Each concurrency
+level runs for --duration seconds; with --cold the cache keys are deleted (and
+invalidated in every worker) before each level.
+
+The Server-Timing header of every response is used to split server time
+between the cache, MongoDB, Neo4j and template rendering.
+
+    python -m <package>.benchmarks.load_test --base-url http://localhost:5000 \
+        --concurrency 1,8,32,64 --duration 30 --logged-in 0.3 --report load_report.json
+"""
+import argparse
+import http.cookiejar
+import json
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+import numpy as np
+
+from ..cache import local_cache, publish_invalidation
+from ..clients import get_movies_collection, get_redis_client
+
+# Cache key families written by cached_service
+CACHE_KEY_PATTERNS = [
+    "top_rated_movies*", "recent_movies", "recommendations_*", "movie_details_*", "likes_*", "similar_movies_*",
+    "also_liked_*"
+]
+
+# Server-Timing names -> backend. Recommendations query Neo4j, then MongoDB for the cards.
+BACKENDS = {
+    "cache": "cache",
+    "render": "render",
+    "search_movie": "mongo",
+    "get_top_rated_movies": "mongo",
+    "get_recent_released_movies": "mongo",
+    "get_movie_details": "mongo",
+    "get_similar_movies": "mongo",
+    "get_also_liked_movies": "mongo",
+    "get_movie_likes": "neo4j",
+    "get_recommendations_for_me": "neo4j",
+}
+
+
+class Workload:
+    """Seeded source of requests: (route name, path)"""
+
+    def __init__(self, movie_ids, queries, mix, zipf_exponent=1.0, seed=0):
+        """
+        Args:
+            movie_ids (list): Catalog, most popular first
+            queries (list): Search query log
+            mix (dict): Route weights, e.g. {"index": 0.3, "search": 0.2, "movie": 0.5}
+        """
+        self.movie_ids = movie_ids
+        self.queries = queries
+        self.routes = list(mix)
+        weights = np.array([mix[route] for route in self.routes], dtype=np.float64)
+        self.route_weights = weights / weights.sum()
+        ranks = np.arange(1, len(movie_ids) + 1, dtype=np.float64)
+        self.movie_weights = ranks ** -zipf_exponent / (ranks ** -zipf_exponent).sum()
+        self.seed = seed
+
+    def requests(self, user_index):
+        """Endless request stream of one virtual user"""
+        rng = np.random.default_rng((self.seed, user_index))
+        while True:
+            route = self.routes[rng.choice(len(self.routes), p=self.route_weights)]
+            if route == "index":
+                yield route, "/"
+            elif route == "search":
+                query = self.queries[rng.integers(0, len(self.queries))]
+                yield route, "/search?" + urllib.parse.urlencode({"query": query})
+            else:
+                yield route, f"/movie/{self.movie_ids[rng.choice(len(self.movie_ids), p=self.movie_weights)]}"
+
+
+def parse_server_timing(header):
+    """{name: seconds} from a Server-Timing header"""
+    timings = {}
+    for metric in filter(None, (part.strip() for part in (header or "").split(","))):
+        name, _, params = metric.partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur":
+                timings[name.strip()] = float(value) / 1000
+    return timings
+
+
+def _virtual_user(base_url, workload, user_index, logged_in, deadline, samples, lock):
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    session = "session" if logged_in else "anonymous"
+    if logged_in:
+        data = urllib.parse.urlencode({"username": f"loaduser{user_index}"}).encode()
+        opener.open(base_url + "/", data=data, timeout=30).read()
+
+    for route, path in workload.requests(user_index):
+        if time.perf_counter() >= deadline:
+            return
+        start = time.perf_counter()
+        try:
+            with opener.open(base_url + path, timeout=30) as response:
+                response.read()
+                timing = parse_server_timing(response.headers.get("Server-Timing"))
+            error = False
+        except Exception:
+            timing, error = {}, True
+        elapsed = time.perf_counter() - start
+        with lock:
+            samples.append((f"{route} ({session})", elapsed, timing, error))
+
+
+def clear_cache():
+    """Delete every cache key and drop the workers' local copies"""
+    redis = get_redis_client()
+    deleted = 0
+    for pattern in CACHE_KEY_PATTERNS:
+        for key in redis.scan_iter(match=pattern, count=1000):
+            redis.delete(key)
+            publish_invalidation(key.decode())
+            deleted += 1
+    local_cache.clear()
+    return deleted
+
+
+def run_level(base_url, workload, concurrency, duration, logged_in_share):
+    samples, lock = [], threading.Lock()
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=_virtual_user, args=(
+            base_url, workload, i, i < round(concurrency * logged_in_share), deadline, samples, lock
+        ), daemon=True)
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples
+
+
+def summarize(samples, duration):
+    """Latency percentiles per route and the server time split per backend"""
+    routes = {}
+    for route in sorted({sample[0] for sample in samples}):
+        latencies = np.array([elapsed for name, elapsed, _, error in samples if name == route and not error]) * 1000
+        errors = sum(1 for name, _, _, error in samples if name == route and error)
+        routes[route] = {
+            "requests": len(latencies),
+            "errors": errors,
+            "p50": float(np.percentile(latencies, 50)) if len(latencies) else None,
+            "p95": float(np.percentile(latencies, 95)) if len(latencies) else None,
+            "p99": float(np.percentile(latencies, 99)) if len(latencies) else None,
+        }
+
+    # Lookups run concurrently, so these are time spent per backend, not shares of wall time
+    split = {"cache": 0.0, "mongo": 0.0, "neo4j": 0.0, "render": 0.0, "other": 0.0}
+    server_total = 0.0
+    for _, _, timing, _ in samples:
+        server_total += timing.get("total", 0.0)
+        for name, seconds in timing.items():
+            if name != "total":
+                split[BACKENDS.get(name, "other")] += seconds
+    ok = sum(1 for sample in samples if not sample[3])
+    return {
+        "throughput": ok / duration,
+        "routes": routes,
+        "server_ms_per_request": {
+            backend: seconds * 1000 / ok if ok else 0.0 for backend, seconds in {**split, "total": server_total}.items()
+        },
+    }
+
+
+def _load_catalog(catalog_size):
+    """Movie ids by popularity and their titles, from MongoDB"""
+    movies = list(get_movies_collection().find({}, {"_id": 1, "title": 1}).sort("popularity", -1).limit(catalog_size))
+    return [movie["_id"] for movie in movies], [movie.get("title", "") for movie in movies]
+
+
+def _read_lines(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:5000")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated levels")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds per level")
+    parser.add_argument("--mix", default="index=0.3,search=0.2,movie=0.5")
+    parser.add_argument("--logged-in", type=float, default=0.3, help="Share of virtual users with a session")
+    parser.add_argument("--zipf", type=float, default=1.0, help="Zipf exponent of movie popularity")
+    parser.add_argument("--movie-ids", help="File of movie ids, most popular first (default: from MongoDB)")
+    parser.add_argument("--query-log", help="File of search queries (default: catalog titles)")
+    parser.add_argument("--catalog-size", type=int, default=10000)
+    parser.add_argument("--cold", action="store_true", help="Clear the cache before every level")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", default="load_report.json")
+    args = parser.parse_args()
+
+    movie_ids, titles = ([], [])
+    if not args.movie_ids or not args.query_log:
+        movie_ids, titles = _load_catalog(args.catalog_size)
+    if args.movie_ids:
+        movie_ids = [int(movie_id) for movie_id in _read_lines(args.movie_ids)]
+    queries = _read_lines(args.query_log) if args.query_log else [title.split()[0] for title in titles if title]
+
+    mix = {route: float(weight) for route, weight in (item.split("=") for item in args.mix.split(","))}
+    workload = Workload(movie_ids, queries, mix, args.zipf, args.seed)
+
+    report = {"cold": args.cold, "mix": mix, "logged_in": args.logged_in, "levels": {}}
+    for concurrency in (int(level) for level in args.concurrency.split(",")):
+        if args.cold:
+            print(f"Cleared {clear_cache()} cache keys")
+        summary = summarize(run_level(args.base_url, workload, concurrency, args.duration, args.logged_in),
+                            args.duration)
+        report["levels"][concurrency] = summary
+
+        print(f"concurrency {concurrency}: {summary['throughput']:.1f} req/s")
+        for route, stats in summary["routes"].items():
+            if stats["requests"]:
+                print(f"  {route:<24}{stats['requests']:>7}{stats['p50']:>9.1f}{stats['p95']:>9.1f}"
+                      f"{stats['p99']:>9.1f} ms (n p50 p95 p99), {stats['errors']} errors")
+        print("  server ms/request: " + ", ".join(
+            f"{backend} {ms:.1f}" for backend, ms in summary["server_ms_per_request"].items()
+        ))
+
+    report["max_throughput"] = max((level["throughput"] for level in report["levels"].values()), default=0.0)
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Max throughput {report['max_throughput']:.1f} req/s, report written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
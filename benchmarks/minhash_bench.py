@@ -0,0 +1,88 @@
+"""
+Recall and latency of MinHash/LSH similar users against the exact search.
+
+The exact baseline is LikeMatrix.neighbours, which ranks users like the Cypher
+RECOMMENDATION_QUERY (like_matrix.verify_against_cypher checks this) without the
+network round trip. Each --config (num_perm/bands) is built on the same synthetic
+like-graph and queried for the same users:
+
+    python -m <package>.benchmarks.minhash_bench --users 100000 --movies 100000 \
+        --config 192/64,256/128,512/256 --queries 1000
+
+Recall@k counts an approximate neighbour as found if its Jaccard index reaches
+the k-th best exact score, so ties among equally similar users do not count as
+misses.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from ..like_matrix import LikeMatrix
+from ..minhash import MinHashLSH
+from . import synthetic
+from .service_bench import measure
+
+
+def recall_at_k(exact, approximate, k):
+    """Share of the exact top-k matched by approximate neighbours of at least the same score"""
+    if not exact:
+        return None
+    cutoff = exact[min(k, len(exact)) - 1][1]
+    found = sum(1 for _, score in approximate[:k] if score >= cutoff)
+    return min(found, len(exact[:k])) / len(exact[:k])
+
+
+def evaluate(index, usernames, exact, k):
+    """Recall, candidate count and latency of an index over the query users"""
+    recalls, candidates = [], []
+    for username in usernames:
+        approximate = index.neighbours(username, k)
+        recall = recall_at_k(exact[username], approximate, k)
+        if recall is not None:
+            recalls.append(recall)
+        candidates.append(len(index.candidates(index.like_matrix.user_index[username])))
+    stats = measure(lambda username: index.neighbours(username, k), [(username,) for username in usernames])
+    stats["recall"] = float(np.mean(recalls)) if recalls else None
+    stats["candidates"] = float(np.mean(candidates))
+    return stats
+
+
+def _print_row(name, build_seconds, stats):
+    recall = f"{stats['recall']:.3f}" if stats.get("recall") is not None else "-"
+    print(f"{name:<14}{build_seconds:>9.2f}{recall:>9}{stats.get('candidates', 0):>12.0f}"
+          f"{stats['p50']:>9.3f}{stats['p95']:>9.3f}{stats['p99']:>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--movies", type=int, default=100_000)
+    parser.add_argument("--mean-likes", type=int, default=10)
+    parser.add_argument("--config", default="192/64,256/128,512/256,128/128", help="Comma-separated num_perm/bands pairs")
+    parser.add_argument("--queries", type=int, default=500, help="Users queried per config")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"Generating {args.movies} movies, {args.users} users")
+    movies = synthetic.generate_movies(args.movies, args.seed)
+    like_matrix = LikeMatrix(synthetic.generate_likes(args.users, movies, args.seed, args.mean_likes))
+
+    rng = np.random.default_rng(args.seed + 4)
+    usernames = [like_matrix.usernames[i] for i in rng.choice(len(like_matrix.usernames), args.queries, replace=False)]
+    exact = {username: like_matrix.neighbours(username, args.k) for username in usernames}
+
+    print(f"{'':<14}{'build s':>9}{'recall':>9}{'candidates':>12}{'p50':>9}{'p95':>9}{'p99':>9}  (ms)")
+    _print_row("exact", 0.0, measure(lambda username: like_matrix.neighbours(username, args.k),
+                                     [(username,) for username in usernames]))
+    for setting in args.config.split(","):
+        num_perm, bands = (int(value) for value in setting.split("/"))
+        start = time.perf_counter()
+        index = MinHashLSH(like_matrix, num_perm, bands, seed=args.seed)
+        build_seconds = time.perf_counter() - start
+        _print_row(f"lsh {num_perm}/{bands}", build_seconds, evaluate(index, usernames, exact, args.k))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Latency distributions of the service.py query functions at several data scales.
+
+Backends:
+    memory  Synthetic data in the in-memory engines (SearchEngine, GenreIndex,
+            LikeMatrix); only the functions they serve are measured.
+    live    The MongoDB / Neo4j configured in config.py. With --load the
+            synthetic data is loaded first: movies into --mongo-db and, with
+            --load-neo4j, the Movie/User graph (which is replaced, so point
+            NEO4J_URI at a scratch instance).
+
+Results can be saved as a baseline and later runs compared against it:
+
+    python -m <package>.benchmarks.service_bench --scale small,medium --save-baseline
+    python -m <package>.benchmarks.service_bench --scale small,medium --compare
+
+--compare exits with status 1 if any p50 or p95 is more than --threshold slower.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from .. import config, service
+from ..genre_index import GenreIndex
+from ..like_matrix import LikeMatrix
+from ..search_engine import SearchEngine
+from . import synthetic
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def measure(func, argument_sets, warmup=10):
+    """
+    Call func once per argument tuple and return its latency distribution.
+
+    Returns:
+        dict: calls, mean, p50, p95, p99 and max in milliseconds
+    """
+    for args in argument_sets[:warmup]:
+        func(*args)
+
+    samples = np.empty(len(argument_sets))
+    for i, args in enumerate(argument_sets):
+        start = time.perf_counter()
+        func(*args)
+        samples[i] = time.perf_counter() - start
+
+    samples *= 1000
+    return {
+        "calls": len(samples),
+        "mean": float(samples.mean()),
+        "p50": float(np.percentile(samples, 50)),
+        "p95": float(np.percentile(samples, 95)),
+        "p99": float(np.percentile(samples, 99)),
+        "max": float(samples.max()),
+    }
+
+
+def _workload(movies, likes, iterations, seed):
+    """Arguments for every case: popular movies more often, a query log, random users"""
+    rng = np.random.default_rng(seed + 3)
+    picks = rng.choice(len(movies), size=iterations, p=synthetic.popularity_weights(movies))
+    usernames = list(likes)
+    users = [usernames[i] for i in rng.integers(0, len(usernames), size=iterations)]
+    return {
+        "search_movie": [(query,) for query in synthetic.search_queries(movies, iterations, seed)],
+        "get_top_rated_movies": [()] * iterations,
+        "get_recent_released_movies": [()] * iterations,
+        "get_movie_details": [(movies[i]["_id"],) for i in picks],
+        "get_similar_movies": [(movies[i]["_id"], movies[i]["genres"]) for i in picks],
+        "get_movie_likes": [(user, movies[i]["_id"]) for user, i in zip(users, picks)],
+        "get_recommendations_for_me": [(user,) for user in users],
+    }
+
+
+def _cases(backend):
+    """(name, function) pairs measured on a backend"""
+    if backend == "memory":
+        # Recommendations need MongoDB to hydrate the cards, so only the ranking is measured
+        return [
+            ("search_movie", service.search_movie),
+            ("get_similar_movies", service.get_similar_movies),
+            ("get_recommendations_for_me", service._recommended_movie_ids),
+        ]
+    return [
+        (name, getattr(service, name))
+        for name in ("search_movie", "get_top_rated_movies", "get_recent_released_movies", "get_movie_details",
+                     "get_similar_movies", "get_movie_likes", "get_recommendations_for_me")
+    ]
+
+
+def _prepare(backend, movies, likes, args):
+    if backend == "memory":
+        search_engine = SearchEngine()
+        search_engine.build(movies)
+        service.use_search_engine(search_engine)
+        service.use_genre_index(GenreIndex(movies))
+        service.use_like_matrix(LikeMatrix(likes))
+        return
+
+    # Measure the database queries themselves
+    service.use_search_engine(None)
+    service.use_genre_index(None)
+    service.use_like_matrix(None)
+    service.use_neighbour_index(None)
+    if args.load:
+        from ..clients import get_movies_collection, get_neo4j_driver
+        from ..indexes import IndexManager
+
+        synthetic.load_mongo(get_movies_collection(), movies)
+        if args.load_neo4j:
+            synthetic.load_neo4j(get_neo4j_driver(), movies, likes)
+        IndexManager().ensure_indexes()
+
+
+def run(scales, backend, iterations, seed, args):
+    """{"backend/scale/function": stats} for every scale and case"""
+    results = {}
+    for scale in scales:
+        movie_count, user_count = synthetic.SCALES[scale]
+        print(f"Generating {scale}: {movie_count} movies, {user_count} users")
+        movies = synthetic.generate_movies(movie_count, seed)
+        likes = synthetic.generate_likes(user_count, movies, seed)
+        _prepare(backend, movies, likes, args)
+
+        workload = _workload(movies, likes, iterations, seed)
+        for name, func in _cases(backend):
+            stats = measure(func, workload[name])
+            results[f"{backend}/{scale}/{name}"] = stats
+            print(f"  {name:<30}{stats['p50']:>9.3f}{stats['p95']:>9.3f}{stats['p99']:>9.3f}{stats['max']:>9.3f}  ms"
+                  f" (p50 p95 p99 max)")
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print the change against the baseline; returns the keys that regressed"""
+    regressions = []
+    for key, stats in results.items():
+        if key not in baseline:
+            continue
+        for metric in ("p50", "p95"):
+            before, after = baseline[key][metric], stats[metric]
+            change = (after - before) / before if before else 0.0
+            flag = ""
+            if change > threshold:
+                flag = "  REGRESSION"
+                regressions.append(f"{key} {metric}")
+            print(f"{key:<60}{metric:>5}{before:>10.3f}{after:>10.3f}{change:>+9.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", default="small", help=f"Comma-separated, from {', '.join(synthetic.SCALES)}")
+    parser.add_argument("--backend", choices=["memory", "live"], default="memory")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--load", action="store_true", help="live: load the synthetic movies into --mongo-db")
+    parser.add_argument("--load-neo4j", action="store_true", help="live: replace the Neo4j graph too")
+    parser.add_argument("--mongo-db", default="websitedb_bench", help="Database used with --load")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown before --compare fails")
+    args = parser.parse_args()
+
+    if args.load:
+        config.MONGO_DB = args.mongo_db
+
+    results = run(args.scale.split(","), args.backend, args.iterations, args.seed, args)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+
+    if args.compare:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regressions")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Seeded synthetic catalogs and like-graphs for the benchmarks.
+
+The same seed always produces the same data, so timings from different runs
+(or machines) are measured on identical inputs.
+"""
+import datetime
+
+import numpy as np
+
+GENRES = [
+    "Action", "Adventure", "Animation", "Comedy", "Crime", "Documentary", "Drama", "Family", "Fantasy",
+    "History", "Horror", "Music", "Mystery", "Romance", "Science Fiction", "TV Movie", "Thriller", "War",
+    "Western"
+]
+
+# name: (movies, users)
+SCALES = {
+    "small": (10_000, 1_000),
+    "medium": (100_000, 10_000),
+    "large": (1_000_000, 100_000),
+}
+
+_SYLLABLES = ["ka", "lo", "mi", "ra", "ten", "dor", "vel", "sun", "mar", "is", "an", "qu", "el", "tor", "ny",
+              "ba", "ce", "fi", "go", "hu", "jin", "pe", "sha", "wy", "zo", "ri", "on", "ax", "um", "et"]
+
+
+def _zipf_weights(count, exponent=1.0):
+    weights = 1.0 / np.arange(1, count + 1) ** exponent
+    return weights / weights.sum()
+
+
+def vocabulary(size, rng):
+    """size distinct made-up words"""
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(_SYLLABLES, size=rng.integers(2, 4))))
+    return sorted(words)
+
+
+def generate_movies(count, seed=0):
+    """
+    Movie documents shaped like the movies collection.
+
+    Title words and genres follow Zipf distributions, vote counts are
+    log-normal (a few blockbusters, a long tail) and ids have gaps like TMDB ids.
+    """
+    rng = np.random.default_rng(seed)
+    words = vocabulary(5000, rng)
+    word_weights = _zipf_weights(len(words))
+    genre_weights = _zipf_weights(len(GENRES), 0.7)
+
+    ids = np.sort(rng.choice(count * 3, size=count, replace=False)) + 1
+    vote_counts = np.minimum(rng.lognormal(4, 2, size=count), 35000).astype(np.int64)
+    vote_averages = np.where(vote_counts > 0, np.clip(rng.normal(6.2, 1.2, size=count), 0, 10).round(3), 0)
+    popularity = (vote_counts * rng.uniform(0.001, 0.1, size=count)).round(3)
+    release_days = rng.integers(0, (datetime.date.today() - datetime.date(1950, 1, 1)).days, size=count)
+    title_lengths = rng.integers(1, 5, size=count)
+    title_words = rng.choice(len(words), size=title_lengths.sum(), p=word_weights)
+    genre_counts = rng.integers(1, 4, size=count)
+    # Weighted sampling without replacement for every movie at once (Gumbel top-k)
+    genre_keys = np.log(genre_weights) - np.log(-np.log(rng.random((count, len(GENRES)))))
+    genre_order = np.argsort(-genre_keys, axis=1)[:, :3]
+
+    movies = []
+    word_offset = 0
+    for i in range(count):
+        title = " ".join(words[word] for word in title_words[word_offset:word_offset + title_lengths[i]]).title()
+        word_offset += title_lengths[i]
+        genres = [GENRES[genre] for genre in genre_order[i, :genre_counts[i]]]
+        movies.append({
+            "_id": int(ids[i]),
+            "title": title,
+            "genres": genres,
+            "overview": f"Synthetic movie {ids[i]}",
+            "tagline": "",
+            "poster_path": f"/{ids[i]}.jpg",
+            "release_date": datetime.datetime(1950, 1, 1) + datetime.timedelta(days=int(release_days[i])),
+            "popularity": float(popularity[i]),
+            "vote_average": float(vote_averages[i]),
+            "vote_count": int(vote_counts[i])
+        })
+    return movies
+
+
+def popularity_weights(movies):
+    """Probability of each movie being liked or viewed, proportional to its vote count"""
+    weights = np.array([movie["vote_count"] + 1 for movie in movies], dtype=np.float64)
+    return weights / weights.sum()
+
+
+def generate_likes(user_count, movies, seed=0, mean_likes=10):
+    """
+    {username: [movie_id, ...]} with popular movies liked more often.
+
+    Returns:
+        dict: One entry per user, each with at least one like
+    """
+    rng = np.random.default_rng(seed + 1)
+    movie_ids = np.array([movie["_id"] for movie in movies])
+    cdf = np.cumsum(popularity_weights(movies))
+
+    counts = 1 + rng.poisson(mean_likes - 1, size=user_count)
+    draws = movie_ids[np.minimum(np.searchsorted(cdf, rng.random(counts.sum())), len(cdf) - 1)]
+
+    likes = {}
+    for i, user_draws in enumerate(np.split(draws, np.cumsum(counts)[:-1])):
+        likes[f"user{i:06d}"] = sorted({int(movie_id) for movie_id in user_draws})
+    return likes
+
+
+def search_queries(movies, count, seed=0):
+    """Query log of one or two title words, drawn from popular movies"""
+    rng = np.random.default_rng(seed + 2)
+    picks = rng.choice(len(movies), size=count, p=popularity_weights(movies))
+    queries = []
+    for pick in picks:
+        words = movies[pick]["title"].split()
+        start = rng.integers(0, len(words))
+        queries.append(" ".join(words[start:start + rng.integers(1, 3)]))
+    return queries
+
+
+def load_mongo(collection, movies, batch_size=10000):
+    """Replace the collection's documents with movies"""
+    collection.delete_many({})
+    for i in range(0, len(movies), batch_size):
+        collection.insert_many(movies[i:i + batch_size], ordered=False)
+
+
+def load_neo4j(driver, movies, likes, batch_size=10000):
+    """Replace the Movie/User graph with movies and likes"""
+    with driver.session() as session:
+        while session.run(
+            "MATCH (n) WHERE n:Movie OR n:User WITH n LIMIT $limit DETACH DELETE n RETURN count(*) AS deleted",
+            limit=batch_size
+        ).single()["deleted"]:
+            pass
+
+        for i in range(0, len(movies), batch_size):
+            session.run("""
+            UNWIND $movies AS movie
+            MERGE (m:Movie {id: movie.id})
+            SET m.title = movie.title, m.genres = movie.genres
+            """, movies=[
+                {"id": movie["_id"], "title": movie["title"], "genres": movie["genres"]}
+                for movie in movies[i:i + batch_size]
+            ]).consume()
+
+        pairs = [[username, movie_id] for username, movie_ids in likes.items() for movie_id in movie_ids]
+        for i in range(0, len(pairs), batch_size):
+            session.run("""
+            UNWIND $likes AS like
+            MERGE (u:User {username: like[0]})
+            WITH u, like
+            MATCH (m:Movie {id: like[1]})
+            MERGE (u)-[:LIKES]->(m)
+            """, likes=pairs[i:i + batch_size]).consume()
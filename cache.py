@@ -0,0 +1,840 @@
+import asyncio
+import functools
+import os
+import random
+import struct
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import msgpack
+
+from . import config
+from .clients import get_async_redis_client, get_redis_client
+from .fanout import TIMED_OUT, run_all
+from .metrics import CACHE_ERRORS, count_cache_lookup
+from .timing import record, timed
+
+# Background stale-while-revalidate refreshes
+_refresh_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="cache-refresh")
+
+# msgpack extension type carrying a datetime as microseconds since the epoch
+_DATETIME_EXT = 1
+_EPOCH = datetime(1970, 1, 1)
+_timedelta_micro = timedelta(microseconds=1)
+
+
+def _pack_default(obj):
+    if isinstance(obj, datetime):
+        # MongoDB returns naive UTC datetimes; aware ones are converted to naive UTC
+        if obj.tzinfo is not None:
+            obj = obj.astimezone(timezone.utc).replace(tzinfo=None)
+        micros = (obj - _EPOCH) // _timedelta_micro
+        return msgpack.ExtType(_DATETIME_EXT, struct.pack(">q", micros))
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+
+def _ext_hook(code, data):
+    if code == _DATETIME_EXT:
+        return _EPOCH + struct.unpack(">q", data)[0] * _timedelta_micro
+    return msgpack.ExtType(code, data)
+
+
+def dumps(value):
+    """Serialize a value to msgpack bytes (datetimes round-trip as datetimes)"""
+    return msgpack.packb(value, default=_pack_default, use_bin_type=True)
+
+
+def loads(raw):
+    """Deserialize bytes written by dumps()"""
+    return msgpack.unpackb(raw, ext_hook=_ext_hook, raw=False, strict_map_key=False)
+
+
+class LocalCache:
+    """
+    Bounded per-process LRU of raw cache entries.
+
+    Entries expire after max_ttl seconds and the least recently used ones are
+    evicted once either max_entries or max_bytes is exceeded. Raw bytes are
+    stored and decoded on every hit, so callers never share mutable objects.
+    """
+
+    def __init__(self, max_bytes, max_entries, max_ttl):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            raw, expires_at = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return raw
+
+    def set(self, key, raw, ttl):
+        """Store raw bytes for at most ttl seconds (capped at max_ttl)"""
+        if len(raw) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (raw, time.monotonic() + min(ttl, self.max_ttl))
+            self._bytes += len(raw)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+
+    def discard(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        raw, _ = self._entries.pop(key)
+        self._bytes -= len(raw)
+
+
+local_cache = LocalCache(config.LOCAL_CACHE_MAX_BYTES, config.LOCAL_CACHE_MAX_ENTRIES, config.LOCAL_CACHE_TTL)
+
+# Identifies this process on the invalidation channel so it skips its own messages
+_sender_id = uuid.uuid4().hex
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+def _listen_for_invalidations():
+    """Drop local copies of keys other workers have rewritten or deleted"""
+    while True:
+        try:
+            pubsub = get_redis_client().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(config.CACHE_INVALIDATION_CHANNEL)
+            # Messages may have been missed while disconnected
+            local_cache.clear()
+            for message in pubsub.listen():
+                sender, _, key = message["data"].decode().partition("|")
+                if sender != _sender_id:
+                    local_cache.discard(key)
+        except Exception as e:
+            print(f"Cache invalidation listener error: {e}")
+            time.sleep(1)
+
+
+def _ensure_listener():
+    """Start the invalidation listener once per process (again after a fork)"""
+    global _listener_pid, _sender_id
+    if _listener_pid == os.getpid():
+        return
+    with _listener_lock:
+        if _listener_pid != os.getpid():
+            _sender_id = uuid.uuid4().hex
+            threading.Thread(target=_listen_for_invalidations, name="cache-invalidation", daemon=True).start()
+            _listener_pid = os.getpid()
+
+
+def publish_invalidation(key, pipeline=None):
+    """Tell the other workers to drop their local copy of a key"""
+    (pipeline if pipeline is not None else get_redis_client()).publish(config.CACHE_INVALIDATION_CHANNEL, f"{_sender_id}|{key}")
+
+
+# A computed value may itself be None
+_NOT_COMPUTED = object()
+
+
+def _lock_name(key):
+    return f"lock:{key}"
+
+
+# Batch read in one round trip: the values of KEYS[1..n] and, for every missing
+# one, its lock KEYS[n + i] taken with SET NX PX (token ARGV[1], timeout
+# ARGV[i + 1] milliseconds). Returns {values, 1/0 claimed per key}.
+_READ_AND_CLAIM_SCRIPT = """
+local n = #KEYS / 2
+local values = redis.call('MGET', unpack(KEYS, 1, n))
+local claimed = {}
+for i = 1, n do
+    if values[i] then
+        claimed[i] = 0
+    elseif redis.call('SET', KEYS[n + i], ARGV[1], 'NX', 'PX', ARGV[i + 1]) then
+        claimed[i] = 1
+    else
+        claimed[i] = 0
+    end
+end
+return {values, claimed}
+"""
+
+# Deletes a lock only while it still holds the token it was claimed with
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def _read_and_claim_arguments(calls, token):
+    """EVAL arguments of _READ_AND_CLAIM_SCRIPT for (cached_function, key) calls"""
+    keys = [key for _, key in calls]
+    timeouts = [int(cached_function.lock_timeout * 1000) for cached_function, _ in calls]
+    return (_READ_AND_CLAIM_SCRIPT, 2 * len(keys), *keys, *map(_lock_name, keys), token, *timeouts)
+
+
+def _always(value):
+    return True
+
+
+class CachedFunction:
+    """
+    Two-tier read-through cache around one service function.
+
+    Reads go to the per-process LocalCache first and then to Redis. Values are
+    msgpack-encoded, so datetimes come back as datetimes. Every write or delete
+    is published on the invalidation channel so other workers drop their local
+    copies.
+
+    Entries are stored as {"value": ..., "fresh_until": timestamp}. Until
+    fresh_until the value is served as-is. After that it is served stale for
+    up to stale_ttl more seconds while one caller refreshes it in the
+    background. A missing key is recomputed by a single caller holding a Redis
+    lock; the others wait for its result instead of hitting the database
+    (single-flight).
+    """
+
+    def __init__(self, func, key, ttl=300, stale_ttl=60, jitter=0.1, lock_timeout=10, cache_if=_always,
+                 fallback=None, family=None):
+        """
+        Args:
+            func (callable): The function to cache
+            key (str or callable): Cache key, or a function building it from the call arguments
+            ttl (int): Seconds a value is served fresh
+            stale_ttl (int): Extra seconds a stale value may be served while refreshing
+            jitter (float): Random +/- fraction applied to ttl so keys do not expire together
+            lock_timeout (int): Seconds a recompute lock is held at most
+            cache_if (callable): Only results for which this returns True are stored
+            fallback (callable, optional): Builds the value used when a concurrent
+                lookup times out (see CacheBatch.prefetch); such values are not stored
+            family (str, optional): Key family the hit/miss metrics are counted under
+                (default: the key if it is a string, else the function name)
+        """
+        self.func = func
+        self.key_builder = key if callable(key) else (lambda *args, **kwargs: key)
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.jitter = jitter
+        self.lock_timeout = lock_timeout
+        self.cache_if = cache_if
+        self.fallback = fallback or (lambda: None)
+        self.family = family or (key if isinstance(key, str) else func.__name__)
+        functools.update_wrapper(self, func)
+
+    def key(self, *args, **kwargs):
+        """Cache key for a call"""
+        return self.key_builder(*args, **kwargs)
+
+    def __call__(self, *args, **kwargs):
+        return self.get_entry(*args, **kwargs)["value"]
+
+    def get_entry(self, *args, **kwargs):
+        """
+        Cache entry of a call: {"value", "fresh_until", "built_at"}, plus
+        "version" for feeds. Used by the JSON API to build ETags.
+        """
+        key = self.key(*args, **kwargs)
+
+        try:
+            entry = self._get(key)
+        except Exception as e:
+            print(f"Error reading cache key {key}: {e}")
+            CACHE_ERRORS.inc(operation="read")
+            return self._uncached_entry(args, kwargs)
+
+        count_cache_lookup(self.family, entry, time.time())
+        if entry is not None:
+            if entry["fresh_until"] < time.time():
+                self._revalidate(key, args, kwargs)
+            return entry
+
+        return self._compute_single_flight(key, args, kwargs)
+
+    def invalidate(self, *args, **kwargs):
+        """Delete the cached value for a call in Redis and in every worker"""
+        key = self.key(*args, **kwargs)
+        local_cache.discard(key)
+        pipeline = get_redis_client().pipeline(transaction=False)
+        pipeline.delete(key)
+        publish_invalidation(key, pipeline)
+        pipeline.execute()
+
+    def decode(self, key, raw):
+        """Entry dict from a raw Redis value, also kept in the local cache (None stays None)"""
+        if raw is None:
+            return None
+        try:
+            entry = loads(raw)
+        except Exception:
+            entry = None
+        # Values in an older format are treated as misses
+        if not isinstance(entry, dict) or "fresh_until" not in entry:
+            return None
+        local_cache.set(key, raw, entry["fresh_until"] + self.stale_ttl - time.time())
+        return entry
+
+    def make_entry(self, value):
+        """Entry dict and Redis TTL for a freshly computed value"""
+        ttl = self.ttl * (1 + random.uniform(-self.jitter, self.jitter))
+        now = time.time()
+        return {"value": value, "fresh_until": now + ttl, "built_at": now}, int(ttl + self.stale_ttl)
+
+    def store(self, key, value, pipeline=None):
+        """
+        Write a value if cache_if accepts it (optionally on a pipeline).
+
+        Returns:
+            dict: The stored entry, or None if the value is not cached
+        """
+        if not self.cache_if(value):
+            return None
+        entry, redis_ttl = self.make_entry(value)
+        raw = dumps(entry)
+        local_cache.set(key, raw, redis_ttl)
+
+        # The write and its invalidation message go out in one round trip
+        own_pipeline = pipeline is None
+        if own_pipeline:
+            pipeline = get_redis_client().pipeline(transaction=False)
+        pipeline.setex(key, redis_ttl, raw)
+        publish_invalidation(key, pipeline)
+        if own_pipeline:
+            pipeline.execute()
+        return entry
+
+    def _get(self, key):
+        _ensure_listener()
+        raw = local_cache.get(key)
+        if raw is not None:
+            return loads(raw)
+        return self.decode(key, get_redis_client().get(key))
+
+    def _lock(self, key):
+        # Not thread-local: a background refresh releases the lock from another thread
+        return get_redis_client().lock(
+            _lock_name(key), timeout=self.lock_timeout, blocking=False, thread_local=False
+        )
+
+    def _async_lock(self, key):
+        """The same lock as _lock, on redis.asyncio"""
+        return get_async_redis_client().lock(
+            _lock_name(key), timeout=self.lock_timeout, blocking=False, thread_local=False
+        )
+
+    def _uncached_entry(self, args, kwargs, value=_NOT_COMPUTED):
+        """Entry for a value computed without going through the cache"""
+        if value is _NOT_COMPUTED:
+            value = self.func(*args, **kwargs)
+        now = time.time()
+        return {"value": value, "fresh_until": now, "built_at": now}
+
+    def _compute_and_store(self, key, args, kwargs):
+        value = self.func(*args, **kwargs)
+        entry = None
+        try:
+            entry = self.store(key, value)
+        except Exception as e:
+            print(f"Error writing cache key {key}: {e}")
+            CACHE_ERRORS.inc(operation="write")
+        return entry or self._uncached_entry(args, kwargs, value)
+
+    def _compute_single_flight(self, key, args, kwargs):
+        """Compute a missing value, letting only one caller hit the backend"""
+        lock = self._lock(key)
+        try:
+            acquired = lock.acquire()
+        except Exception as e:
+            print(f"Error locking cache key {key}: {e}")
+            CACHE_ERRORS.inc(operation="lock")
+            return self._uncached_entry(args, kwargs)
+
+        if acquired:
+            try:
+                return self._compute_and_store(key, args, kwargs)
+            finally:
+                self._release(lock)
+
+        # Someone else is computing it: wait for their result
+        entry = self._wait_for_value(key)
+        if entry is not None:
+            return entry
+        return self._compute_and_store(key, args, kwargs)
+
+    def _wait_for_value(self, key):
+        """
+        Poll for the value another caller is computing under the key's lock.
+
+        Returns None as soon as the lock is free without a stored value (the
+        holder's result was rejected by cache_if, or it failed), on Redis
+        errors, and after lock_timeout, so the caller computes it itself.
+        """
+        lock = self._lock(key)
+        deadline = time.time() + self.lock_timeout
+        while time.time() < deadline:
+            time.sleep(0.05)
+            try:
+                entry = self._get(key)
+                if entry is not None:
+                    return entry
+                if not lock.locked():
+                    # Released between the two reads, or released without storing
+                    return self._get(key)
+            except Exception:
+                return None
+        return None
+
+    def _revalidate(self, key, args, kwargs):
+        """Refresh a stale value in the background if nobody else is already doing it"""
+        def refresh():
+            # The lock is taken in the background too, so serving a stale value costs no round trip
+            lock = self._lock(key)
+            try:
+                if not lock.acquire():
+                    return
+            except Exception:
+                return
+            try:
+                self._compute_and_store(key, args, kwargs)
+            except Exception as e:
+                print(f"Error refreshing cache key {key}: {e}")
+            finally:
+                self._release(lock)
+
+        _refresh_executor.submit(refresh)
+
+    @staticmethod
+    def _release(lock):
+        try:
+            lock.release()
+        except Exception:
+            # The lock expired or Redis is unavailable; the key is recomputed later
+            pass
+
+
+def cached(key, ttl=300, **options):
+    """
+    Decorator caching a function in Redis.
+
+    Example:
+        @cached(lambda movie_id: f"movie_details_{movie_id}", ttl=300)
+        def get_movie_details(movie_id): ...
+    """
+    def decorator(func):
+        return CachedFunction(func, key, ttl=ttl, **options)
+    return decorator
+
+
+class CacheBatch:
+    """
+    Batched cache access for one request.
+
+    Register every cached call a route needs with add(), then read them with
+    result(). Keys missing from the local cache are read with one script that
+    also takes the per-key lock of CachedFunction on every key Redis does not
+    have, and every recomputed miss is written back, and its lock released, in
+    a single pipeline on flush(): a page costs two Redis round trips. Misses
+    whose lock another caller holds wait for that caller's value. Stale values
+    are refreshed in the background.
+
+    Example:
+        with CacheBatch() as batch:
+            top = batch.add(get_top_rated_movies)
+            recent = batch.add(get_recent_released_movies)
+            top_rated_movies = batch.result(top)
+            recent_movies = batch.result(recent)
+    """
+
+    def __init__(self):
+        self._calls = []
+        self._entries = {}
+        self._fetched = False
+        self._pipeline = None
+        # Misses this batch computes itself, and the locks it holds for them
+        self._owned = set()
+        self._locks = []
+        self._token = uuid.uuid4().hex
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.flush()
+
+    def add(self, cached_function, *args, **kwargs):
+        """
+        Register a cached call and return a handle for result().
+
+        The arguments are used to build the key and, unless result() is given
+        other arguments, to compute the value on a miss.
+        """
+        self._calls.append((cached_function, cached_function.key(*args, **kwargs), args, kwargs))
+        return len(self._calls) - 1
+
+    def fetch(self):
+        """Read every registered key: local cache first, then one round trip for the rest"""
+        self._fetched = True
+        self._read()
+        now = time.time()
+        for handle, call in enumerate(self._calls):
+            count_cache_lookup(call[0].family, self._entries.get(handle), now)
+
+    def _read(self):
+        _ensure_listener()
+
+        remote = []
+        for handle, (cached_function, key, _, _) in enumerate(self._calls):
+            raw = local_cache.get(key)
+            if raw is not None:
+                self._entries[handle] = loads(raw)
+            else:
+                remote.append(handle)
+
+        if not remote:
+            return
+        try:
+            with timed("cache"):
+                raws, claimed = get_redis_client().eval(*_read_and_claim_arguments(
+                    [self._calls[handle][:2] for handle in remote], self._token
+                ))
+        except Exception as e:
+            print(f"Error reading cache keys: {e}")
+            CACHE_ERRORS.inc(operation="read")
+            # Computed without locks
+            self._owned.update(remote)
+            return
+        for handle, raw, was_claimed in zip(remote, raws, claimed):
+            cached_function, key, _, _ = self._calls[handle]
+            self._entries[handle] = cached_function.decode(key, raw)
+            if was_claimed:
+                self._owned.add(handle)
+                self._locks.append(_lock_name(key))
+            elif raw is not None and self._entries[handle] is None:
+                # A value in an older format: nobody is computing it
+                self._owned.add(handle)
+
+    def result(self, handle, *args, **kwargs):
+        """
+        Value of a registered call, computed (and queued for write-back) on a miss.
+
+        Pass args to compute with different arguments than the ones given to
+        add(), e.g. when part of them is only known after another result.
+        """
+        if not self._fetched:
+            self.fetch()
+
+        cached_function, key, add_args, add_kwargs = self._calls[handle]
+        if not args and not kwargs:
+            args, kwargs = add_args, add_kwargs
+
+        entry = self._entries.get(handle)
+        if entry is not None:
+            if entry["fresh_until"] < time.time():
+                cached_function._revalidate(key, args, kwargs)
+            return entry["value"]
+
+        if handle not in self._owned and self._wait(handle):
+            return self._entries[handle]["value"]
+        with timed(cached_function.__name__):
+            value = cached_function.func(*args, **kwargs)
+        self._set_computed(handle, value)
+        return value
+
+    def _wait(self, handle):
+        """Wait for the value another caller is computing; False if it was not stored"""
+        cached_function, key, _, _ = self._calls[handle]
+        entry = cached_function._wait_for_value(key)
+        if entry is None:
+            return False
+        self._entries[handle] = entry
+        return True
+
+    def set(self, handle, value):
+        """
+        Provide the value of a registered call computed by the caller, e.g. with
+        one batched query for several misses; it is written back on flush().
+        """
+        self._set_computed(handle, value)
+
+    def is_cached(self, handle):
+        """True if a registered call was found in the cache (or already computed)"""
+        if not self._fetched:
+            self.fetch()
+        return self._entries.get(handle) is not None
+
+    def prefetch(self, *calls):
+        """
+        Compute the missing values of several registered calls concurrently.
+
+        Each call is a handle, or a (handle, args) pair to compute with other
+        arguments than the ones given to add(). Cached calls are skipped. A call
+        that exceeds config.FANOUT_TIMEOUT gets its function's fallback value,
+        which is returned by result() but not written to the cache.
+        """
+        if not self._fetched:
+            self.fetch()
+
+        pending = []
+        for call in calls:
+            handle, args = call if isinstance(call, tuple) else (call, None)
+            if self._entries.get(handle) is not None:
+                continue
+            cached_function, _, add_args, add_kwargs = self._calls[handle]
+            pending.append((handle, cached_function, args if args is not None else add_args,
+                            add_kwargs if args is None else {}))
+
+        owned = [call for call in pending if call[0] in self._owned]
+        locked = [call for call in pending if call[0] not in self._owned]
+        self._compute_all(owned)
+        # Values other callers were computing, or computed here if they did not store one
+        self._compute_all([call for call in locked if not self._wait(call[0])])
+
+    def _compute_all(self, pending):
+        """Compute (handle, cached_function, args, kwargs) calls concurrently"""
+        if not pending:
+            return
+        results = run_all([(cached_function.func, args, kwargs) for _, cached_function, args, kwargs in pending])
+        for (handle, cached_function, _, _), (value, seconds) in zip(pending, results):
+            record(cached_function.__name__, seconds)
+            if value is TIMED_OUT:
+                print(f"Timed out computing {cached_function.__name__}")
+                self._entries[handle] = {"value": cached_function.fallback(), "fresh_until": float("inf")}
+            else:
+                self._set_computed(handle, value)
+
+    def _set_computed(self, handle, value):
+        """Keep a computed value for result() and queue it for write-back"""
+        cached_function, key, _, _ = self._calls[handle]
+        if self._pipeline is None:
+            self._pipeline = get_redis_client().pipeline(transaction=False)
+        cached_function.store(key, value, self._pipeline)
+        self._entries[handle] = {"value": value, "fresh_until": float("inf")}
+
+    def flush(self):
+        """Write every recomputed miss and release the batch's locks in one pipeline"""
+        pipeline, self._pipeline = self._pipeline, None
+        locks, self._locks = self._locks, []
+        if pipeline is None and not locks:
+            return
+        if pipeline is None:
+            pipeline = get_redis_client().pipeline(transaction=False)
+        # After the writes, so waiters find the value once the lock is gone
+        for name in locks:
+            pipeline.eval(_RELEASE_SCRIPT, 1, name, self._token)
+        try:
+            with timed("cache"):
+                pipeline.execute()
+        except Exception as e:
+            # Unreleased locks expire after lock_timeout
+            print(f"Error writing cache keys: {e}")
+            CACHE_ERRORS.inc(operation="write")
+
+
+class AsyncCacheBatch:
+    """
+    CacheBatch for asgi_app: same keys, codec and local cache, on redis.asyncio.
+
+    Each call is registered with the CachedFunction that defines its key and
+    the async function that computes it (see async_service.py). Misses are
+    computed concurrently with asyncio instead of the thread pool, behind the
+    same per-key locks and in the same two round trips.
+    """
+
+    def __init__(self):
+        self._calls = []
+        self._entries = {}
+        self._fetched = False
+        self._pipeline = None
+        self._owned = set()
+        self._locks = []
+        self._token = uuid.uuid4().hex
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.flush()
+
+    def add(self, cached_function, async_func, *args, **kwargs):
+        """Register a call and return a handle for result()"""
+        self._calls.append((cached_function, async_func, cached_function.key(*args, **kwargs), args, kwargs))
+        return len(self._calls) - 1
+
+    async def fetch(self):
+        """Read every registered key: local cache first, then one round trip for the rest"""
+        self._fetched = True
+        await self._read()
+        now = time.time()
+        for handle, call in enumerate(self._calls):
+            count_cache_lookup(call[0].family, self._entries.get(handle), now)
+
+    async def _read(self):
+        _ensure_listener()
+
+        remote = []
+        for handle, (_, _, key, _, _) in enumerate(self._calls):
+            raw = local_cache.get(key)
+            if raw is not None:
+                self._entries[handle] = loads(raw)
+            else:
+                remote.append(handle)
+
+        if not remote:
+            return
+        try:
+            raws, claimed = await get_async_redis_client().eval(*_read_and_claim_arguments(
+                [(self._calls[handle][0], self._calls[handle][2]) for handle in remote], self._token
+            ))
+        except Exception as e:
+            print(f"Error reading cache keys: {e}")
+            CACHE_ERRORS.inc(operation="read")
+            self._owned.update(remote)
+            return
+        for handle, raw, was_claimed in zip(remote, raws, claimed):
+            cached_function, _, key, _, _ = self._calls[handle]
+            self._entries[handle] = cached_function.decode(key, raw)
+            if was_claimed:
+                self._owned.add(handle)
+                self._locks.append(_lock_name(key))
+            elif raw is not None and self._entries[handle] is None:
+                self._owned.add(handle)
+
+    async def is_cached(self, handle):
+        if not self._fetched:
+            await self.fetch()
+        return self._entries.get(handle) is not None
+
+    async def prefetch(self, *calls):
+        """Compute the missing values of several calls concurrently (see CacheBatch.prefetch)"""
+        if not self._fetched:
+            await self.fetch()
+
+        pending = []
+        for call in calls:
+            handle, args = call if isinstance(call, tuple) else (call, None)
+            if self._entries.get(handle) is not None:
+                continue
+            _, async_func, _, add_args, add_kwargs = self._calls[handle]
+            if args is None:
+                args, kwargs = add_args, add_kwargs
+            else:
+                kwargs = {}
+            pending.append((handle, async_func, args, kwargs))
+
+        waiting = [call for call in pending if call[0] not in self._owned]
+        stored = await asyncio.gather(*(self._wait(call[0]) for call in waiting))
+        await self._compute_all(
+            [call for call in pending if call[0] in self._owned]
+            + [call for call, found in zip(waiting, stored) if not found]
+        )
+
+    async def _compute_all(self, pending):
+        """Compute (handle, async_func, args, kwargs) calls concurrently"""
+        if not pending:
+            return
+        results = await asyncio.gather(*(
+            asyncio.wait_for(async_func(*args, **kwargs), config.FANOUT_TIMEOUT)
+            for _, async_func, args, kwargs in pending
+        ), return_exceptions=True)
+        for (handle, _, _, _), value in zip(pending, results):
+            cached_function = self._calls[handle][0]
+            if isinstance(value, asyncio.TimeoutError):
+                print(f"Timed out computing {cached_function.__name__}")
+                self._entries[handle] = {"value": cached_function.fallback(), "fresh_until": float("inf")}
+            elif isinstance(value, BaseException):
+                raise value
+            else:
+                self._set_computed(handle, value)
+
+    async def result(self, handle, *args, **kwargs):
+        """Value of a registered call, computed (and queued for write-back) on a miss"""
+        if not self._fetched:
+            await self.fetch()
+
+        cached_function, async_func, key, add_args, add_kwargs = self._calls[handle]
+        if not args and not kwargs:
+            args, kwargs = add_args, add_kwargs
+
+        entry = self._entries.get(handle)
+        if entry is not None:
+            if entry["fresh_until"] < time.time():
+                # Refreshed by the sync function on the background thread pool
+                cached_function._revalidate(key, args, kwargs)
+            return entry["value"]
+
+        if handle not in self._owned and await self._wait(handle):
+            return self._entries[handle]["value"]
+        value = await async_func(*args, **kwargs)
+        self._set_computed(handle, value)
+        return value
+
+    async def _wait(self, handle):
+        """Wait for the value another caller is computing (see CachedFunction._wait_for_value)"""
+        cached_function, _, key, _, _ = self._calls[handle]
+        lock = cached_function._async_lock(key)
+        deadline = time.time() + cached_function.lock_timeout
+        try:
+            while time.time() < deadline:
+                await asyncio.sleep(0.05)
+                entry = await self._get(cached_function, key)
+                if entry is None and not await lock.locked():
+                    # Released between the two reads, or released without storing
+                    entry = await self._get(cached_function, key)
+                    if entry is None:
+                        return False
+                if entry is not None:
+                    self._entries[handle] = entry
+                    return True
+        except Exception:
+            return False
+        return False
+
+    @staticmethod
+    async def _get(cached_function, key):
+        raw = local_cache.get(key)
+        if raw is not None:
+            return loads(raw)
+        return cached_function.decode(key, await get_async_redis_client().get(key))
+
+    def _set_computed(self, handle, value):
+        cached_function, _, key, _, _ = self._calls[handle]
+        if self._pipeline is None:
+            self._pipeline = get_async_redis_client().pipeline(transaction=False)
+        cached_function.store(key, value, self._pipeline)
+        self._entries[handle] = {"value": value, "fresh_until": float("inf")}
+
+    async def flush(self):
+        """Write every recomputed miss and release the batch's locks in one pipeline"""
+        pipeline, self._pipeline = self._pipeline, None
+        locks, self._locks = self._locks, []
+        if pipeline is None and not locks:
+            return
+        if pipeline is None:
+            pipeline = get_async_redis_client().pipeline(transaction=False)
+        for name in locks:
+            pipeline.eval(_RELEASE_SCRIPT, 1, name, self._token)
+        try:
+            await pipeline.execute()
+        except Exception as e:
+            print(f"Error writing cache keys: {e}")
+            CACHE_ERRORS.inc(operation="write")
@@ -0,0 +1,72 @@
+from . import service
+from .cache import CacheBatch, cached
+from .feeds import feed
+
+# Cached versions of the service functions used by the Flask routes.
+# Keys keep the names the routes used before the caching layer existed.
+
+# The fallbacks match what each function returns when its backend fails.
+
+# Global lists are precomputed by feeds.FeedRefresher; requests only read them.
+# An empty list is what a failed refresh returns, so it never replaces a snapshot.
+get_top_rated_movies = feed("top_rated_movies", fallback=list, cache_if=bool)(service.get_top_rated_movies)
+
+get_recent_released_movies = feed("recent_movies", fallback=list, cache_if=bool)(service.get_recent_released_movies)
+
+get_top_rated_movies_by_genre = feed(
+    lambda genre: f"top_rated_movies_{genre}", fallback=list, cache_if=bool, family="top_rated_movies_by_genre",
+    arguments=lambda: [(genre,) for genre in service.get_genres()]
+)(service.get_top_rated_movies_by_genre)
+
+# Everything the refresher recomputes
+FEEDS = [get_top_rated_movies, get_recent_released_movies, get_top_rated_movies_by_genre]
+
+get_recommendations_for_me = cached(
+    lambda username: f"recommendations_{username}", ttl=300, fallback=list, family="recommendations"
+)(service.get_recommendations_for_me)
+
+get_movie_details = cached(
+    lambda movie_id: f"movie_details_{movie_id}", ttl=300, family="movie_details",
+    # Unknown movies are not cached, as before
+    cache_if=lambda movie: movie is not None
+)(service.get_movie_details)
+
+get_movie_likes = cached(
+    lambda username, movie_id: f"likes_{username}_{movie_id}", ttl=300, fallback=list, family="likes"
+)(service.get_movie_likes)
+
+get_similar_movies = cached(
+    lambda movie_id, genres: f"similar_movies_{movie_id}", ttl=300, fallback=list, family="similar_movies"
+)(service.get_similar_movies)
+
+get_also_liked_movies = cached(
+    lambda movie_id: f"also_liked_{movie_id}", ttl=300, fallback=list, family="also_liked"
+)(service.get_also_liked_movies)
+
+get_movie_card = cached(
+    lambda movie_id: f"movie_card_{movie_id}", ttl=300, family="movie_card",
+    cache_if=lambda card: card is not None
+)(service.get_movie_card)
+
+
+def get_movie_cards(movie_ids):
+    """
+    Cached service.get_movie_cards: hits come from one MGET, the misses from
+    one $in query, and the misses are written back in one pipeline.
+    """
+    with CacheBatch() as batch:
+        handles = [batch.add(get_movie_card, movie_id) for movie_id in movie_ids]
+        missing = [movie_id for movie_id, handle in zip(movie_ids, handles) if not batch.is_cached(handle)]
+
+        if missing:
+            found = {card["_id"]: card for card in service.get_movie_cards(missing)}
+            for movie_id, handle in zip(movie_ids, handles):
+                if not batch.is_cached(handle):
+                    batch.set(handle, found.get(movie_id))
+
+        cards = [batch.result(handle) for handle in handles]
+    return [card for card in cards if card is not None]
+
+
+# Search stays uncached
+search_movie = service.search_movie
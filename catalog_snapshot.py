@@ -0,0 +1,319 @@
+import argparse
+import datetime
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+from . import config
+from .genre_index import popcount
+
+MAGIC = b"MOVSNAP1"
+# Magic, then the length of the JSON header
+_PREAMBLE = struct.Struct("<8sQ")
+# Arrays start on cache-line boundaries
+_ALIGNMENT = 64
+_EPOCH = datetime.datetime(1970, 1, 1)
+# release_date of movies without one
+NO_DATE = np.iinfo(np.int64).min
+_INT64 = np.iinfo(np.int64)
+
+STRING_FIELDS = ("title", "poster_path", "tagline", "overview")
+
+# Same thresholds as the service queries
+TOP_RATED_MIN_VOTES = 5000
+RECENT_MIN_VOTES = 50
+RECENT_DAYS = 720
+SIMILAR_MIN_VOTES = 500
+
+
+def _to_seconds(value):
+    if value is None:
+        return NO_DATE
+    return int((value - _EPOCH).total_seconds())
+
+
+def _to_datetime(seconds):
+    return None if seconds == NO_DATE else _EPOCH + datetime.timedelta(seconds=int(seconds))
+
+
+def write_snapshot(movies, path):
+    """
+    Write movie documents to a columnar snapshot file and publish it atomically.
+
+    Layout: magic, header length, a JSON header (version, genres, and the
+    offset/dtype/length of every column), then the columns, each aligned to 64
+    bytes. Fixed-width columns hold one value per movie, sorted by _id; every
+    string field is a uint64 offsets column plus a UTF-8 blob. Genre lists are
+    stored the same way, as offsets plus codes into the header's genres, so
+    they keep their document order; genre_mask is the set used for filtering.
+
+    Returns:
+        dict: The header
+    """
+    movies = sorted(movies, key=lambda movie: movie["_id"])
+    genres = sorted({genre for movie in movies for genre in movie.get("genres") or []})
+    if len(genres) > 64:
+        raise ValueError(f"The snapshot supports at most 64 genres, found {len(genres)}")
+    genre_bits = {genre: 1 << bit for bit, genre in enumerate(genres)}
+    genre_code = {genre: code for code, genre in enumerate(genres)}
+    genre_codes = [[genre_code[genre] for genre in movie.get("genres") or []] for movie in movies]
+
+    columns = {
+        "id": np.array([movie["_id"] for movie in movies], dtype=np.int64),
+        "vote_average": np.array([movie.get("vote_average", 0) for movie in movies], dtype=np.float64),
+        "vote_count": np.array([movie.get("vote_count", 0) for movie in movies], dtype=np.int64),
+        "release_date": np.array([_to_seconds(movie.get("release_date")) for movie in movies], dtype=np.int64),
+        "genre_mask": np.array([
+            sum(genre_bits[genre] for genre in set(movie.get("genres") or [])) for movie in movies
+        ], dtype=np.uint64),
+        "genre_offsets": np.concatenate([[0], np.cumsum([len(codes) for codes in genre_codes])]).astype(np.uint64),
+        "genre_codes": np.array([code for codes in genre_codes for code in codes], dtype=np.uint8),
+    }
+    for field in STRING_FIELDS:
+        encoded = [(movie.get(field) or "").encode() for movie in movies]
+        columns[f"{field}_offsets"] = np.concatenate([[0], np.cumsum([len(value) for value in encoded])]).astype(np.uint64)
+        columns[f"{field}_blob"] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+    header = {"version": int(time.time() * 1000), "count": len(movies), "genres": genres, "columns": {}}
+    # Offsets are relative to the end of the header, so they do not depend on its length
+    offset = 0
+    for name, column in columns.items():
+        header["columns"][name] = {"dtype": column.dtype.str, "offset": offset, "length": len(column)}
+        offset += -(-column.nbytes // _ALIGNMENT) * _ALIGNMENT
+    encoded_header = json.dumps(header).encode()
+    data_start = -(-(_PREAMBLE.size + len(encoded_header)) // _ALIGNMENT) * _ALIGNMENT
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREAMBLE.pack(MAGIC, len(encoded_header)))
+        f.write(encoded_header)
+        for name, column in columns.items():
+            f.seek(data_start + header["columns"][name]["offset"])
+            f.write(column.tobytes())
+        f.truncate(data_start + offset)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return header
+
+
+class CatalogSnapshot:
+    """
+    Read-only, memory-mapped view of a snapshot file.
+
+    Columns are numpy arrays over the mapping, so pre-forked workers that open
+    the same file share its pages through the page cache. The id column is
+    sorted and serves as the id -> row index (one binary search per lookup,
+    vectorized for batches). Results returned here match the shapes of the
+    service.py functions they stand in for.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, header_length = _PREAMBLE.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a catalog snapshot")
+        self.header = json.loads(self._mmap[_PREAMBLE.size:_PREAMBLE.size + header_length])
+        data_start = -(-(_PREAMBLE.size + header_length) // _ALIGNMENT) * _ALIGNMENT
+
+        self.columns = {
+            name: np.frombuffer(self._mmap, dtype=np.dtype(spec["dtype"]), count=spec["length"],
+                                offset=data_start + spec["offset"])
+            for name, spec in self.header["columns"].items()
+        }
+        self.version = self.header["version"]
+        self.ids = self.columns["id"]
+        self.genre_bits = {genre: 1 << bit for bit, genre in enumerate(self.header["genres"])}
+        self._lists = {}
+        self._lists_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rows(self, movie_ids):
+        """Row of every movie id, -1 for ids not in the snapshot (including ids outside int64)"""
+        try:
+            movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        except OverflowError:
+            in_range = np.array([_INT64.min <= int(movie_id) <= _INT64.max for movie_id in movie_ids], dtype=bool)
+            rows = np.full(len(in_range), -1)
+            rows[in_range] = self.rows([movie_id for movie_id, ok in zip(movie_ids, in_range) if ok])
+            return rows
+        if len(self.ids) == 0:
+            return np.full(len(movie_ids), -1)
+        rows = np.minimum(np.searchsorted(self.ids, movie_ids), len(self.ids) - 1)
+        return np.where(self.ids[rows] == movie_ids, rows, -1)
+
+    def _string(self, field, row):
+        offsets = self.columns[f"{field}_offsets"]
+        return self.columns[f"{field}_blob"][int(offsets[row]):int(offsets[row + 1])].tobytes().decode()
+
+    def _genres(self, row):
+        offsets = self.columns["genre_offsets"]
+        codes = self.columns["genre_codes"][int(offsets[row]):int(offsets[row + 1])]
+        return [self.header["genres"][code] for code in codes.tolist()]
+
+    def card(self, row):
+        """service.movie_card of a row"""
+        return {
+            "_id": int(self.ids[row]),
+            "poster_path": self._string("poster_path", row),
+            "release_date": _to_datetime(self.columns["release_date"][row]),
+            "title": self._string("title", row),
+            "vote_average": float(self.columns["vote_average"][row]),
+            "vote_count": int(self.columns["vote_count"][row])
+        }
+
+    def details(self, movie_id):
+        """service.movie_details_doc of a movie, or None if it is not in the snapshot"""
+        row = int(self.rows([movie_id])[0])
+        # Snapshots exported before genre lists were stored only have the masks
+        if row < 0 or "genre_codes" not in self.columns:
+            return None
+        details = self.card(row)
+        details.update({
+            "genres": self._genres(row),
+            "overview": self._string("overview", row),
+            "tagline": self._string("tagline", row),
+        })
+        return details
+
+    def cards(self, movie_ids):
+        """{movie_id: card} of the ids found in the snapshot"""
+        return {
+            int(movie_id): self.card(int(row))
+            for movie_id, row in zip(movie_ids, self.rows(movie_ids)) if row >= 0
+        }
+
+    def _ranked(self, key, compute):
+        # The snapshot never changes, so a list is computed once per key
+        with self._lists_lock:
+            if key not in self._lists:
+                self._lists[key] = compute()
+            return list(self._lists[key])
+
+    def top_rated(self, limit=25, min_votes=TOP_RATED_MIN_VOTES, genre=None):
+        """Movies with more than min_votes votes (optionally of one genre), best vote_average first"""
+        def compute():
+            mask = self.columns["vote_count"] > min_votes
+            if genre is not None:
+                mask &= (self.columns["genre_mask"] & np.uint64(self.genre_bits.get(genre, 0))) != 0
+            rows = np.flatnonzero(mask)
+            order = np.lexsort((self.ids[rows], -self.columns["vote_average"][rows]))
+            return [self.card(int(row)) for row in rows[order][:limit]]
+        return self._ranked(("top_rated", limit, min_votes, genre), compute)
+
+    def recent(self, current_date, limit=25):
+        """Movies with at least 50 votes released in the 720 days up to current_date, newest first"""
+        def compute():
+            end = _to_seconds(current_date)
+            start = _to_seconds(current_date - datetime.timedelta(days=RECENT_DAYS))
+            released = self.columns["release_date"]
+            rows = np.flatnonzero(
+                (self.columns["vote_count"] >= RECENT_MIN_VOTES) & (released >= start) & (released <= end)
+            )
+            order = np.lexsort((self.ids[rows], -released[rows]))
+            return [self.card(int(row)) for row in rows[order][:limit]]
+        return self._ranked(("recent", current_date, limit), compute)
+
+    def similar(self, movie_id, genres, limit=10):
+        """Movies sharing the most genres, then best vote_average (same order as get_similar_movies)"""
+        query = np.uint64(sum(self.genre_bits.get(genre, 0) for genre in set(genres or [])))
+        matches = popcount(self.columns["genre_mask"] & query).astype(np.int64)
+        matches[(self.ids == movie_id) | (self.columns["vote_count"] < SIMILAR_MIN_VOTES)] = 0
+
+        rows = np.flatnonzero(matches > 0)
+        order = np.lexsort((self.ids[rows], -self.columns["vote_average"][rows], -matches[rows]))
+        result = []
+        for row in rows[order][:limit]:
+            card = self.card(int(row))
+            card["genres"] = int(matches[row])  # Number of matching genres
+            result.append(card)
+        return result
+
+
+def _file_identity(path):
+    """Inode and modification time of a file, or None if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+class SnapshotReloader:
+    """
+    The current snapshot of a path, swapped when a new file is published.
+
+    write_snapshot replaces the file with a rename, so the old mapping stays
+    valid for requests still using it while new requests get the new file.
+    The path is checked at most every check_interval seconds. Other read-only
+    files published with a rename are served the same way by passing their
+    loader, e.g. item_similarity.CoLikeTable.load.
+    """
+
+    def __init__(self, path=None, check_interval=None, load=CatalogSnapshot):
+        self.path = path or config.CATALOG_SNAPSHOT_PATH
+        self.check_interval = check_interval if check_interval is not None else config.CATALOG_SNAPSHOT_CHECK_INTERVAL
+        self.load = load
+        self._lock = threading.Lock()
+        # Taken before opening: a file published in between is picked up by the next check
+        self._identity = _file_identity(self.path)
+        self._snapshot = load(self.path)
+        self._checked_at = time.monotonic()
+
+    def get(self):
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            with self._lock:
+                if time.monotonic() - self._checked_at >= self.check_interval:
+                    self._checked_at = time.monotonic()
+                    identity = _file_identity(self.path)
+                    if identity is not None and identity != self._identity:
+                        try:
+                            self._snapshot = self.load(self.path)
+                            self._identity = identity
+                        except Exception as e:
+                            print(f"Error reloading {self.path}: {e}")
+        return self._snapshot
+
+
+# Fields written to the snapshot
+EXPORT_PROJECTION = {
+    "_id": 1, "title": 1, "genres": 1, "overview": 1, "poster_path": 1,
+    "release_date": 1, "tagline": 1, "vote_average": 1, "vote_count": 1
+}
+
+
+def export(path=None):
+    """Write the movies collection to a new snapshot at path"""
+    from .clients import get_movies_collection
+
+    movies = get_movies_collection().find({}, EXPORT_PROJECTION, batch_size=10000)
+    return write_snapshot(movies, path or config.CATALOG_SNAPSHOT_PATH)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the movie catalog to a memory-mappable snapshot")
+    parser.add_argument("--path", default=config.CATALOG_SNAPSHOT_PATH)
+    args = parser.parse_args()
+
+    from .clients import close_all
+
+    try:
+        start = time.perf_counter()
+        header = export(args.path)
+        print(f"Wrote {header['count']} movies (version {header['version']}) to {args.path} "
+              f"in {time.perf_counter() - start:.1f}s ({os.path.getsize(args.path) / 1e6:.1f} MB)")
+    finally:
+        close_all()
+
+
+if __name__ == "__main__":
+    main()
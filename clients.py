@@ -0,0 +1,206 @@
+import atexit
+import os
+import threading
+
+import redis
+import redis.asyncio
+from neo4j import AsyncGraphDatabase, GraphDatabase
+from pymongo import AsyncMongoClient, MongoClient
+
+from . import config
+from .metrics import mongo_pool_listener
+from .slowlog import slow_query_listener
+
+# One set of pooled clients per process, created on first use.
+# After a fork (gunicorn/uwsgi pre-forking) the child drops the references it
+# inherited and lazily opens its own pools; sockets are never shared between
+# processes and the parent's clients are left untouched.
+
+_lock = threading.Lock()
+_pid = os.getpid()
+_mongo_client = None
+_neo4j_driver = None
+_redis_client = None
+
+# Async clients used by asgi_app; they belong to the event loop of the process
+_async_mongo_client = None
+_async_neo4j_driver = None
+_async_redis_client = None
+
+
+def _check_pid():
+    """Forget clients inherited from a parent process"""
+    global _pid, _mongo_client, _neo4j_driver, _redis_client
+    global _async_mongo_client, _async_neo4j_driver, _async_redis_client
+    if _pid != os.getpid():
+        _pid = os.getpid()
+        _mongo_client = None
+        _neo4j_driver = None
+        _redis_client = None
+        _async_mongo_client = None
+        _async_neo4j_driver = None
+        _async_redis_client = None
+
+
+def _mongo_listeners():
+    listeners = [mongo_pool_listener]
+    if config.SLOWLOG_ENABLED:
+        listeners.append(slow_query_listener)
+    return listeners
+
+
+def get_mongo_client():
+    """Shared MongoClient for this process"""
+    global _mongo_client
+    _check_pid()
+    if _mongo_client is None:
+        with _lock:
+            if _mongo_client is None:
+                _mongo_client = MongoClient(
+                    config.MONGO_URI,
+                    maxPoolSize=config.MONGO_MAX_POOL_SIZE,
+                    minPoolSize=config.MONGO_MIN_POOL_SIZE,
+                    event_listeners=_mongo_listeners(),
+                    connect=False
+                )
+    return _mongo_client
+
+
+def get_db():
+    """The website database"""
+    return get_mongo_client()[config.MONGO_DB]
+
+
+def get_movies_collection():
+    """The movies collection"""
+    return get_db().movies
+
+
+def get_neo4j_driver():
+    """Shared Neo4j driver (connection pool) for this process"""
+    global _neo4j_driver
+    _check_pid()
+    if _neo4j_driver is None:
+        with _lock:
+            if _neo4j_driver is None:
+                _neo4j_driver = GraphDatabase.driver(
+                    config.NEO4J_URI,
+                    auth=(config.NEO4J_USER, config.NEO4J_PASSWORD),
+                    max_connection_pool_size=config.NEO4J_MAX_POOL_SIZE
+                )
+    return _neo4j_driver
+
+
+def get_redis_client():
+    """Shared Redis client (connection pool) for this process"""
+    global _redis_client
+    _check_pid()
+    if _redis_client is None:
+        with _lock:
+            if _redis_client is None:
+                pool = redis.ConnectionPool(
+                    host=config.REDIS_HOST,
+                    port=config.REDIS_PORT,
+                    db=config.REDIS_DB,
+                    max_connections=config.REDIS_MAX_CONNECTIONS
+                )
+                _redis_client = redis.Redis(connection_pool=pool)
+    return _redis_client
+
+
+def get_async_mongo_client():
+    """Shared AsyncMongoClient for this process"""
+    global _async_mongo_client
+    _check_pid()
+    if _async_mongo_client is None:
+        _async_mongo_client = AsyncMongoClient(
+            config.MONGO_URI,
+            maxPoolSize=config.MONGO_MAX_POOL_SIZE,
+            minPoolSize=config.MONGO_MIN_POOL_SIZE,
+            event_listeners=_mongo_listeners()
+        )
+    return _async_mongo_client
+
+
+def get_async_db():
+    """The website database (async client)"""
+    return get_async_mongo_client()[config.MONGO_DB]
+
+
+def get_async_movies_collection():
+    """The movies collection (async client)"""
+    return get_async_db().movies
+
+
+def get_async_neo4j_driver():
+    """Shared async Neo4j driver for this process"""
+    global _async_neo4j_driver
+    _check_pid()
+    if _async_neo4j_driver is None:
+        _async_neo4j_driver = AsyncGraphDatabase.driver(
+            config.NEO4J_URI,
+            auth=(config.NEO4J_USER, config.NEO4J_PASSWORD),
+            max_connection_pool_size=config.NEO4J_MAX_POOL_SIZE
+        )
+    return _async_neo4j_driver
+
+
+def get_async_redis_client():
+    """Shared async Redis client for this process"""
+    global _async_redis_client
+    _check_pid()
+    if _async_redis_client is None:
+        pool = redis.asyncio.ConnectionPool(
+            host=config.REDIS_HOST,
+            port=config.REDIS_PORT,
+            db=config.REDIS_DB,
+            max_connections=config.REDIS_MAX_CONNECTIONS
+        )
+        _async_redis_client = redis.asyncio.Redis(connection_pool=pool)
+    return _async_redis_client
+
+
+async def close_all_async():
+    """Close the async clients opened by this process (call from the event loop)"""
+    global _async_mongo_client, _async_neo4j_driver, _async_redis_client
+    if _pid != os.getpid():
+        return
+    if _async_mongo_client is not None:
+        await _async_mongo_client.close()
+        _async_mongo_client = None
+    if _async_neo4j_driver is not None:
+        await _async_neo4j_driver.close()
+        _async_neo4j_driver = None
+    if _async_redis_client is not None:
+        await _async_redis_client.aclose()
+        _async_redis_client = None
+
+
+def close_all():
+    """Close every client opened by this process"""
+    global _mongo_client, _neo4j_driver, _redis_client
+    if _pid != os.getpid():
+        return
+    with _lock:
+        if _mongo_client is not None:
+            _mongo_client.close()
+            _mongo_client = None
+        if _neo4j_driver is not None:
+            _neo4j_driver.close()
+            _neo4j_driver = None
+        if _redis_client is not None:
+            _redis_client.close()
+            _redis_client.connection_pool.disconnect()
+            _redis_client = None
+
+
+def _after_fork():
+    global _lock
+    # The parent may have forked while another thread held the lock
+    _lock = threading.Lock()
+    _check_pid()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+atexit.register(close_all)
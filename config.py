@@ -0,0 +1,122 @@
+import os
+
+# Connection settings, overridable through environment variables
+
+# MongoDB
+MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017")
+MONGO_DB = os.environ.get("MONGO_DB", "websitedb")
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", 50))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", 0))
+
+# Neo4j
+NEO4J_URI = os.environ.get("NEO4J_URI", "bolt://localhost:7687")
+NEO4J_USER = os.environ.get("NEO4J_USER", "neo4j")
+NEO4J_PASSWORD = os.environ.get("NEO4J_PASSWORD", "password")
+NEO4J_MAX_POOL_SIZE = int(os.environ.get("NEO4J_MAX_POOL_SIZE", 50))
+
+# Redis
+REDIS_HOST = os.environ.get("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.environ.get("REDIS_PORT", 6379))
+REDIS_DB = int(os.environ.get("REDIS_DB", 0))
+REDIS_MAX_CONNECTIONS = int(os.environ.get("REDIS_MAX_CONNECTIONS", 50))
+
+# Per-process cache in front of Redis (cache.LocalCache)
+LOCAL_CACHE_MAX_BYTES = int(os.environ.get("LOCAL_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+LOCAL_CACHE_MAX_ENTRIES = int(os.environ.get("LOCAL_CACHE_MAX_ENTRIES", 10000))
+# Upper bound on how long a local copy is kept, in case an invalidation message is lost
+LOCAL_CACHE_TTL = float(os.environ.get("LOCAL_CACHE_TTL", 60))
+CACHE_INVALIDATION_CHANNEL = os.environ.get("CACHE_INVALIDATION_CHANNEL", "cache-invalidate")
+
+# Precomputed global feeds (feeds.py): seconds between refreshes, and how long the
+# last snapshot is still served if the refresher stops
+FEED_REFRESH_INTERVAL = int(os.environ.get("FEED_REFRESH_INTERVAL", 60))
+FEED_STALE_TTL = int(os.environ.get("FEED_STALE_TTL", 3600))
+
+# Concurrent backend lookups in the routes (fanout.py)
+FANOUT_ENABLED = os.environ.get("FANOUT_ENABLED", "1") == "1"
+FANOUT_MAX_WORKERS = int(os.environ.get("FANOUT_MAX_WORKERS", 16))
+# Seconds a single lookup may take before the route renders without it
+FANOUT_TIMEOUT = float(os.environ.get("FANOUT_TIMEOUT", 5))
+
+# MinHash signature length and LSH bands for approximate similar users (minhash.py);
+# bands must divide the signature length. A pair with Jaccard index s becomes a
+# candidate with probability 1 - (1 - s^rows)^bands, rows = num_perm / bands: an
+# S-curve that rises around s = (1 / bands)^(1 / rows). Top neighbours of users
+# with about 10 likes sit around s = 0.1-0.3, so 2 rows per band (threshold about
+# 0.09 at 128 bands) keep most of them; more rows cut candidates but lose them,
+# and 1 row per band admits anyone sharing a single min-hash. Recall@3,
+# candidates and p50 on 100k synthetic users (benchmarks/minhash_bench.py; the
+# exact search takes 10 ms):
+#     192/64: 0.15, 18, 0.9 ms    256/128: 0.90, 558, 2.0 ms
+#     512/256: 0.98, 895, 3.2 ms  128/128: 1.00, 1808, 3.2 ms
+MINHASH_NUM_PERM = int(os.environ.get("MINHASH_NUM_PERM", 256))
+MINHASH_BANDS = int(os.environ.get("MINHASH_BANDS", 128))
+
+# "Also liked" co-like table (item_similarity.py): file, neighbours kept per movie,
+# normalization (cosine or lift), fewest users a pair needs in common, and how
+# often each worker checks whether a new table was written
+ALSO_LIKED_PATH = os.environ.get("ALSO_LIKED_PATH", "also_liked.npy")
+ALSO_LIKED_TOP_N = int(os.environ.get("ALSO_LIKED_TOP_N", 20))
+ALSO_LIKED_NORMALIZATION = os.environ.get("ALSO_LIKED_NORMALIZATION", "cosine")
+ALSO_LIKED_MIN_CO_LIKES = int(os.environ.get("ALSO_LIKED_MIN_CO_LIKES", 2))
+ALSO_LIKED_CHECK_INTERVAL = float(os.environ.get("ALSO_LIKED_CHECK_INTERVAL", 5))
+
+# search_movie backend: "mongodb" ($text search) or "memory" (a SearchEngine built
+# from MongoDB at startup, search_engine.py)
+SEARCH_BACKEND = os.environ.get("SEARCH_BACKEND", "mongodb")
+
+# get_similar_movies backend: "aggregation" (MongoDB), "memory" (a GenreIndex
+# loaded at startup) or "precomputed" (the similar_movies collection written by
+# GenreIndex.precompute, falling back to the aggregation)
+SIMILAR_MOVIES_BACKEND = os.environ.get("SIMILAR_MOVIES_BACKEND", "aggregation")
+
+# Precomputed similar users (neighbour_index.py): file, neighbours kept per user,
+# and how often each worker checks whether the file was rewritten
+NEIGHBOUR_INDEX_PATH = os.environ.get("NEIGHBOUR_INDEX_PATH", "neighbours.json")
+NEIGHBOUR_INDEX_K = int(os.environ.get("NEIGHBOUR_INDEX_K", 3))
+NEIGHBOUR_INDEX_CHECK_INTERVAL = float(os.environ.get("NEIGHBOUR_INDEX_CHECK_INTERVAL", 5))
+
+# Recommendation backend: "jaccard" (similar users, Cypher or LikeMatrix) or "als"
+# (factors trained by als.py, falling back to jaccard for users not in the model)
+RECOMMENDER = os.environ.get("RECOMMENDER", "jaccard")
+ALS_MODEL_PATH = os.environ.get("ALS_MODEL_PATH", "als_model")
+# Count the similar users' votes in an in-memory LikeMatrix loaded from Neo4j at
+# startup (like_matrix.py); the Cypher query stays the fallback for unknown users
+LIKE_MATRIX_ENABLED = os.environ.get("LIKE_MATRIX_ENABLED", "0") == "1"
+ALS_FACTORS = int(os.environ.get("ALS_FACTORS", 64))
+ALS_REGULARIZATION = float(os.environ.get("ALS_REGULARIZATION", 0.1))
+ALS_ALPHA = float(os.environ.get("ALS_ALPHA", 20))
+ALS_ITERATIONS = int(os.environ.get("ALS_ITERATIONS", 15))
+
+# Memory-mapped catalog snapshot (catalog_snapshot.py) answering card-level reads,
+# and how often each worker checks whether a new snapshot was published
+CATALOG_SNAPSHOT_PATH = os.environ.get("CATALOG_SNAPSHOT_PATH", "catalog.snapshot")
+CATALOG_SNAPSHOT_CHECK_INTERVAL = float(os.environ.get("CATALOG_SNAPSHOT_CHECK_INTERVAL", 5))
+
+# Most movie ids accepted by one /api/movies request
+API_MAX_IDS = int(os.environ.get("API_MAX_IDS", 100))
+# Default and largest page size of the /api/v1 list endpoints
+API_PAGE_SIZE = int(os.environ.get("API_PAGE_SIZE", 20))
+API_MAX_PAGE_SIZE = int(os.environ.get("API_MAX_PAGE_SIZE", 100))
+# JSON responses at least this large are gzip/brotli compressed
+API_COMPRESS_MIN_BYTES = int(os.environ.get("API_COMPRESS_MIN_BYTES", 1024))
+
+# Latency histograms and cache/pool statistics served on /metrics (metrics.py)
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+
+# Slow-query log (slowlog.py): queries slower than the threshold are written to a
+# JSON-lines file; a sample of them also gets an explain/PROFILE plan
+SLOWLOG_ENABLED = os.environ.get("SLOWLOG_ENABLED", "1") == "1"
+SLOWLOG_THRESHOLD_MS = float(os.environ.get("SLOWLOG_THRESHOLD_MS", 100))
+SLOWLOG_PLAN_SAMPLE_RATE = float(os.environ.get("SLOWLOG_PLAN_SAMPLE_RATE", 0.1))
+SLOWLOG_MAX_PLANS_PER_MINUTE = int(os.environ.get("SLOWLOG_MAX_PLANS_PER_MINUTE", 6))
+# "queryPlanner" does not run the query again; "executionStats" does
+SLOWLOG_EXPLAIN_VERBOSITY = os.environ.get("SLOWLOG_EXPLAIN_VERBOSITY", "queryPlanner")
+SLOWLOG_PATH = os.environ.get("SLOWLOG_PATH", "slow_queries.log")
+# Rotated files (.1 = newest) read by the summary; rotation itself is done by
+# logrotate (python -m <package>.slowlog --logrotate prints the stanza), since every
+# worker appends to the same file
+SLOWLOG_BACKUPS = int(os.environ.get("SLOWLOG_BACKUPS", 5))
+
+# Add a Server-Timing header with the per-lookup breakdown to every response
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "1") == "1"
@@ -0,0 +1,70 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from . import config
+
+# Returned in place of a result when a call exceeds its timeout
+TIMED_OUT = object()
+
+_executor = None
+_executor_pid = None
+_lock = threading.Lock()
+
+
+def _get_executor():
+    """Shared bounded executor, recreated after a fork (threads do not survive it)"""
+    global _executor, _executor_pid
+    if _executor_pid != os.getpid():
+        with _lock:
+            if _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(
+                    max_workers=config.FANOUT_MAX_WORKERS,
+                    thread_name_prefix="fanout"
+                )
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def _timed_call(func, args, kwargs):
+    start = time.perf_counter()
+    value = func(*args, **kwargs)
+    return value, time.perf_counter() - start
+
+
+def run_all(calls, timeout=None):
+    """
+    Run independent calls concurrently on the shared executor.
+
+    With config.FANOUT_ENABLED off the calls run one after another in the
+    calling thread, which makes it easy to compare both modes.
+
+    Args:
+        calls (list): (func, args, kwargs) tuples
+        timeout (float, optional): Seconds each call may take (default config.FANOUT_TIMEOUT)
+
+    Returns:
+        list: (value, seconds) per call, in order; value is TIMED_OUT for calls
+            that did not finish in time
+    """
+    if timeout is None:
+        timeout = config.FANOUT_TIMEOUT
+
+    if not config.FANOUT_ENABLED or len(calls) < 2:
+        return [_timed_call(func, args, kwargs) for func, args, kwargs in calls]
+
+    executor = _get_executor()
+    start = time.perf_counter()
+    futures = [executor.submit(_timed_call, func, args, kwargs) for func, args, kwargs in calls]
+
+    results = []
+    for future in futures:
+        # All calls started together, so they share one deadline
+        remaining = max(0.0, timeout - (time.perf_counter() - start))
+        try:
+            results.append(future.result(timeout=remaining))
+        except TimeoutError:
+            future.cancel()
+            results.append((TIMED_OUT, time.perf_counter() - start))
+    return results
@@ -0,0 +1,199 @@
+import argparse
+import time
+
+from . import config
+from .cache import CachedFunction, dumps, loads, local_cache, publish_invalidation
+from .clients import get_redis_client
+
+# Redis hash holding the version, build time and refresh duration of every snapshot
+STATUS_KEY = "feeds:status"
+# Held for one interval by whichever process refreshes, so N workers refresh once
+REFRESH_LOCK_KEY = "lock:feeds-refresh"
+
+
+def _single_call():
+    return [()]
+
+
+class Feed(CachedFunction):
+    """
+    Global list precomputed by a FeedRefresher instead of on the request path.
+
+    Snapshots are stored under the same kind of cache entry as CachedFunction,
+    so routes read them through CacheBatch like any other key. Each snapshot
+    also carries a version (its build time in milliseconds) and is written in a
+    MULTI/EXEC together with its STATUS_KEY record, so readers never see a value
+    and a status from different refreshes.
+
+    Snapshots stay fresh for two refresh intervals. If the refresher stops, the
+    last snapshot is served stale for stale_ttl more seconds and refreshed in
+    the background by readers, as with any cached function; only after that do
+    requests compute it themselves.
+    """
+
+    def __init__(self, func, key, interval=None, stale_ttl=None, arguments=_single_call, **options):
+        """
+        Args:
+            func (callable): Function computing the feed
+            key (str or callable): Cache key, or a function building it from the arguments
+            interval (int): Seconds between refreshes (default config.FEED_REFRESH_INTERVAL)
+            stale_ttl (int): Seconds a snapshot outlives a stopped refresher (default config.FEED_STALE_TTL)
+            arguments (callable): Returns the argument tuples to refresh, e.g. one per genre
+        """
+        self.interval = interval or config.FEED_REFRESH_INTERVAL
+        self.arguments = arguments
+        super().__init__(
+            func, key,
+            ttl=2 * self.interval,
+            stale_ttl=stale_ttl or config.FEED_STALE_TTL,
+            jitter=0,
+            **options
+        )
+
+    def make_entry(self, value):
+        built_at = time.time()
+        entry = {
+            "value": value,
+            "fresh_until": built_at + self.ttl,
+            "version": int(built_at * 1000),
+            "built_at": built_at
+        }
+        return entry, int(self.ttl + self.stale_ttl)
+
+    def refresh(self, *args):
+        """
+        Recompute one snapshot and swap it in atomically. A value rejected by
+        cache_if (the service functions return [] when their backend fails)
+        leaves the current snapshot in place.
+
+        Returns:
+            dict: Status record (key, version, built_at, duration), or None if
+                nothing was written
+        """
+        key = self.key(*args)
+        start = time.perf_counter()
+        value = self.func(*args)
+        duration = time.perf_counter() - start
+        if not self.cache_if(value):
+            print(f"Feed {key} not refreshed: rejected value after {duration:.2f}s")
+            return None
+
+        entry, redis_ttl = self.make_entry(value)
+        raw = dumps(entry)
+        status = {"key": key, "version": entry["version"], "built_at": entry["built_at"], "duration": duration}
+
+        pipeline = get_redis_client().pipeline(transaction=True)
+        pipeline.setex(key, redis_ttl, raw)
+        pipeline.hset(STATUS_KEY, key, dumps(status))
+        publish_invalidation(key, pipeline)
+        pipeline.execute()
+        local_cache.set(key, raw, redis_ttl)
+        return status
+
+    def refresh_all(self):
+        """Refresh the snapshot of every argument tuple; returns the status records of those written"""
+        return [status for args in self.arguments() if (status := self.refresh(*args)) is not None]
+
+
+def feed(key, **options):
+    """
+    Decorator turning a function into a Feed.
+
+    Example:
+        @feed("top_rated_movies", interval=60)
+        def get_top_rated_movies(): ...
+    """
+    def decorator(func):
+        return Feed(func, key, **options)
+    return decorator
+
+
+class FeedRefresher:
+    """
+    Recomputes a set of feeds on a fixed interval.
+
+    Any number of processes can run one: the first to take REFRESH_LOCK_KEY in
+    an interval does the work and the lock simply expires, so the feeds are
+    rebuilt about once per interval across the deployment.
+    """
+
+    def __init__(self, feeds, interval=None):
+        self.feeds = feeds
+        self.interval = interval or config.FEED_REFRESH_INTERVAL
+
+    def refresh_all(self):
+        """
+        Refresh every feed now, regardless of the lock.
+
+        Returns:
+            list: Status records of the snapshots written
+        """
+        start = time.perf_counter()
+        statuses = []
+        for f in self.feeds:
+            try:
+                statuses.extend(f.refresh_all())
+            except Exception as e:
+                print(f"Error refreshing feed {f.__name__}: {e}")
+
+        duration = time.perf_counter() - start
+        get_redis_client().hset(STATUS_KEY, "_refresh", dumps({
+            "key": "_refresh", "version": None, "built_at": time.time(), "duration": duration
+        }))
+        print(f"Refreshed {len(statuses)} feed snapshots in {duration:.2f}s")
+        return statuses
+
+    def refresh_if_due(self):
+        """Refresh unless another process already did in this interval; returns True if refreshed"""
+        lock = get_redis_client().lock(REFRESH_LOCK_KEY, timeout=self.interval, blocking=False, thread_local=False)
+        if not lock.acquire():
+            return False
+        self.refresh_all()
+        return True
+
+    def run_forever(self):
+        while True:
+            started = time.monotonic()
+            try:
+                self.refresh_if_due()
+            except Exception as e:
+                print(f"Feed refresher error: {e}")
+            time.sleep(max(1.0, self.interval - (time.monotonic() - started)))
+
+    @staticmethod
+    def status():
+        """
+        Version, refresh duration and age of every snapshot.
+
+        Returns:
+            list: Status dicts sorted by key, each with an "age" in seconds
+        """
+        now = time.time()
+        records = [loads(raw) for raw in get_redis_client().hgetall(STATUS_KEY).values()]
+        for record in records:
+            record["age"] = now - record["built_at"]
+        return sorted(records, key=lambda record: record["key"])
+
+
+def print_status():
+    print(f"{'key':<45}{'version':>16}{'age s':>10}{'refresh ms':>12}")
+    for record in FeedRefresher.status():
+        print(f"{record['key']:<45}{str(record['version'] or ''):>16}{record['age']:>10.1f}"
+              f"{record['duration'] * 1000:>12.1f}")
+
+
+if __name__ == "__main__":
+    from .cached_service import FEEDS
+
+    parser = argparse.ArgumentParser(description="Precompute the global home-page feeds")
+    parser.add_argument("--once", action="store_true", help="Refresh every feed once and exit")
+    parser.add_argument("--status", action="store_true", help="Print the age and refresh time of each snapshot")
+    args = parser.parse_args()
+
+    if args.status:
+        print_status()
+    elif args.once:
+        FeedRefresher(FEEDS).refresh_all()
+        print_status()
+    else:
+        FeedRefresher(FEEDS).run_forever()
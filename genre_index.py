@@ -0,0 +1,139 @@
+import numpy as np
+from pymongo import ReplaceOne
+
+# Byte popcount table, used when numpy has no bitwise_count (numpy < 2.0)
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount(values):
+    """Vectorized number of set bits of a uint64 array"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    return _POPCOUNT_TABLE[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class GenreIndex:
+    """
+    In-memory genre similarity index for get_similar_movies.
+
+    Each movie's genres are encoded as a bitmask over the (small, closed) set of
+    genre names, so the number of shared genres with every candidate is one
+    vectorized AND + popcount instead of a $setIntersection aggregation.
+    """
+
+    # Same candidate filter as the Mongo aggregation
+    MIN_VOTE_COUNT = 500
+
+    CARD_FIELDS = ("poster_path", "release_date", "title", "vote_average", "vote_count")
+
+    def __init__(self, movies):
+        """
+        Build the index from movie documents.
+
+        Args:
+            movies (iterable): Documents with _id, genres and the card fields
+        """
+        movies = [movie for movie in movies if movie.get("vote_count", 0) >= self.MIN_VOTE_COUNT]
+
+        genres = sorted({genre for movie in movies for genre in movie.get("genres") or []})
+        if len(genres) > 64:
+            raise ValueError(f"GenreIndex supports at most 64 genres, found {len(genres)}")
+        self.genre_bits = {genre: 1 << bit for bit, genre in enumerate(genres)}
+
+        self.ids = np.array([movie["_id"] for movie in movies], dtype=np.int64)
+        self.masks = np.array([self.encode(movie.get("genres") or []) for movie in movies], dtype=np.uint64)
+        self.vote_average = np.array([movie.get("vote_average", 0) for movie in movies], dtype=np.float64)
+        self.genres = {movie["_id"]: list(movie.get("genres") or []) for movie in movies}
+        self.cards = [
+            {
+                "_id": movie["_id"],
+                "poster_path": movie.get("poster_path", ""),
+                "release_date": movie.get("release_date"),
+                "title": movie.get("title", ""),
+                "vote_average": movie.get("vote_average", 0),
+                "vote_count": movie.get("vote_count", 0)
+            }
+            for movie in movies
+        ]
+
+    @classmethod
+    def from_mongodb(cls, collection):
+        """Load every movie with enough votes from the movies collection"""
+        projection = {"_id": 1, "genres": 1}
+        projection.update({field: 1 for field in cls.CARD_FIELDS})
+        return cls(collection.find({"vote_count": {"$gte": cls.MIN_VOTE_COUNT}}, projection=projection))
+
+    def encode(self, genres):
+        """Bitmask of a list of genre names (genres outside the index are ignored)"""
+        mask = 0
+        for genre in genres:
+            mask |= self.genre_bits.get(genre, 0)
+        return mask
+
+    def similar(self, movie_id, genres, limit=10):
+        """
+        Same result as the get_similar_movies aggregation.
+
+        Movies are ranked by number of shared genres, then vote_average, then _id
+        for a stable order. The returned "genres" field is the match count.
+        """
+        query = np.uint64(self.encode(genres))
+        matches = popcount(self.masks & query).astype(np.int64)
+        matches[self.ids == movie_id] = 0
+
+        candidates = np.flatnonzero(matches > 0)
+        if candidates.size > limit:
+            # Only movies sharing at least as many genres as the limit-th best can make the cut
+            kth = np.partition(matches[candidates], candidates.size - limit)[candidates.size - limit]
+            candidates = candidates[matches[candidates] >= kth]
+
+        order = np.lexsort((
+            self.ids[candidates],
+            -self.vote_average[candidates],
+            -matches[candidates]
+        ))
+
+        result = []
+        for i in candidates[order][:limit]:
+            card = dict(self.cards[i])
+            card["genres"] = int(matches[i])
+            result.append(card)
+        return result
+
+    def precompute(self, target_collection, limit=10, batch_size=1000):
+        """
+        Offline mode: store the similar movies of every indexed movie.
+
+        Writes one {_id: movie_id, similar: [...]} document per movie with
+        vote_count >= MIN_VOTE_COUNT, replacing any previous entry.
+
+        Returns:
+            int: Number of movies written
+        """
+        operations = []
+        written = 0
+        for movie_id in self.ids.tolist():
+            similar = self.similar(movie_id, self.genres[movie_id], limit)
+            operations.append(ReplaceOne({"_id": movie_id}, {"_id": movie_id, "similar": similar}, upsert=True))
+
+            if len(operations) >= batch_size:
+                target_collection.bulk_write(operations, ordered=False)
+                written += len(operations)
+                operations = []
+
+        if operations:
+            target_collection.bulk_write(operations, ordered=False)
+            written += len(operations)
+        return written
+
+
+if __name__ == "__main__":
+    from .clients import close_all, get_db
+
+    try:
+        mongo_db = get_db()
+        index = GenreIndex.from_mongodb(mongo_db.movies)
+        count = index.precompute(mongo_db.similar_movies)
+        print(f"Precomputed similar movies for {count} movies")
+    finally:
+        close_all()
@@ -0,0 +1,127 @@
+from collections import namedtuple
+
+import pymongo
+
+from .clients import get_db, get_neo4j_driver
+
+# An index the service queries rely on
+IndexSpec = namedtuple("IndexSpec", ["collection", "name", "keys", "purpose"])
+
+MONGO_INDEXES = [
+    IndexSpec(
+        "movies", "title_text",
+        [("title", pymongo.TEXT)],
+        "search_movie $text match"
+    ),
+    IndexSpec(
+        "movies", "vote_count_1_vote_average_-1",
+        [("vote_count", pymongo.ASCENDING), ("vote_average", pymongo.DESCENDING)],
+        "get_top_rated_movies (vote_count > 5000, sorted by vote_average)"
+    ),
+    IndexSpec(
+        "movies", "release_date_-1_vote_count_1",
+        [("release_date", pymongo.DESCENDING), ("vote_count", pymongo.ASCENDING)],
+        "get_recent_released_movies (release_date range, vote_count >= 50)"
+    ),
+    IndexSpec(
+        "movies", "genres_1",
+        [("genres", pymongo.ASCENDING)],
+        "get_similar_movies genres $in (multikey)"
+    ),
+]
+
+# Constraint name -> statement; the uniqueness constraints also index the
+# properties every Cypher query in service.py matches on
+NEO4J_CONSTRAINTS = {
+    "movie_id": "CREATE CONSTRAINT movie_id IF NOT EXISTS FOR (m:Movie) REQUIRE m.id IS UNIQUE",
+    "user_name": "CREATE CONSTRAINT user_name IF NOT EXISTS FOR (u:User) REQUIRE u.username IS UNIQUE",
+}
+
+
+class IndexManager:
+    """
+    Declares every index the service queries need and creates them once.
+
+    Run ensure_indexes() at deploy/startup time (see the ensure-indexes Flask
+    command) so no request path has to issue DDL.
+    """
+
+    def __init__(self, db=None, driver=None):
+        self.db = db if db is not None else get_db()
+        self.driver = driver if driver is not None else get_neo4j_driver()
+
+    def missing_mongo_indexes(self):
+        """Return the IndexSpecs that do not exist in MongoDB"""
+        missing = []
+        existing = {}
+        for spec in MONGO_INDEXES:
+            if spec.collection not in existing:
+                existing[spec.collection] = self.db[spec.collection].index_information()
+            if not self._has_index(existing[spec.collection], spec):
+                missing.append(spec)
+        return missing
+
+    def missing_neo4j_constraints(self):
+        """Return the names of the constraints that do not exist in Neo4j"""
+        with self.driver.session() as session:
+            existing = {record["name"] for record in session.run("SHOW CONSTRAINTS YIELD name RETURN name")}
+        return [name for name in NEO4J_CONSTRAINTS if name not in existing]
+
+    def report(self):
+        """Print the missing indexes and return True if everything exists"""
+        missing_mongo = self.missing_mongo_indexes()
+        missing_neo4j = self.missing_neo4j_constraints()
+
+        for spec in missing_mongo:
+            print(f"Missing MongoDB index {spec.collection}.{spec.name} ({spec.purpose})")
+        for name in missing_neo4j:
+            print(f"Missing Neo4j constraint {name}")
+
+        return not missing_mongo and not missing_neo4j
+
+    def ensure_indexes(self):
+        """
+        Create every missing index.
+
+        Returns:
+            list: Names of the indexes and constraints that were created
+        """
+        created = []
+        for spec in self.missing_mongo_indexes():
+            self.db[spec.collection].create_index(spec.keys, name=spec.name)
+            created.append(f"{spec.collection}.{spec.name}")
+
+        missing_neo4j = self.missing_neo4j_constraints()
+        if missing_neo4j:
+            with self.driver.session() as session:
+                for name in missing_neo4j:
+                    session.run(NEO4J_CONSTRAINTS[name])
+                    created.append(name)
+
+        return created
+
+    @staticmethod
+    def _has_index(index_information, spec):
+        """Match an existing index by name or by key pattern"""
+        if spec.name in index_information:
+            return True
+
+        for info in index_information.values():
+            keys = list(info["key"])
+            if keys == spec.keys:
+                return True
+            # Text indexes are stored as _fts/_ftsx keys with the fields in weights
+            if ("_fts", "text") in keys and all(d == pymongo.TEXT for _, d in spec.keys):
+                if {field for field, _ in spec.keys} <= set(info.get("weights", {})):
+                    return True
+        return False
+
+
+if __name__ == "__main__":
+    from .clients import close_all
+
+    try:
+        if IndexManager().report():
+            print("All indexes exist")
+    finally:
+        close_all()
@@ -0,0 +1,262 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+from scipy import sparse
+
+from . import config
+from .like_matrix import LikeMatrix, _top_k
+
+NORMALIZATIONS = ("cosine", "lift")
+
+
+def table_dtype(top_n):
+    """One fixed-width row per movie: its id, top_n neighbour ids (0-padded) and their scores"""
+    return np.dtype([
+        ("movie_id", np.int64),
+        ("count", np.int16),
+        ("neighbours", np.int32, top_n),
+        ("scores", np.float32, top_n),
+    ])
+
+
+class CoLikeIndex:
+    """
+    Offline "people who liked this also liked" index.
+
+    Built from a like_matrix.LikeMatrix: the item-item co-occurrence counts are
+    the sparse product Mᵀ·M (movies liked by the same users), normalized with
+    cosine (c / √(nᵢ·nⱼ)) or lift (c·users / (nᵢ·nⱼ)). Only the top_n neighbours
+    of each movie are kept, in a table of fixed-width rows that CoLikeTable
+    memory-maps for serving.
+    """
+
+    def __init__(self, top_n=None, normalization=None, min_co_likes=None):
+        """
+        Args:
+            top_n (int, optional): Neighbours kept per movie (default config.ALSO_LIKED_TOP_N)
+            normalization (str, optional): "cosine" or "lift" (default config.ALSO_LIKED_NORMALIZATION)
+            min_co_likes (int, optional): Pairs liked together by fewer users are
+                ignored, which keeps lift from ranking one-off pairs of rare movies
+                first (default config.ALSO_LIKED_MIN_CO_LIKES)
+        """
+        self.top_n = top_n or config.ALSO_LIKED_TOP_N
+        self.normalization = normalization or config.ALSO_LIKED_NORMALIZATION
+        if self.normalization not in NORMALIZATIONS:
+            raise ValueError(f"normalization must be one of {', '.join(NORMALIZATIONS)}")
+        self.min_co_likes = min_co_likes if min_co_likes is not None else config.ALSO_LIKED_MIN_CO_LIKES
+        self.table = np.zeros(0, dtype=table_dtype(self.top_n))
+        self.rows = {}
+        self.built_at = None
+
+    def rebuild(self, like_matrix, block_size=1024):
+        """Recompute the neighbours of every movie in the matrix"""
+        self.table = np.zeros(len(like_matrix.movie_ids), dtype=table_dtype(self.top_n))
+        self.table["movie_id"] = like_matrix.movie_ids
+        self.rows = {movie_id: row for row, movie_id in enumerate(like_matrix.movie_ids.tolist())}
+        self._refresh_columns(like_matrix, np.arange(len(like_matrix.movie_ids)), block_size)
+        self.built_at = time.time()
+
+    def refresh_movies(self, like_matrix, movie_ids, block_size=1024):
+        """
+        Recompute the rows of some movies, e.g. the ones a user just liked.
+
+        Movies new to the index are appended, and movies nobody likes anymore
+        lose their neighbours. Scores other movies hold for these movies keep
+        their old normalization until the next rebuild; only their rows'
+        co-like counts are exact.
+        """
+        movie_ids = set(movie_ids)
+        for movie_id in movie_ids - like_matrix.movie_index.keys():
+            if movie_id in self.rows:
+                row = self.table[self.rows[movie_id]]
+                row["count"] = 0
+                row["neighbours"] = 0
+                row["scores"] = 0
+        movie_ids = [movie_id for movie_id in movie_ids if movie_id in like_matrix.movie_index]
+        new = [movie_id for movie_id in movie_ids if movie_id not in self.rows]
+        if new:
+            rows = np.zeros(len(new), dtype=self.table.dtype)
+            rows["movie_id"] = new
+            for movie_id in new:
+                self.rows[movie_id] = len(self.rows)
+            self.table = np.concatenate([self.table, rows])
+
+        columns = np.array([like_matrix.movie_index[movie_id] for movie_id in movie_ids], dtype=np.int64)
+        self._refresh_columns(like_matrix, columns, block_size)
+        return len(movie_ids)
+
+    def update_user(self, like_matrix, username, movie_ids):
+        """
+        Apply a change to one user's likes and refresh only the affected rows.
+
+        Co-like counts change only between the movies the user liked before or
+        likes now, so those rows are recomputed (if the likes changed at all).
+
+        Args:
+            like_matrix (LikeMatrix): Matrix the index was built from; it is updated too
+            username (str): The user whose likes changed
+            movie_ids (iterable): The user's complete new set of liked movie ids
+        """
+        movie_ids = set(movie_ids)
+        previous = set(like_matrix.liked_movies(username) or [])
+        like_matrix.set_user_likes(username, movie_ids)
+        if movie_ids != previous:
+            self.refresh_movies(like_matrix, movie_ids | previous)
+
+    def _refresh_columns(self, like_matrix, columns, block_size):
+        """Recompute the table rows of some LikeMatrix columns, block_size movies per sparse product"""
+        matrix = like_matrix.matrix.tocsc()
+        transposed = matrix.T.tocsr()
+        item_counts = np.diff(matrix.indptr).astype(np.float64)
+        user_count = matrix.shape[0]
+
+        for first in range(0, len(columns), block_size):
+            block = columns[first:first + block_size]
+            co_likes = sparse.csr_matrix(transposed[block] @ matrix)
+            for offset, column in enumerate(block):
+                start, end = co_likes.indptr[offset], co_likes.indptr[offset + 1]
+                self._set_row(
+                    int(like_matrix.movie_ids[column]), like_matrix.movie_ids, column,
+                    co_likes.indices[start:end], co_likes.data[start:end].astype(np.float64),
+                    item_counts, user_count
+                )
+
+    def _set_row(self, movie_id, movie_ids, column, others, counts, item_counts, user_count):
+        keep = (others != column) & (counts >= self.min_co_likes)
+        others, counts = others[keep], counts[keep]
+        if self.normalization == "cosine":
+            scores = counts / np.sqrt(item_counts[column] * item_counts[others])
+        else:
+            scores = counts * user_count / (item_counts[column] * item_counts[others])
+
+        neighbour_ids = movie_ids[others]
+        top = _top_k(scores, self.top_n, neighbour_ids)
+        row = self.table[self.rows[movie_id]]
+        row["count"] = len(top)
+        row["neighbours"] = 0
+        row["scores"] = 0
+        row["neighbours"][:len(top)] = neighbour_ids[top]
+        row["scores"][:len(top)] = scores[top]
+
+    def save(self, path=None, like_matrix=None):
+        """
+        Write the table sorted by movie id, atomically (temporary file + rename).
+
+        With like_matrix, the likes the table now reflects are written next to
+        it (see saved_likes), so a later update also refreshes the movies users
+        stopped liking.
+        """
+        path = path or config.ALSO_LIKED_PATH
+        if like_matrix is not None:
+            tmp_path = f"{likes_path(path)}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({username: like_matrix.liked_movies(username) for username in like_matrix.usernames}, f)
+            os.replace(tmp_path, likes_path(path))
+        tmp_path = f"{path}.tmp.npy"
+        np.save(tmp_path, np.sort(self.table, order="movie_id"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=None, normalization=None, min_co_likes=None):
+        """Index with the rows of a saved table, for refresh_movies/update_user"""
+        table = np.load(path or config.ALSO_LIKED_PATH)
+        index = cls(table.dtype["neighbours"].shape[0], normalization, min_co_likes)
+        index.table = table
+        index.rows = {movie_id: row for row, movie_id in enumerate(table["movie_id"].tolist())}
+        return index
+
+
+def likes_path(path):
+    """File with the likes a saved table was computed from"""
+    return f"{path}.likes.json"
+
+
+def saved_likes(path=None):
+    """{username: movie ids} written by CoLikeIndex.save, or {} if there is none"""
+    try:
+        with open(likes_path(path or config.ALSO_LIKED_PATH)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+class CoLikeTable:
+    """
+    Read-only view of a saved CoLikeIndex for serving.
+
+    The table is memory-mapped, so workers share its pages; a lookup is one dict
+    access and one row read.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.rows = {movie_id: row for row, movie_id in enumerate(table["movie_id"].tolist())}
+
+    @classmethod
+    def load(cls, path=None):
+        return cls(np.load(path or config.ALSO_LIKED_PATH, mmap_mode="r"))
+
+    def also_liked(self, movie_id, limit=10):
+        """
+        Movies most often liked together with a movie.
+
+        Returns:
+            list: [(movie_id, score), ...], best first; empty for unknown movies
+        """
+        row = self.rows.get(movie_id)
+        if row is None:
+            return []
+        entry = self.table[row]
+        count = min(int(entry["count"]), limit)
+        return list(zip(entry["neighbours"][:count].tolist(), entry["scores"][:count].tolist()))
+
+
+def _load_likes(csv_path):
+    if csv_path:
+        return LikeMatrix.from_csv(csv_path)
+    from .clients import get_neo4j_driver
+    return LikeMatrix.from_neo4j(get_neo4j_driver())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the \"also liked\" co-like table")
+    parser.add_argument("mode", choices=["build", "update"], nargs="?", default="build",
+                        help="build: every movie; update: the movies --users like now or liked before")
+    parser.add_argument("--users", default="", help="update: comma-separated usernames with new likes")
+    parser.add_argument("--csv", help="Read likes from a movies_likes.csv file instead of Neo4j")
+    parser.add_argument("--path", default=config.ALSO_LIKED_PATH)
+    parser.add_argument("--top-n", type=int)
+    parser.add_argument("--normalization", choices=NORMALIZATIONS)
+    parser.add_argument("--min-co-likes", type=int)
+    args = parser.parse_args()
+
+    from .clients import close_all
+
+    try:
+        like_matrix = _load_likes(args.csv)
+        start = time.perf_counter()
+        if args.mode == "build":
+            index = CoLikeIndex(args.top_n, args.normalization, args.min_co_likes)
+            index.rebuild(like_matrix)
+            count = len(index.table)
+        else:
+            index = CoLikeIndex.load(args.path, args.normalization, args.min_co_likes)
+            # Like update_user: co-like counts change between the movies a user
+            # liked when the table was saved and the ones they like now
+            previous = saved_likes(args.path)
+            movie_ids = set()
+            for username in filter(None, args.users.split(",")):
+                movie_ids.update(like_matrix.liked_movies(username) or [])
+                movie_ids.update(previous.get(username, []))
+            count = index.refresh_movies(like_matrix, movie_ids)
+        index.save(args.path, like_matrix)
+        print(f"Wrote {count} movies to {args.path} in {time.perf_counter() - start:.1f}s")
+    finally:
+        close_all()
+
+
+if __name__ == "__main__":
+    main()
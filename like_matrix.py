@@ -0,0 +1,310 @@
+import csv
+import hashlib
+
+import numpy as np
+from scipy import sparse
+
+# Per-user digests are summed modulo 2^128, so the fingerprint does not depend
+# on row order and one user's change is one subtraction and one addition
+_FINGERPRINT_MODULUS = 1 << 128
+
+
+def _top_k(scores, k, tie_break):
+    """Return the positions of the k largest scores, ties broken by ascending tie_break"""
+    if k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64)
+
+    # argpartition finds the k-th largest value in linear time, then only the
+    # candidates at or above that value get fully sorted
+    if scores.size > k:
+        kth = np.partition(scores, scores.size - k)[scores.size - k]
+        candidates = np.flatnonzero(scores >= kth)
+    else:
+        candidates = np.arange(scores.size)
+
+    order = np.lexsort((tie_break[candidates], -scores[candidates]))
+    return candidates[order][:k]
+
+
+def _user_digest(username, movie_ids):
+    """128-bit hash of one user's likes"""
+    digest = hashlib.sha1(username.encode())
+    digest.update(b"\0")
+    digest.update(np.array(sorted(movie_ids), dtype=np.int64).tobytes())
+    return int.from_bytes(digest.digest()[:16], "big")
+
+
+class LikeMatrix:
+    """
+    In-memory User-LIKES-Movie graph stored as a binary CSR matrix.
+
+    Rows are users and columns are movies. Jaccard similarities and neighbour
+    vote counts are computed with sparse matrix products instead of the
+    per-request Cypher list comprehensions.
+    """
+
+    def __init__(self, likes):
+        """
+        Build the matrix from a mapping of username to liked movie ids.
+
+        Args:
+            likes (dict): {username: iterable of movie ids}
+        """
+        self.usernames = np.array(sorted(likes), dtype=object)
+        self.user_index = {username: i for i, username in enumerate(self.usernames)}
+
+        movie_ids = sorted({movie_id for ids in likes.values() for movie_id in ids})
+        self.movie_ids = np.array(movie_ids, dtype=np.int64)
+        self.movie_index = {movie_id: j for j, movie_id in enumerate(movie_ids)}
+
+        indptr = [0]
+        indices = []
+        for username in self.usernames:
+            columns = sorted({self.movie_index[movie_id] for movie_id in likes[username]})
+            indices.extend(columns)
+            indptr.append(len(indices))
+
+        indices = np.array(indices, dtype=np.int32)
+        self.matrix = sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.int32), indices, np.array(indptr, dtype=np.int64)),
+            shape=(len(self.usernames), len(self.movie_ids))
+        )
+        self.like_counts = np.diff(self.matrix.indptr)
+        # Computed on the first fingerprint() call, then kept up to date
+        self._fingerprint = None
+
+    def set_user_likes(self, username, movie_ids):
+        """
+        Replace one user's likes, adding the user and any new movies if needed.
+
+        Only the user's row is rewritten; the other rows are copied as-is.
+        New users and movies are appended, so ties between them are broken by
+        insertion order rather than by name.
+        """
+        movie_ids = set(movie_ids)
+        if self._fingerprint is not None:
+            previous = self.liked_movies(username)
+            if previous is not None:
+                self._fingerprint -= _user_digest(username, previous)
+            self._fingerprint = (self._fingerprint + _user_digest(username, movie_ids)) % _FINGERPRINT_MODULUS
+
+        new_movies = sorted(movie_ids - self.movie_index.keys())
+        for movie_id in new_movies:
+            self.movie_index[movie_id] = len(self.movie_index)
+        if new_movies:
+            self.movie_ids = np.concatenate([self.movie_ids, np.array(new_movies, dtype=np.int64)])
+
+        row = self.user_index.get(username)
+        indptr, indices = self.matrix.indptr, self.matrix.indices
+        if row is None:
+            row = len(self.usernames)
+            self.user_index[username] = row
+            self.usernames = np.append(self.usernames, np.array([username], dtype=object))
+            indptr = np.append(indptr, indptr[-1])
+
+        columns = np.array(sorted(self.movie_index[movie_id] for movie_id in movie_ids), dtype=np.int32)
+        start, end = indptr[row], indptr[row + 1]
+        indices = np.concatenate([indices[:start], columns, indices[end:]])
+        indptr = indptr.astype(np.int64, copy=True)
+        indptr[row + 1:] += len(columns) - (end - start)
+
+        self.matrix = sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.int32), indices, indptr),
+            shape=(len(self.usernames), len(self.movie_ids))
+        )
+        self.like_counts = np.diff(self.matrix.indptr)
+
+    def fingerprint(self):
+        """
+        Hash of the loaded likes, used to detect stale derived indexes.
+
+        The first call hashes every user; set_user_likes updates it afterwards.
+        """
+        if self._fingerprint is None:
+            self._fingerprint = sum(
+                _user_digest(username, self.liked_movies(username)) for username in self.usernames
+            ) % _FINGERPRINT_MODULUS
+        return f"{self._fingerprint:032x}"
+
+    @classmethod
+    def from_neo4j(cls, driver):
+        """Load every LIKES relationship from Neo4j"""
+        with driver.session() as session:
+            result = session.run("""
+                MATCH (u:User)-[:LIKES]->(m:Movie)
+                RETURN u.username AS username, collect(m.id) AS movie_ids
+            """)
+            likes = {record["username"]: record["movie_ids"] for record in result}
+        return cls(likes)
+
+    @classmethod
+    def from_csv(cls, csv_path, known_movie_ids=None):
+        """
+        Load likes from a tab-separated file in the movies_likes.csv format.
+
+        Args:
+            csv_path (str): Path to the file (columns student_name, movie_ids)
+            known_movie_ids (set, optional): Keep only these movie ids, mirroring
+                the importer which only links movies that exist in Neo4j
+        """
+        likes = {}
+        with open(csv_path, newline="") as f:
+            for row in csv.DictReader(f, delimiter="\t"):
+                movie_ids = [int(movie_id.strip()) for movie_id in str(row["movie_ids"]).split(",") if movie_id.strip()]
+                if known_movie_ids is not None:
+                    movie_ids = [movie_id for movie_id in movie_ids if movie_id in known_movie_ids]
+                likes.setdefault(row["student_name"], set()).update(movie_ids)
+        return cls(likes)
+
+    def liked_movies(self, username):
+        """Return the movie ids liked by a user, or None if the user is unknown"""
+        row = self.user_index.get(username)
+        if row is None:
+            return None
+        start, end = self.matrix.indptr[row], self.matrix.indptr[row + 1]
+        return self.movie_ids[self.matrix.indices[start:end]].tolist()
+
+    def jaccard(self, username):
+        """
+        Jaccard similarity between a user and every user in the matrix.
+
+        Returns:
+            numpy.ndarray: One float per row, or None if the user is unknown
+        """
+        row = self.user_index.get(username)
+        if row is None:
+            return None
+
+        # |A ∩ B| for every B in one sparse matrix-vector product
+        intersection = (self.matrix @ self.matrix[row].T).toarray().ravel()
+        union = self.like_counts[row] + self.like_counts - intersection
+
+        scores = np.zeros(len(self.usernames), dtype=np.float64)
+        np.divide(intersection, union, out=scores, where=union > 0)
+        return scores
+
+    def neighbours(self, username, k=3):
+        """
+        Find the k users most similar to a user.
+
+        Returns:
+            list: [(username, jaccard_index), ...] ordered by similarity, or None
+                if the user is unknown
+        """
+        scores = self.jaccard(username)
+        if scores is None:
+            return None
+
+        scores[self.user_index[username]] = 0.0
+        top = _top_k(scores, k, np.arange(len(scores)))
+        return [(self.usernames[i], float(scores[i])) for i in top if scores[i] > 0]
+
+    def all_neighbours(self, k=3, block_size=1024):
+        """
+        Yield (username, [(neighbour, jaccard_index), ...]) for every user.
+
+        Similarities are computed for block_size users at a time with one sparse
+        matrix product per block, which keeps memory bounded on large graphs.
+        """
+        transposed = self.matrix.T.tocsc()
+        tie_break = np.arange(len(self.usernames))
+
+        for first in range(0, len(self.usernames), block_size):
+            rows = np.arange(first, min(first + block_size, len(self.usernames)))
+            intersection = (self.matrix[rows] @ transposed).toarray()
+            union = self.like_counts[rows, None] + self.like_counts[None, :] - intersection
+
+            scores = np.zeros(intersection.shape, dtype=np.float64)
+            np.divide(intersection, union, out=scores, where=union > 0)
+            scores[np.arange(len(rows)), rows] = 0.0
+
+            for offset, row in enumerate(rows):
+                top = _top_k(scores[offset], k, tie_break)
+                yield self.usernames[row], [
+                    (self.usernames[i], float(scores[offset, i])) for i in top if scores[offset, i] > 0
+                ]
+
+    def recommend_from_neighbours(self, username, neighbours, limit=10):
+        """
+        Rank the movies liked by a set of neighbours that the user has not liked.
+
+        Args:
+            username (str): The active user
+            neighbours (list): Neighbour usernames (unknown names are ignored)
+            limit (int): Maximum number of movies to return
+
+        Returns:
+            list: [(movie_id, num_likes), ...] ordered by num_likes
+        """
+        rows = [self.user_index[name] for name in neighbours if name in self.user_index]
+        if not rows:
+            return []
+
+        votes = np.asarray(self.matrix[rows].sum(axis=0)).ravel()
+
+        # Exclude movies the active user already likes
+        row = self.user_index.get(username)
+        if row is not None:
+            start, end = self.matrix.indptr[row], self.matrix.indptr[row + 1]
+            votes[self.matrix.indices[start:end]] = 0
+
+        top = _top_k(votes, limit, self.movie_ids)
+        return [(int(self.movie_ids[j]), int(votes[j])) for j in top if votes[j] > 0]
+
+    def recommend(self, username, k=3, limit=10):
+        """
+        Same ranking as the Cypher query in service.get_recommendations_for_me.
+
+        Returns:
+            list: [(movie_id, num_likes), ...], or None if the user is unknown so
+                the caller can fall back to Neo4j
+        """
+        neighbours = self.neighbours(username, k)
+        if neighbours is None:
+            return None
+        return self.recommend_from_neighbours(username, [name for name, _ in neighbours], limit)
+
+
+def verify_against_cypher(driver, like_matrix=None):
+    """
+    Compare LikeMatrix.recommend with the Cypher query for every user in Neo4j.
+
+    The Cypher query breaks ties arbitrarily (both for the top-3 neighbours and
+    for the last recommendation slots), so only the ranked vote counts and the
+    movies strictly above the last vote count are compared.
+
+    Returns:
+        list: Usernames whose recommendations differ
+    """
+    from .service import RECOMMENDATION_QUERY
+
+    if like_matrix is None:
+        like_matrix = LikeMatrix.from_neo4j(driver)
+
+    mismatches = []
+    with driver.session() as session:
+        for username in like_matrix.usernames:
+            expected = [(r["movie_id"], r["num_likes"]) for r in session.run(RECOMMENDATION_QUERY, username=username)]
+            actual = like_matrix.recommend(username)
+
+            if [n for _, n in expected] != [n for _, n in actual]:
+                mismatches.append(username)
+                continue
+            if expected:
+                cutoff = expected[-1][1]
+                if {m for m, n in expected if n > cutoff} != {m for m, n in actual if n > cutoff}:
+                    mismatches.append(username)
+    return mismatches
+
+
+if __name__ == "__main__":
+    from .clients import close_all, get_neo4j_driver
+
+    try:
+        mismatches = verify_against_cypher(get_neo4j_driver())
+        if mismatches:
+            print(f"Recommendations differ for: {', '.join(mismatches)}")
+        else:
+            print("LikeMatrix matches the Cypher query for every user")
+    finally:
+        close_all()
@@ -0,0 +1,261 @@
+import bisect
+import functools
+import inspect
+import threading
+import time
+
+from pymongo import monitoring
+
+from . import config
+
+# Latency buckets in seconds, from a local-cache hit to a slow aggregation
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Every metric, in the order they are rendered on /metrics
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    """
+    Base of the in-process metrics.
+
+    Values are kept per process in a dict keyed by the label values; updates
+    take a short lock, so recording costs well under a microsecond. With
+    several workers, each serves its own values on /metrics and the scraper
+    sums them per instance.
+    """
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(labels[name] for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self._render_samples())
+        return lines
+
+    def _render_samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Gauge set directly, or read from a callback returning {label values: value} at scrape time"""
+
+    type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def _render_samples(self):
+        if self.callback is None:
+            return super()._render_samples()
+        try:
+            values = self.callback()
+        except Exception:
+            return []
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in values.items()]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (last one is +Inf), sum, count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _render_samples(self):
+        with self._lock:
+            items = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+SERVICE_LATENCY = Histogram(
+    "service_call_duration_seconds", "Duration of service.py query functions", ["function"]
+)
+SERVICE_ERRORS = Counter(
+    "service_errors_total", "Service function calls that failed and returned a fallback", ["function"]
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Duration of HTTP requests by route", ["route", "method", "status"]
+)
+CACHE_LOOKUPS = Counter(
+    "cache_lookups_total", "Cache lookups by key family and result (hit, stale or miss)", ["family", "result"]
+)
+CACHE_ERRORS = Counter(
+    "cache_errors_total", "Failed Redis cache operations", ["operation"]
+)
+
+
+def observed(func):
+    """Record the duration of every call of a service function (sync or async)"""
+    if not config.METRICS_ENABLED:
+        return func
+    name = func.__name__
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                SERVICE_LATENCY.observe(time.perf_counter() - start, function=name)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            SERVICE_LATENCY.observe(time.perf_counter() - start, function=name)
+    return wrapper
+
+
+def count_cache_lookup(family, entry, now):
+    """Count a cache entry lookup as hit, stale or miss"""
+    if entry is None:
+        result = "miss"
+    elif entry["fresh_until"] < now:
+        result = "stale"
+    else:
+        result = "hit"
+    CACHE_LOOKUPS.inc(family=family, result=result)
+
+
+MONGO_POOL = Gauge("mongo_pool_connections", "MongoDB connections of this process", ["state"])
+MONGO_POOL.set(config.MONGO_MAX_POOL_SIZE, state="max")
+
+
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    """Tracks open and checked-out MongoDB connections (see clients.get_mongo_client)"""
+
+    def connection_created(self, event):
+        MONGO_POOL.inc(state="open")
+
+    def connection_closed(self, event):
+        MONGO_POOL.dec(state="open")
+
+    def connection_checked_out(self, event):
+        MONGO_POOL.inc(state="in_use")
+
+    def connection_checked_in(self, event):
+        MONGO_POOL.dec(state="in_use")
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        pass
+
+
+mongo_pool_listener = MongoPoolListener()
+
+
+def _redis_pool():
+    # Imported here: clients imports this module
+    from . import clients
+    if clients._redis_client is None:
+        return {}
+    pool = clients._redis_client.connection_pool
+    in_use = len(pool._in_use_connections)
+    return {
+        ("open",): in_use + len(pool._available_connections),
+        ("in_use",): in_use,
+        ("max",): pool.max_connections,
+    }
+
+
+Gauge("redis_pool_connections", "Redis connections of this process", ["state"], callback=_redis_pool)
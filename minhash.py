@@ -0,0 +1,180 @@
+import numpy as np
+
+from . import config
+from .like_matrix import _top_k
+
+# Mersenne prime 2^31 - 1: a * x + b stays below 2^62, so uint64 never overflows
+_PRIME = np.uint64((1 << 31) - 1)
+# Multiplier combining the rows of a band into one bucket key (wraps modulo 2^64)
+_BAND_MULTIPLIER = np.uint64(1000003)
+
+
+class MinHashLSH:
+    """
+    Approximate similar-user search over a like_matrix.LikeMatrix.
+
+    Every user's set of liked movies gets a MinHash signature of num_perm
+    values; two signatures agree on each value with probability equal to the
+    Jaccard index of the sets. The signature is cut into bands, and users whose
+    values agree on a whole band land in the same bucket. The users sharing a
+    bucket with someone are the candidate neighbours, found with one binary
+    search per band; only they are scored with the exact Jaccard index.
+
+    More bands (fewer rows each) find more of the true neighbours but return
+    more candidates to re-rank. A pair with Jaccard index s becomes a candidate
+    with probability 1 - (1 - s^rows)^bands, an S-curve whose steepest point is
+    near s = (1 / bands)^(1 / rows).
+
+    update_user() rehashes a user whose likes changed; the new band keys go to
+    a per-band overlay, so the sorted arrays are only rebuilt with the index.
+    """
+
+    def __init__(self, like_matrix, num_perm=None, bands=None, seed=1, chunk_size=4096):
+        """
+        Hash every user of a LikeMatrix.
+
+        Args:
+            like_matrix (LikeMatrix): Likes to index; also used for the exact re-ranking
+            num_perm (int, optional): Signature length (default config.MINHASH_NUM_PERM)
+            bands (int, optional): Number of bands, must divide num_perm (default config.MINHASH_BANDS)
+            seed (int): Seed of the hash functions
+            chunk_size (int): Users hashed per vectorized step, bounds memory use
+        """
+        self.num_perm = num_perm or config.MINHASH_NUM_PERM
+        self.bands = bands or config.MINHASH_BANDS
+        if self.num_perm % self.bands:
+            raise ValueError(f"bands ({self.bands}) must divide num_perm ({self.num_perm})")
+        self.rows_per_band = self.num_perm // self.bands
+        self.like_matrix = like_matrix
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, int(_PRIME), size=self.num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, int(_PRIME), size=self.num_perm, dtype=np.uint64)
+
+        self.signatures = self._signatures(chunk_size)
+        self._build_bands()
+        # Rows rehashed by update_user since the build: {band key: rows} per band
+        self._overlay = [{} for _ in range(self.bands)]
+        self._updated = set()
+        self._updated_rows = np.empty(0, dtype=np.int64)
+
+    def _signatures(self, chunk_size):
+        """(users, num_perm) minimum hash of each user's liked movie ids"""
+        matrix = self.like_matrix.matrix
+        movie_ids = self.like_matrix.movie_ids.astype(np.uint64) % _PRIME
+        user_count = matrix.shape[0]
+        signatures = np.full((user_count, self.num_perm), _PRIME, dtype=np.uint64)
+
+        for first in range(0, user_count, chunk_size):
+            last = min(first + chunk_size, user_count)
+            start, end = matrix.indptr[first], matrix.indptr[last]
+            if start == end:
+                continue
+            ids = movie_ids[matrix.indices[start:end]]
+            hashes = (self._a[:, None] * ids[None, :] + self._b[:, None]) % _PRIME
+
+            # One minimum per user; users without likes keep the sentinel
+            counts = np.diff(matrix.indptr[first:last + 1])
+            rows = np.flatnonzero(counts)
+            offsets = matrix.indptr[first:last][rows] - start
+            signatures[first + rows] = np.minimum.reduceat(hashes, offsets, axis=1).T
+        return signatures
+
+    def _band_keys(self, signatures):
+        """(users, bands) bucket key of every band of every signature"""
+        banded = signatures.reshape(len(signatures), self.bands, self.rows_per_band)
+        keys = np.zeros((len(signatures), self.bands), dtype=np.uint64)
+        for j in range(self.rows_per_band):
+            keys = keys * _BAND_MULTIPLIER + banded[:, :, j]
+        return keys
+
+    def _build_bands(self):
+        """Per band, the bucket keys in sorted order and the user row of each"""
+        self._keys = self._band_keys(self.signatures)
+        # Users without likes have no neighbours and would all share one bucket
+        indexed = np.flatnonzero(self.like_matrix.like_counts > 0)
+        self._sorted_keys = np.empty((self.bands, len(indexed)), dtype=np.uint64)
+        self._sorted_rows = np.empty((self.bands, len(indexed)), dtype=np.int64)
+        for band in range(self.bands):
+            band_keys = self._keys[indexed, band]
+            order = np.argsort(band_keys, kind="stable")
+            self._sorted_keys[band] = band_keys[order]
+            self._sorted_rows[band] = indexed[order]
+
+    def _signature(self, row):
+        """MinHash signature of one LikeMatrix row"""
+        matrix = self.like_matrix.matrix
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        signature = np.full(self.num_perm, _PRIME, dtype=np.uint64)
+        if start < end:
+            ids = self.like_matrix.movie_ids[matrix.indices[start:end]].astype(np.uint64) % _PRIME
+            signature = ((self._a[:, None] * ids[None, :] + self._b[:, None]) % _PRIME).min(axis=1)
+        return signature
+
+    def update_user(self, username):
+        """
+        Rehash a user after LikeMatrix.set_user_likes, including users added
+        to the matrix since the build.
+        """
+        row = self.like_matrix.user_index[username]
+        if row >= len(self.signatures):
+            added = row + 1 - len(self.signatures)
+            self.signatures = np.vstack([self.signatures, np.full((added, self.num_perm), _PRIME, dtype=np.uint64)])
+            self._keys = np.vstack([self._keys, np.zeros((added, self.bands), dtype=np.uint64)])
+
+        if row in self._updated:
+            for band, key in enumerate(self._keys[row].tolist()):
+                self._overlay[band].get(key, set()).discard(row)
+        self.signatures[row] = self._signature(row)
+        self._keys[row] = self._band_keys(self.signatures[row:row + 1])[0]
+        if self.like_matrix.like_counts[row] > 0:
+            for band, key in enumerate(self._keys[row].tolist()):
+                self._overlay[band].setdefault(key, set()).add(row)
+        self._updated.add(row)
+        self._updated_rows = np.array(sorted(self._updated), dtype=np.int64)
+
+    def candidates(self, row):
+        """Rows sharing at least one band bucket with a row (the row itself excluded)"""
+        found = []
+        for band in range(self.bands):
+            key = self._keys[row, band]
+            lo = np.searchsorted(self._sorted_keys[band], key, side="left")
+            hi = np.searchsorted(self._sorted_keys[band], key, side="right")
+            rows = self._sorted_rows[band, lo:hi]
+            if self._updated:
+                # Entries of rehashed rows are stale; their current keys are in the overlay
+                rows = rows[~np.isin(rows, self._updated_rows)]
+                overlay = self._overlay[band].get(int(key))
+                if overlay:
+                    rows = np.concatenate([rows, np.fromiter(overlay, dtype=np.int64)])
+            found.append(rows)
+        candidates = np.unique(np.concatenate(found)) if found else np.empty(0, dtype=np.int64)
+        return candidates[candidates != row]
+
+    def neighbours(self, username, k=3):
+        """
+        Approximate k most similar users, scored with the exact Jaccard index.
+
+        Same output as LikeMatrix.neighbours; users outside every bucket of the
+        user are missed. Users added to the LikeMatrix after the index was built
+        count as unknown until update_user() hashes them.
+
+        Returns:
+            list: [(username, jaccard_index), ...] ordered by similarity, or None
+                if the user is unknown
+        """
+        row = self.like_matrix.user_index.get(username)
+        if row is None or row >= len(self.signatures):
+            return None
+        candidates = self.candidates(row)
+        if candidates.size == 0:
+            return []
+
+        matrix, like_counts = self.like_matrix.matrix, self.like_matrix.like_counts
+        intersection = (matrix[candidates] @ matrix[row].T).toarray().ravel()
+        union = like_counts[row] + like_counts[candidates] - intersection
+        scores = np.zeros(len(candidates), dtype=np.float64)
+        np.divide(intersection, union, out=scores, where=union > 0)
+
+        top = _top_k(scores, k, candidates)
+        return [(self.like_matrix.usernames[candidates[i]], float(scores[i])) for i in top if scores[i] > 0]
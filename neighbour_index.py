@@ -0,0 +1,214 @@
+import argparse
+import json
+import os
+import time
+
+from . import config
+from .like_matrix import LikeMatrix
+
+
+class UserNeighbourIndex:
+    """
+    Persistent map of each user's top-k most similar users by Jaccard index.
+
+    The index is built from a like_matrix.LikeMatrix and stored as JSON. When a
+    single user's likes change, update_user() rewrites only the rows that can be
+    affected instead of rebuilding every user.
+    """
+
+    def __init__(self, k=None, path=None):
+        """
+        Create an empty index.
+
+        Args:
+            k (int, optional): Number of neighbours kept per user (default config.NEIGHBOUR_INDEX_K)
+            path (str, optional): JSON file used by save() and load()
+        """
+        self.k = k or config.NEIGHBOUR_INDEX_K
+        self.path = path
+        self.neighbours = {}
+        self.built_at = None
+        self.fingerprint = None
+        self._reverse = {}
+
+    @classmethod
+    def load(cls, path):
+        """Load an index previously written by save()"""
+        with open(path) as f:
+            data = json.load(f)
+
+        index = cls(k=data["k"], path=path)
+        index.neighbours = {
+            username: [(name, score) for name, score in entries]
+            for username, entries in data["neighbours"].items()
+        }
+        index.built_at = data["built_at"]
+        index.fingerprint = data["fingerprint"]
+        index._build_reverse()
+        return index
+
+    def save(self, path=None):
+        """Write the index atomically (temporary file + rename)"""
+        path = path or self.path
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "k": self.k,
+                "built_at": self.built_at,
+                "fingerprint": self.fingerprint,
+                "neighbours": self.neighbours
+            }, f)
+        os.replace(tmp_path, path)
+        self.path = path
+
+    def rebuild(self, like_matrix, block_size=1024):
+        """Recompute the neighbours of every user in the matrix"""
+        self.neighbours = {
+            username: entries
+            for username, entries in like_matrix.all_neighbours(self.k, block_size)
+        }
+        self.built_at = time.time()
+        self.fingerprint = like_matrix.fingerprint()
+        self._build_reverse()
+
+    def get(self, username):
+        """Return the neighbour usernames of a user, or None if the user has no entry"""
+        entries = self.neighbours.get(username)
+        if entries is None:
+            return None
+        return [name for name, _ in entries]
+
+    def update_user(self, like_matrix, username, movie_ids):
+        """
+        Apply a change to one user's likes and refresh only the affected rows.
+
+        The user's own row is recomputed from one sparse matrix-vector product.
+        Another user's row is touched only if it now shares a movie with the
+        user, or already lists the user as a neighbour. Such a row is merged in
+        place unless the user's score dropped, in which case that single row is
+        recomputed.
+
+        Args:
+            like_matrix (LikeMatrix): Matrix the index was built from; it is updated too
+            username (str): The user whose likes changed
+            movie_ids (iterable): The user's complete new set of liked movie ids
+        """
+        like_matrix.set_user_likes(username, movie_ids)
+
+        scores = like_matrix.jaccard(username)
+        user_row = like_matrix.user_index[username]
+        scores[user_row] = 0.0
+
+        self._set_row(username, like_matrix.neighbours(username, self.k))
+
+        affected = {like_matrix.usernames[i] for i in scores.nonzero()[0]}
+        affected |= self._reverse.get(username, set())
+        affected.discard(username)
+
+        for other in affected:
+            score = float(scores[like_matrix.user_index[other]])
+            entries = self.neighbours.get(other, [])
+            previous = dict(entries).get(username)
+
+            if previous is not None and score < previous:
+                # Something outside the stored top-k may now outrank the user
+                self._set_row(other, like_matrix.neighbours(other, self.k))
+                continue
+
+            merged = [(name, s) for name, s in entries if name != username]
+            if score > 0:
+                merged.append((username, score))
+            merged.sort(key=lambda entry: (-entry[1], like_matrix.user_index.get(entry[0], len(like_matrix.usernames))))
+            self._set_row(other, merged[:self.k])
+
+        self.fingerprint = like_matrix.fingerprint()
+
+    def is_stale(self, like_matrix=None, max_age=None):
+        """
+        Check whether the index needs a rebuild.
+
+        Args:
+            like_matrix (LikeMatrix, optional): Current likes; the index is stale
+                if they differ from the likes it was built from
+            max_age (float, optional): Maximum age in seconds since the last rebuild
+        """
+        if self.built_at is None:
+            return True
+        if max_age is not None and time.time() - self.built_at > max_age:
+            return True
+        if like_matrix is not None and like_matrix.fingerprint() != self.fingerprint:
+            return True
+        return False
+
+    def _set_row(self, username, entries):
+        """Replace one row and keep the reverse (neighbour -> users) map in sync"""
+        for name, _ in self.neighbours.get(username, []):
+            self._reverse.get(name, set()).discard(username)
+        self.neighbours[username] = entries
+        for name, _ in entries:
+            self._reverse.setdefault(name, set()).add(username)
+
+    def _build_reverse(self):
+        self._reverse = {}
+        for username, entries in self.neighbours.items():
+            for name, _ in entries:
+                self._reverse.setdefault(name, set()).add(username)
+
+
+def update_saved(path, like_matrix, usernames):
+    """
+    Apply like changes to a saved index and write it back.
+
+    Every user in usernames gets their current likes from like_matrix through
+    update_user(); when more than 1% of the users changed, the index is
+    rebuilt instead, as each update copies the whole matrix.
+
+    Returns:
+        UserNeighbourIndex: The saved index
+    """
+    index = UserNeighbourIndex.load(path)
+    usernames = set(usernames)
+    if len(usernames) * 100 > len(like_matrix.usernames):
+        index.rebuild(like_matrix)
+    else:
+        for username in usernames:
+            index.update_user(like_matrix, username, like_matrix.liked_movies(username) or [])
+    index.save(path)
+    return index
+
+
+def _load_likes(csv_path):
+    if csv_path:
+        return LikeMatrix.from_csv(csv_path)
+    from .clients import get_neo4j_driver
+    return LikeMatrix.from_neo4j(get_neo4j_driver())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the similar-user index")
+    parser.add_argument("mode", choices=["build", "update"], nargs="?", default="build",
+                        help="build: every user; update: the --users whose likes changed")
+    parser.add_argument("--users", default="", help="update: comma-separated usernames with new likes")
+    parser.add_argument("--csv", help="Read likes from a movies_likes.csv file instead of Neo4j")
+    parser.add_argument("--path", default=config.NEIGHBOUR_INDEX_PATH)
+    parser.add_argument("--k", type=int)
+    args = parser.parse_args()
+
+    from .clients import close_all
+
+    try:
+        like_matrix = _load_likes(args.csv)
+        start = time.perf_counter()
+        if args.mode == "build":
+            index = UserNeighbourIndex(args.k)
+            index.rebuild(like_matrix)
+            index.save(args.path)
+        else:
+            index = update_saved(args.path, like_matrix, filter(None, args.users.split(",")))
+        print(f"Wrote {len(index.neighbours)} users to {args.path} in {time.perf_counter() - start:.1f}s")
+    finally:
+        close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,54 @@
-from neo4j import GraphDatabase
-import pandas as pd
-from pymongo import MongoClient
+import argparse
+import copy
+import hashlib
+import os
+import queue
 import sys
+import threading
+import time
+import zlib
+
+from concurrent.futures import ThreadPoolExecutor
+
+from neo4j import GraphDatabase
+from neo4j.exceptions import DriverError, Neo4jError
+from bson import json_util
+from pymongo.errors import OperationFailure
+
+from . import config
+from .clients import close_all, get_movies_collection
+from .like_matrix import LikeMatrix
+from .neighbour_index import update_saved
+
+# Labels a full rebuild is written under before it is swapped in
+SHADOW_LABELS = ("ShadowMovie", "ShadowUser")
+# Labels of the previous graph after a swap, until it is deleted
+RETIRED_LABELS = ("RetiredMovie", "RetiredUser")
+# Marks the nodes already promoted while a swap is in progress
+SWAPPED_LABEL = "Swapped"
+# Node holding the change stream resume token and likes file checksum of the last run
+CHECKPOINT_NAME = "populate_neo4j"
+
 
 class Neo4jImporter:
-    def __init__(self, uri="bolt://localhost:7687", user="neo4j", password="password"):
-        """Initialize Neo4j connection"""
+    def __init__(self, uri=None, user=None, password=None, movie_label="Movie", user_label="User"):
+        """Initialize Neo4j connection (config.NEO4J_* by default)"""
         try:
-            self.driver = GraphDatabase.driver(uri, auth=(user, password))
+            self.driver = GraphDatabase.driver(
+                uri or config.NEO4J_URI, auth=(user or config.NEO4J_USER, password or config.NEO4J_PASSWORD)
+            )
         except Exception as e:
             print(f"Failed to connect to Neo4j: {e}")
             sys.exit(1)
+        self.movie_label = movie_label
+        self.user_label = user_label
+
+    def with_labels(self, movie_label, user_label):
+        """Importer sharing this connection that writes nodes under other labels"""
+        importer = copy.copy(self)
+        importer.movie_label = movie_label
+        importer.user_label = user_label
+        return importer
             
     def close(self):
         """Close the Neo4j connection"""
@@ -18,122 +56,628 @@ class Neo4jImporter:
 
     def clear_database(self):
         """Clear all nodes and relationships from the database"""
+        self._delete_in_batches("MATCH (n)")
+        print("Database cleared")
+
+    def _delete_in_batches(self, match, batch_size=10000, **parameters):
+        """DETACH DELETE the nodes bound to n by match, batch_size per transaction"""
+        query = f"{match} WITH n LIMIT $batch_size DETACH DELETE n RETURN count(*) AS deleted"
+        deleted = 0
         with self.driver.session() as session:
-            session.run("MATCH (n) DETACH DELETE n")
-            print("Database cleared")
+            while True:
+                count = session.execute_write(
+                    lambda tx: tx.run(query, batch_size=batch_size, **parameters).single()["deleted"]
+                )
+                deleted += count
+                if count < batch_size:
+                    return deleted
 
     def create_constraints(self):
         """Create uniqueness constraints"""
         with self.driver.session() as session:
             # Create constraints if they don't exist
             try:
-                session.run("CREATE CONSTRAINT movie_id IF NOT EXISTS FOR (m:Movie) REQUIRE m.id IS UNIQUE")
-                session.run("CREATE CONSTRAINT user_name IF NOT EXISTS FOR (u:User) REQUIRE u.username IS UNIQUE")
+                session.run(f"CREATE CONSTRAINT {self.movie_label.lower()}_id IF NOT EXISTS "
+                            f"FOR (m:{self.movie_label}) REQUIRE m.id IS UNIQUE")
+                session.run(f"CREATE CONSTRAINT {self.user_label.lower()}_name IF NOT EXISTS "
+                            f"FOR (u:{self.user_label}) REQUIRE u.username IS UNIQUE")
                 print("Constraints created")
             except Exception as e:
                 print(f"Error creating constraints: {e}")
 
-    def import_movies_from_mongodb(self):
-        """Import movies from MongoDB to Neo4j"""
+    def import_movies_from_mongodb(self, readers=4, writers=4, batch_size=1000):
+        """
+        Import movies from MongoDB to Neo4j.
+
+        The _id space is split into balanced ranges ($bucketAuto) that
+        `readers` threads read with their own cursors. Their batches go through
+        bounded queues to `writers` Neo4j writer transactions, so neither side
+        can run far ahead of the other.
+
+        Returns:
+            bool: True if every movie was written, False if a reader or a batch failed
+        """
         try:
-            # Connect to MongoDB
-            mongo_client = MongoClient()
-            mongo_db = mongo_client["websitedb"]
-            movies_collection = mongo_db.movies
-
-            # Get all movies with minimal required fields
-            movies = movies_collection.find({}, {
-                "_id": 1,
-                "title": 1,
-                "genres": 1,
-            })
-
-            # Import movies in batches
-            batch_size = 1000
-            batch = []
-            
-            with self.driver.session() as session:
+            movies_collection = get_movies_collection()
+
+            total = movies_collection.estimated_document_count()
+            ranges = _id_ranges(movies_collection, readers * 4)
+            progress = _Progress("Movies", total)
+            pool = _WriterPool(self.driver, self._write_movie_batch, writers, progress=progress)
+
+            def read_range(id_range):
+                low, high, last = id_range
+                # Get the movies of the range with minimal required fields
+                movies = movies_collection.find({"_id": {"$gte": low, "$lte" if last else "$lt": high}}, {
+                    "_id": 1,
+                    "title": 1,
+                    "genres": 1,
+                })
+
+                batch = []
                 for movie in movies:
-                    # Prepare movie data
-                    movie_data = {
+                    batch.append({
                         "id": movie["_id"],
                         "title": movie["title"],
                         "genres": movie.get("genres", [])
-                    }
-                    batch.append(movie_data)
-                    
+                    })
                     if len(batch) >= batch_size:
-                        self._create_movie_batch(session, batch)
+                        pool.submit(batch, movie["_id"])
                         batch = []
-                        
-                # Create any remaining movies
                 if batch:
-                    self._create_movie_batch(session, batch)
-                    
+                    pool.submit(batch, low)
+
+            try:
+                with ThreadPoolExecutor(max_workers=readers, thread_name_prefix="mongo-reader") as executor:
+                    # list() re-raises the first reader error
+                    list(executor.map(read_range, ranges))
+            finally:
+                pool.close()
+                progress.done()
+
+            if pool.failed:
+                print(f"{pool.failed} movie batches failed")
+                return False
             print("Movies imported from MongoDB")
-            
+            return True
+
         except Exception as e:
             print(f"Error importing movies from MongoDB: {e}")
-        finally:
-            mongo_client.close()
+            return False
 
-    def _create_movie_batch(self, session, batch):
+    def _write_movie_batch(self, tx, batch):
         """Create a batch of movie nodes"""
-        query = """
+        query = f"""
         UNWIND $movies AS movie
-        MERGE (m:Movie {id: movie.id})
+        MERGE (m:{self.movie_label} {{id: movie.id}})
         SET m.title = movie.title,
             m.genres = movie.genres
         """
-        session.run(query, movies=batch)
+        tx.run(query, movies=batch).consume()
+        return len(batch)
+
+    def import_likes_from_csv(self, csv_path, batch_size=5000, writers=1):
+        """
+        Stream user likes from a tab-separated file into Neo4j.
+
+        The file is read line by line and flattened into (username, movie_id)
+        pairs, which are written with UNWIND in batches of batch_size, one
+        explicit transaction per batch. With several writers, each user's likes
+        always go to the same writer so concurrent transactions do not contend
+        for the same User node.
+
+        Lines without two columns or with non-numeric ids are rejected, as are
+        likes of movies that are not in the graph. Batches that could not be
+        written count as failed, and an error stopping the import sets "error".
+
+        Returns:
+            dict: likes written, users, malformed lines, unknown movie ids,
+                failed batches, seconds (and error)
+        """
+        stats = {"written": 0, "users": 0, "malformed": 0, "unknown": 0, "failed": 0, "seconds": 0.0}
+        start = time.perf_counter()
 
-    def import_likes_from_csv(self, csv_path):
-        """Import user likes from CSV file"""
         try:
-            # Read CSV file
-            df = pd.read_csv(csv_path, delimiter='\t')
-            
-            with self.driver.session() as session:
-                for _, row in df.iterrows():
-                    username = row['student_name']
-                    # Convert movie_ids string to list of integers
-                    movie_ids = [int(id.strip()) for id in str(row['movie_ids']).split(',')]
-                    
-                    # Create user and relationships
-                    query = """
-                    MERGE (u:User {username: $username})
-                    WITH u
-                    UNWIND $movie_ids AS movie_id
-                    MATCH (m:Movie {id: movie_id})
-                    MERGE (u)-[:LIKES]->(m)
-                    """
-                    session.run(query, username=username, movie_ids=movie_ids)
-                    
-            print("User likes imported from CSV")
-            
+            progress = _Progress("Likes")
+            pool = _WriterPool(self.driver, self._write_likes_batch, writers, progress=progress)
+            buffers = [[] for _ in range(writers)]
+            try:
+                for username, movie_id in _read_like_pairs(csv_path, stats):
+                    partition = zlib.crc32(username.encode()) % writers
+                    buffers[partition].append([username, movie_id])
+                    if len(buffers[partition]) >= batch_size:
+                        pool.submit(buffers[partition], partition)
+                        buffers[partition] = []
+                for partition, buffer in enumerate(buffers):
+                    if buffer:
+                        pool.submit(buffer, partition)
+            finally:
+                results = pool.close()
+                progress.done()
+
+            for batch_size_written, written in results:
+                stats["written"] += written
+                stats["unknown"] += batch_size_written - written
+            stats["failed"] = pool.failed
+            stats["seconds"] = time.perf_counter() - start
+
+            rate = stats["written"] / stats["seconds"] if stats["seconds"] else 0
+            print(f"User likes imported from CSV: {stats['written']} likes of {stats['users']} users "
+                  f"in {stats['seconds']:.1f}s ({rate:.0f} rows/s)")
+            if stats["malformed"] or stats["unknown"] or pool.failed:
+                print(f"Rejected: {stats['malformed']} malformed lines, {stats['unknown']} likes of unknown movies, "
+                      f"{pool.failed} failed batches")
+
         except Exception as e:
             print(f"Error importing likes from CSV: {e}")
+            stats["error"] = str(e)
+
+        return stats
+
+    def _write_likes_batch(self, tx, likes):
+        """Create the users and LIKES relationships of a batch; returns (pairs, pairs written)"""
+        tx.run(
+            f"UNWIND $usernames AS username MERGE (:{self.user_label} {{username: username}})",
+            usernames=sorted({username for username, _ in likes})
+        )
+        record = tx.run(f"""
+        UNWIND $likes AS like
+        MATCH (m:{self.movie_label} {{id: like[1]}})
+        MATCH (u:{self.user_label} {{username: like[0]}})
+        MERGE (u)-[:LIKES]->(m)
+        RETURN count(*) AS written
+        """, likes=likes).single()
+        return len(likes), record["written"]
+
+
+    def load_checkpoint(self):
+        """State of the last successful sync or rebuild ({} if there was none)"""
+        with self.driver.session() as session:
+            record = session.run(
+                "MATCH (s:SyncCheckpoint {name: $name}) RETURN s", name=CHECKPOINT_NAME
+            ).single()
+        if record is None:
+            return {}
+        checkpoint = dict(record["s"])
+        if checkpoint.get("movies_resume_token"):
+            checkpoint["movies_resume_token"] = json_util.loads(checkpoint["movies_resume_token"])
+        return checkpoint
+
+    def save_checkpoint(self, movies_resume_token, likes_checksum):
+        with self.driver.session() as session:
+            session.run("""
+            MERGE (s:SyncCheckpoint {name: $name})
+            SET s.movies_resume_token = $token, s.likes_checksum = $checksum, s.synced_at = datetime()
+            """, name=CHECKPOINT_NAME,
+                token=json_util.dumps(movies_resume_token) if movies_resume_token else None,
+                checksum=likes_checksum)
+
+    def sync(self, csv_path, batch_size=1000, writers=4):
+        """
+        Bring the graph up to date with MongoDB and the likes file, touching
+        only what changed since the last checkpoint.
+
+        Movie changes come from the collection's change stream, resumed from the
+        stored token. Without a usable token (first run, expired token, or a
+        standalone server without change streams) the movies are diffed against
+        the graph instead. Likes are only diffed when the file checksum changed.
+
+        The checkpoint only advances when every batch was written and no line of
+        the likes file was rejected as malformed; otherwise RuntimeError is
+        raised and the next run replays the same changes.
+        """
+        checkpoint = self.load_checkpoint()
+        movies_collection = get_movies_collection()
+
+        changes = _movie_changes(movies_collection, checkpoint.get("movies_resume_token"))
+        if changes is None:
+            # Token taken before the diff so no change made during it is lost
+            token = _current_resume_token(movies_collection)
+            upserts, deletes = self._diff_movies(movies_collection)
+        else:
+            upserts, deletes, token = changes
+        failed = self._apply_movie_changes(upserts, deletes, batch_size, writers)
+        if failed:
+            raise RuntimeError(f"{failed} movie batches failed; the checkpoint was not saved")
+        print(f"Movies synced: {len(upserts)} upserted, {len(deletes)} deleted")
+
+        checksum = _file_checksum(csv_path)
+        if checksum != checkpoint.get("likes_checksum"):
+            stats = self._sync_likes(csv_path, batch_size, writers)
+            if stats["failed"] or stats["malformed"]:
+                raise RuntimeError(f"{stats['failed']} likes batches failed, {stats['malformed']} malformed lines; "
+                                   "the checkpoint was not saved")
+            if stats["changed_users"] and os.path.exists(config.NEIGHBOUR_INDEX_PATH):
+                index = update_saved(config.NEIGHBOUR_INDEX_PATH, LikeMatrix.from_neo4j(self.driver),
+                                     stats["changed_users"])
+                print(f"Neighbour index updated for {len(stats['changed_users'])} users ({len(index.neighbours)} in total)")
+        else:
+            print("Likes file unchanged")
+
+        self.save_checkpoint(token, checksum)
+
+    def _diff_movies(self, movies_collection):
+        """Movies whose title or genres differ from the graph, and graph movies no longer in MongoDB"""
+        with self.driver.session() as session:
+            result = session.run(f"MATCH (m:{self.movie_label}) RETURN m.id AS id, m.title AS title, m.genres AS genres")
+            current = {record["id"]: (record["title"], record["genres"] or []) for record in result}
+
+        upserts = {}
+        for movie in movies_collection.find({}, {"_id": 1, "title": 1, "genres": 1}):
+            if current.pop(movie["_id"], None) != (movie["title"], movie.get("genres", [])):
+                upserts[movie["_id"]] = movie
+        return upserts, set(current)
+
+    def _apply_movie_changes(self, upserts, deletes, batch_size, writers):
+        """Write upserted movies and delete removed ones; returns the number of failed batches"""
+        pool = _WriterPool(self.driver, self._write_movie_batch, writers)
+        batch = []
+        try:
+            for movie in upserts.values():
+                batch.append({"id": movie["_id"], "title": movie["title"], "genres": movie.get("genres", [])})
+                if len(batch) >= batch_size:
+                    pool.submit(batch, movie["_id"])
+                    batch = []
+            if batch:
+                pool.submit(batch)
+        finally:
+            pool.close()
+
+        deletes = list(deletes)
+        for i in range(0, len(deletes), batch_size):
+            self._delete_in_batches(
+                f"MATCH (n:{self.movie_label}) WHERE n.id IN $ids", batch_size, ids=deletes[i:i + batch_size]
+            )
+        return pool.failed
+
+    def _sync_likes(self, csv_path, batch_size, writers):
+        """
+        Add the likes that are new in the file and remove the ones that are gone.
+
+        Returns:
+            dict: users, malformed lines, failed batches and the usernames
+                whose likes changed
+        """
+        stats = {"users": 0, "malformed": 0}
+        wanted = set(_read_like_pairs(csv_path, stats))
+        with self.driver.session() as session:
+            result = session.run(
+                f"MATCH (u:{self.user_label})-[:LIKES]->(m:{self.movie_label}) RETURN u.username AS username, m.id AS id"
+            )
+            current = {(record["username"], record["id"]) for record in result}
+            usernames = set(session.run(f"MATCH (u:{self.user_label}) RETURN collect(u.username) AS usernames")
+                            .single()["usernames"])
+
+        added = sorted(wanted - current)
+        removed = sorted(current - wanted)
+        gone_users = sorted(usernames - {username for username, _ in wanted})
+
+        pool = _WriterPool(self.driver, self._write_likes_batch, writers)
+        try:
+            for i in range(0, len(added), batch_size):
+                pool.submit([list(like) for like in added[i:i + batch_size]], i)
+        finally:
+            results = pool.close()
+        unknown = sum(pairs - written for pairs, written in results)
+
+        with self.driver.session() as session:
+            for i in range(0, len(removed), batch_size):
+                session.execute_write(lambda tx: tx.run(f"""
+                UNWIND $likes AS like
+                MATCH (:{self.user_label} {{username: like[0]}})-[r:LIKES]->(:{self.movie_label} {{id: like[1]}})
+                DELETE r
+                """, likes=[list(like) for like in removed[i:i + batch_size]]).consume())
+        self._delete_in_batches(f"MATCH (n:{self.user_label}) WHERE n.username IN $usernames",
+                                usernames=gone_users)
+
+        print(f"Likes synced: {len(added) - unknown} added, {len(removed)} removed, {len(gone_users)} users removed")
+        if stats["malformed"] or unknown:
+            print(f"Rejected: {stats['malformed']} malformed lines, {unknown} likes of unknown movies")
+        stats["failed"] = pool.failed
+        stats["changed_users"] = {username for username, _ in added + removed} | set(gone_users)
+        return stats
+
+    def rebuild(self, csv_path, readers=4, writers=4, batch_size=5000, likes_writers=1):
+        """
+        Full reload without an empty or half-built graph in between.
+
+        Everything is imported under SHADOW_LABELS while the current graph keeps
+        serving, then the old nodes are relabeled as RETIRED_LABELS and the
+        shadow nodes as Movie/User in batches (see _swap_in_batches). The
+        retired nodes are deleted in batches afterwards.
+
+        If an import fails, nothing is swapped: the current graph stays in
+        place, the shadow nodes are kept for inspection (the next rebuild
+        deletes them) and RuntimeError is raised.
+        """
+        shadow = self.with_labels(*SHADOW_LABELS)
+        # Leftovers of an interrupted rebuild
+        shadow._delete_in_batches(f"MATCH (n) WHERE n:{SHADOW_LABELS[0]} OR n:{SHADOW_LABELS[1]}")
+        self._relabel_in_batches(f"MATCH (n:{SWAPPED_LABEL})", f"REMOVE n:{SWAPPED_LABEL}")
+        shadow.create_constraints()
+
+        token = _current_resume_token(get_movies_collection())
+
+        if not shadow.import_movies_from_mongodb(readers, writers):
+            raise RuntimeError("Movie import failed; the current graph was kept")
+        likes = shadow.import_likes_from_csv(csv_path, batch_size, likes_writers)
+        if likes["failed"] or likes["malformed"] or "error" in likes:
+            raise RuntimeError("Likes import failed; the current graph was kept")
+
+        self._swap_in_batches(self.movie_label, SHADOW_LABELS[0], RETIRED_LABELS[0], "id")
+        self._swap_in_batches(self.user_label, SHADOW_LABELS[1], RETIRED_LABELS[1], "username")
+        print("Rebuilt graph swapped in")
+
+        self.save_checkpoint(token, _file_checksum(csv_path))
+        deleted = self._delete_in_batches(f"MATCH (n) WHERE n:{RETIRED_LABELS[0]} OR n:{RETIRED_LABELS[1]}")
+        print(f"Deleted {deleted} nodes of the previous graph")
+
+
+    def _swap_in_batches(self, label, shadow_label, retired_label, key, batch_size=10000):
+        """
+        Relabel the label nodes as retired_label and the shadow_label nodes as
+        label, batch_size nodes per transaction.
+
+        Each transaction retires a batch of current nodes and promotes the
+        shadow nodes with the same keys, so the uniqueness constraint holds and
+        every key stays served by one version or the other. Shadow nodes with
+        new keys are promoted last. Promoted nodes carry SWAPPED_LABEL until
+        the end, so they are not retired by a later batch.
+        """
+        def swap_batch(tx):
+            keys = tx.run(f"""
+            MATCH (n:{label}) WHERE NOT n:{SWAPPED_LABEL}
+            WITH n LIMIT $batch_size
+            REMOVE n:{label} SET n:{retired_label}
+            RETURN collect(n.{key}) AS keys
+            """, batch_size=batch_size).single()["keys"]
+            tx.run(f"""
+            MATCH (n:{shadow_label}) WHERE n.{key} IN $keys
+            REMOVE n:{shadow_label} SET n:{label}:{SWAPPED_LABEL}
+            """, keys=keys).consume()
+            return len(keys)
+
+        with self.driver.session() as session:
+            while session.execute_write(swap_batch) == batch_size:
+                pass
+        self._relabel_in_batches(f"MATCH (n:{shadow_label})", f"REMOVE n:{shadow_label} SET n:{label}:{SWAPPED_LABEL}",
+                                 batch_size)
+        self._relabel_in_batches(f"MATCH (n:{SWAPPED_LABEL})", f"REMOVE n:{SWAPPED_LABEL}", batch_size)
+
+    def _relabel_in_batches(self, match, change, batch_size=10000):
+        """Apply change (REMOVE/SET labels) to the nodes bound to n by match, batch_size per transaction"""
+        query = f"{match} WITH n LIMIT $batch_size {change} RETURN count(*) AS relabeled"
+        with self.driver.session() as session:
+            while session.execute_write(
+                lambda tx: tx.run(query, batch_size=batch_size).single()["relabeled"]
+            ) == batch_size:
+                pass
+
+
+def _read_like_pairs(csv_path, stats):
+    """
+    Yield (username, movie_id) pairs from a file in the movies_likes.csv format
+    without loading it in memory. Counts users and malformed lines in stats.
+    """
+    with open(csv_path, newline="") as f:
+        header = f.readline().rstrip("\r\n").split("\t")
+        name_column, ids_column = header.index("student_name"), header.index("movie_ids")
+
+        for line in f:
+            line = line.rstrip("\r\n")
+            if not line.strip():
+                continue
+            fields = line.split("\t")
+            try:
+                username = fields[name_column].strip()
+                movie_ids = [int(movie_id) for movie_id in fields[ids_column].split(",") if movie_id.strip()]
+            except (IndexError, ValueError):
+                stats["malformed"] += 1
+                continue
+            if len(fields) != len(header) or not username:
+                stats["malformed"] += 1
+                continue
+
+            stats["users"] += 1
+            for movie_id in movie_ids:
+                yield username, movie_id
+
+
+def _id_ranges(collection, partitions):
+    """
+    (min _id, max _id, last) ranges holding about the same number of documents.
+
+    A $bucketAuto max is the min of the next bucket, so it is exclusive except
+    in the last range.
+    """
+    buckets = list(collection.aggregate([
+        {"$bucketAuto": {"groupBy": "$_id", "buckets": partitions}}
+    ]))
+    return [
+        (bucket["_id"]["min"], bucket["_id"]["max"], i == len(buckets) - 1)
+        for i, bucket in enumerate(buckets)
+    ]
+
+
+def _file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _current_resume_token(collection):
+    """Resume token for "now", or None if the server has no change streams"""
+    try:
+        with collection.watch(max_await_time_ms=1) as stream:
+            stream.try_next()
+            return stream.resume_token
+    except OperationFailure:
+        return None
+
+
+def _movie_changes(collection, resume_token):
+    """
+    Movies inserted, updated or deleted since resume_token.
+
+    Returns:
+        tuple: ({_id: document} to upsert, {_id} to delete, new resume token),
+            or None if the changes cannot be replayed and the movies must be diffed
+    """
+    if resume_token is None:
+        return None
+
+    upserts, deletes = {}, set()
+    try:
+        with collection.watch(resume_after=resume_token, full_document="updateLookup",
+                              max_await_time_ms=100) as stream:
+            while (change := stream.try_next()) is not None:
+                operation = change["operationType"]
+                if operation in ("insert", "update", "replace"):
+                    movie_id = change["documentKey"]["_id"]
+                    movie = change.get("fullDocument")
+                    # No fullDocument: deleted again after this change
+                    if movie is not None:
+                        upserts[movie_id] = movie
+                        deletes.discard(movie_id)
+                elif operation == "delete":
+                    movie_id = change["documentKey"]["_id"]
+                    upserts.pop(movie_id, None)
+                    deletes.add(movie_id)
+                else:
+                    # drop, rename or invalidate: the stream cannot continue
+                    return None
+            return upserts, deletes, stream.resume_token
+    except OperationFailure as e:
+        print(f"Cannot resume the movies change stream ({e}), diffing instead")
+        return None
+
+
+class _Progress:
+    """Single-line progress display, redrawn at most once per second"""
+
+    def __init__(self, label, total=None):
+        self.label = label
+        self.total = total
+        self.count = 0
+        self._start = time.perf_counter()
+        self._shown = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, count):
+        with self._lock:
+            self.count += count
+            now = time.perf_counter()
+            if now - self._shown >= 1:
+                self._shown = now
+                self._show(now)
+
+    def done(self):
+        self._show(time.perf_counter())
+        print()
+
+    def _show(self, now):
+        elapsed = now - self._start
+        rate = self.count / elapsed if elapsed else 0
+        of_total = f"/{self.total}" if self.total else ""
+        print(f"\r{self.label}: {self.count}{of_total} ({rate:.0f}/s, {elapsed:.0f}s)", end="", flush=True)
+
+
+class _WriterPool:
+    """
+    Writer threads, each with its own session draining a bounded queue.
+
+    submit() blocks while a writer's queue is full, so a fast reader cannot get
+    ahead of Neo4j by more than queue_size batches per writer. Every batch runs
+    in session.execute_write, which retries transient errors such as deadlocks;
+    a batch still failing with a retryable error is retried up to `retries`
+    more times with a growing pause before it is counted as failed.
+    """
+
+    def __init__(self, driver, work, writers=1, queue_size=2, retries=3, progress=None):
+        self.driver = driver
+        self.work = work
+        self.retries = retries
+        self.progress = progress
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(writers)]
+        self.results = []
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._drain, args=(q,), name=f"neo4j-writer-{i}", daemon=True)
+            for i, q in enumerate(self.queues)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, batch, partition=0):
+        self.queues[hash(partition) % len(self.queues)].put(batch)
+
+    def close(self):
+        """Wait for every queued batch to be written; returns the work results"""
+        for q in self.queues:
+            q.put(None)
+        for thread in self._threads:
+            thread.join()
+        return self.results
+
+    def _drain(self, q):
+        with self.driver.session() as session:
+            while (batch := q.get()) is not None:
+                try:
+                    result = self._write(session, batch)
+                except Exception as e:
+                    print(f"Error writing batch: {e}")
+                    with self._lock:
+                        self.failed += 1
+                    continue
+                with self._lock:
+                    self.results.append(result)
+                if self.progress is not None:
+                    self.progress.update(len(batch))
+
+    def _write(self, session, batch):
+        for attempt in range(self.retries + 1):
+            try:
+                return session.execute_write(self.work, batch)
+            except Neo4jError as e:
+                if attempt == self.retries or not e.is_retryable():
+                    raise
+            except DriverError as e:
+                if attempt == self.retries or not e.is_retryable():
+                    raise
+            time.sleep(2 ** attempt)
+
 
 def main():
+    parser = argparse.ArgumentParser(description="Load movies from MongoDB and likes from a CSV file into Neo4j")
+    parser.add_argument("mode", nargs="?", choices=["sync", "rebuild"], default="sync",
+                        help="sync: apply changes since the last run (default); rebuild: full reload, swapped in atomically")
+    parser.add_argument("--likes-csv", default="movies_likes.csv")
+    parser.add_argument("--batch-size", type=int, default=5000,
+                        help="Likes per write transaction (sync: movies and likes)")
+    parser.add_argument("--writers", type=int, default=1, help="Parallel Neo4j writer transactions for likes")
+    parser.add_argument("--movie-readers", type=int, default=4, help="Concurrent MongoDB cursors")
+    parser.add_argument("--movie-writers", type=int, default=4, help="Parallel Neo4j writer transactions for movies")
+    args = parser.parse_args()
+
     # Initialize importer
     importer = Neo4jImporter()
     
     try:
-        # Clear existing data
-        print("Clearing database...")
-        importer.clear_database()
-        
         # Create constraints
         print("Creating constraints...")
         importer.create_constraints()
-        
-        # Import movies from MongoDB
-        print("Importing movies from MongoDB...")
-        importer.import_movies_from_mongodb()
-        
-        # Import likes from CSV
-        print("Importing likes from CSV...")
-        importer.import_likes_from_csv("movies_likes.csv")
+
+        if args.mode == "sync":
+            # Only what changed since the last run
+            print("Syncing movies and likes...")
+            importer.sync(args.likes_csv, args.batch_size, args.movie_writers)
+        else:
+            # Full import into shadow labels, swapped in when complete
+            print("Rebuilding graph...")
+            importer.rebuild(args.likes_csv, args.movie_readers, args.movie_writers, args.batch_size, args.writers)
         
         print("Import completed successfully!")
         
@@ -141,6 +685,7 @@ def main():
         print(f"An error occurred during import: {e}")
     finally:
         importer.close()
+        close_all()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
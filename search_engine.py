@@ -0,0 +1,234 @@
+import re
+import time
+from collections import Counter, defaultdict, namedtuple
+
+import numpy as np
+
+from .service import VOTE_BUCKET_DESCRIPTIONS
+
+# Close to the English stop words MongoDB's text index ignores
+STOP_WORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below between
+both but by can did do does doing down during each few for from further had has have having he her here
+hers herself him himself his how i if in into is it its itself just me more most my myself no nor not now
+of off on once only or other our ours ourselves out over own same she should so some such than that the
+their theirs them themselves then there these they this those through to too under until up very was we
+were what when where which while who whom why will with you your yours yourself yourselves
+""".split())
+
+_TOKEN_RE = re.compile(r"\w+(?:'\w+)?", re.UNICODE)
+
+# Upper bounds of the votesFacet buckets, same as the $switch in search_movie
+_VOTE_BUCKETS = np.array(sorted(VOTE_BUCKET_DESCRIPTIONS), dtype=np.int64)
+
+_RESULT_FIELDS = ("_id", "poster_path", "release_date", "title", "vote_average", "vote_count")
+
+# Immutable snapshot of the index; rebuild() swaps it in one assignment
+_Index = namedtuple("_Index", [
+    "docs", "postings", "doc_lengths", "avg_length",
+    "ids", "popularity", "vote_average", "vote_count", "years",
+    "genre_names", "genre_docs", "genre_codes", "built_at"
+])
+
+
+def tokenize(text):
+    """Lowercase word tokens without stop words, with plural 's' stripped"""
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token in STOP_WORDS:
+            continue
+        if token.endswith("'s"):
+            token = token[:-2]
+        elif len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class SearchEngine:
+    """
+    In-memory full-text search over movie titles with facets.
+
+    Titles are held in an inverted index and scored with BM25. Facets are
+    computed from columnar NumPy arrays over the matched documents. search()
+    returns the same dict shape as service.search_movie, so it can be used as a
+    drop-in backend (see service.use_search_engine).
+    """
+
+    def __init__(self, k1=1.2, b=0.75, limit=20):
+        self.k1 = k1
+        self.b = b
+        self.limit = limit
+        self._index = None
+
+    @classmethod
+    def from_mongodb(cls, collection, **kwargs):
+        """Create an engine and build it from the movies collection"""
+        engine = cls(**kwargs)
+        engine.rebuild(collection)
+        return engine
+
+    @property
+    def built_at(self):
+        return self._index.built_at if self._index is not None else None
+
+    def rebuild(self, collection):
+        """Rebuild the index from the movies collection and swap it in"""
+        movies = collection.find({}, projection={
+            "_id": 1,
+            "genres": 1,
+            "popularity": 1,
+            "poster_path": 1,
+            "release_date": 1,
+            "title": 1,
+            "vote_average": 1,
+            "vote_count": 1
+        })
+        self.build(movies)
+
+    def refresh(self, collection, max_age=3600):
+        """Rebuild only if the index is older than max_age seconds; returns True if rebuilt"""
+        if self._index is not None and time.time() - self._index.built_at < max_age:
+            return False
+        self.rebuild(collection)
+        return True
+
+    def build(self, movies):
+        """Build the index from an iterable of movie documents and swap it in"""
+        docs = []
+        postings = defaultdict(list)
+        doc_lengths = []
+        popularity = []
+        genre_ids = {}
+        genre_docs = []
+        genre_codes = []
+
+        for doc_id, movie in enumerate(movies):
+            docs.append({field: movie[field] for field in _RESULT_FIELDS if field in movie})
+            popularity.append(movie.get("popularity") or 0)
+
+            tokens = tokenize(movie.get("title") or "")
+            doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings[term].append((doc_id, tf))
+
+            for genre in set(movie.get("genres") or []):
+                genre_docs.append(doc_id)
+                genre_codes.append(genre_ids.setdefault(genre, len(genre_ids)))
+
+        doc_lengths = np.array(doc_lengths, dtype=np.float64)
+
+        self._index = _Index(
+            docs=docs,
+            postings={
+                term: (np.array([d for d, _ in entries], dtype=np.int64),
+                       np.array([tf for _, tf in entries], dtype=np.float64))
+                for term, entries in postings.items()
+            },
+            doc_lengths=doc_lengths,
+            avg_length=doc_lengths.mean() if docs else 0.0,
+            ids=np.array([d["_id"] for d in docs], dtype=np.int64),
+            popularity=np.array(popularity, dtype=np.float64),
+            vote_average=np.array([d.get("vote_average") or 0 for d in docs], dtype=np.float64),
+            vote_count=np.array([d.get("vote_count") or 0 for d in docs], dtype=np.int64),
+            years=np.array([d["release_date"].year if d.get("release_date") else 0 for d in docs], dtype=np.int64),
+            genre_names=np.array(sorted(genre_ids, key=genre_ids.get), dtype=object),
+            genre_docs=np.array(genre_docs, dtype=np.int64),
+            genre_codes=np.array(genre_codes, dtype=np.int64),
+            built_at=time.time()
+        )
+
+    def score(self, text, index=None):
+        """
+        BM25 score of every document for a query (terms are OR-ed, like $text).
+
+        Returns:
+            numpy.ndarray: One score per document, 0 for documents that do not match
+        """
+        if index is None:
+            index = self._index
+        scores = np.zeros(len(index.docs), dtype=np.float64)
+        if not index.docs:
+            return scores
+
+        for term in set(tokenize(text)):
+            if term not in index.postings:
+                continue
+            doc_ids, tf = index.postings[term]
+            idf = np.log(1 + (len(index.docs) - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * index.doc_lengths[doc_ids] / index.avg_length)
+            scores[doc_ids] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, text):
+        """
+        Search titles and compute facets over the matched documents.
+
+        Returns:
+            dict: Same shape as service.search_movie (searchResults, genreFacet,
+                releaseYearFacet, votesFacet)
+        """
+        # Read the snapshot once so a concurrent rebuild cannot mix two versions
+        index = self._index
+        scores = self.score(text, index)
+        matched = np.flatnonzero(scores > 0)
+
+        return {
+            "searchResults": self._top_results(index, scores, matched),
+            "genreFacet": self._genre_facet(index, scores > 0),
+            "releaseYearFacet": self._release_year_facet(index, matched),
+            "votesFacet": self._votes_facet(index, matched)
+        }
+
+    def _top_results(self, index, scores, matched):
+        """Top documents by score, then popularity, then vote_average, then _id (service.SEARCH_SORT)"""
+        candidates = matched
+        if candidates.size > self.limit:
+            kth = np.partition(scores[candidates], candidates.size - self.limit)[candidates.size - self.limit]
+            candidates = candidates[scores[candidates] >= kth]
+
+        order = np.lexsort((
+            index.ids[candidates],
+            -index.vote_average[candidates],
+            -index.popularity[candidates],
+            -scores[candidates]
+        ))
+
+        results = []
+        for doc_id in candidates[order][:self.limit]:
+            doc = dict(index.docs[doc_id])
+            doc["score"] = float(scores[doc_id])
+            results.append(doc)
+        return results
+
+    @staticmethod
+    def _genre_facet(index, matched_mask):
+        counts = np.bincount(
+            index.genre_codes[matched_mask[index.genre_docs]],
+            minlength=len(index.genre_names)
+        )
+        codes = np.flatnonzero(counts)
+        codes = codes[np.lexsort((index.genre_names[codes], -counts[codes]))]
+        return [{"_id": index.genre_names[code], "count": int(counts[code])} for code in codes]
+
+    @staticmethod
+    def _release_year_facet(index, matched):
+        years = index.years[matched]
+        years, counts = np.unique(years[years > 0], return_counts=True)
+        return [
+            {"_id": int(year), "count": int(count)}
+            for year, count in zip(years[::-1][:10], counts[::-1][:10])
+        ]
+
+    @staticmethod
+    def _votes_facet(index, matched):
+        # Index of the first bucket whose upper bound is >= vote_count; larger counts go in the last one
+        buckets = np.minimum(
+            np.searchsorted(_VOTE_BUCKETS, index.vote_count[matched], side="left"),
+            len(_VOTE_BUCKETS) - 1
+        )
+        counts = np.bincount(buckets, minlength=len(_VOTE_BUCKETS))
+        return [
+            {"_id": VOTE_BUCKET_DESCRIPTIONS[int(_VOTE_BUCKETS[i])], "count": int(counts[i])}
+            for i in np.flatnonzero(counts)
+        ]
@@ -1,195 +1,391 @@
 import datetime
 import pymongo
-from pymongo import MongoClient
-import pprint
-from neo4j import GraphDatabase
 
-client = MongoClient()
-db = client["websitedb"]
-#db = client.websitesdb
-#print(db)
-collection = db.movies
-#print(collection)
+from .clients import get_db, get_movies_collection, get_neo4j_driver
+from .metrics import SERVICE_ERRORS, observed
+from .slowlog import watch_cypher
 
-#####List collection#####
-#list_collection=db.list_collection_names()
-#print(list_collection)
+# Labels of the votesFacet buckets (upper bound of vote_count -> description)
+VOTE_BUCKET_DESCRIPTIONS = {
+    0: "Unrated (0 votes)",
+    1: "Barely rated (1 vote)",
+    16: "Moderately rated (up to 16 votes)",
+    19155: "Highly rated (up to 19155 votes)"
+}
 
-######Print a document######
-pprint.pprint(collection.find_one())
+# Optional in-memory search backend (search_engine.SearchEngine)
+_search_engine = None
 
-def search_movie(text):
+# Optional memory-mapped catalog (catalog_snapshot.SnapshotReloader)
+_catalog = None
 
-    try:
 
+def use_catalog_snapshot(reloader):
+    """Answer card-level reads from a catalog snapshot, or pass None to read MongoDB"""
+    global _catalog
+    _catalog = reloader
 
-        # Create text index if it doesn't exist
-        collection.create_index([("title", "text")])
-        
-        pipeline = [
-            # Text search stage
-            {
-                "$match": {
-                    "$text": {"$search": text}
-                }
-            },
-            # Facet to get both search results and aggregations
+
+def catalog_snapshot():
+    """The current CatalogSnapshot, or None when the catalog is read from MongoDB"""
+    return _catalog.get() if _catalog is not None else None
+
+
+def use_search_engine(search_engine):
+    """Serve search_movie from a SearchEngine, or pass None to use MongoDB $text search"""
+    global _search_engine
+    _search_engine = search_engine
+
+
+def search_pipeline(text):
+    """$text search with result and facet branches (shared with async_service)"""
+    return [
+        # Text search stage
+        {
+            "$match": {
+                "$text": {"$search": text}
+            }
+        },
+        # Facet to get both search results and aggregations
+        {
+            "$facet": {
+                "searchResults": [
+                    {
+                        "$addFields": {
+                            "score": {"$meta": "textScore"}
+                        }
+                    },
+                    {
+                        "$sort": {
+                            "score": -1,
+                            "popularity": -1,
+                            "vote_average": -1,
+                            "_id": 1
+                        }
+                    },
+                    {
+                        "$project": {
+                            "_id": 1,
+                            "poster_path": 1,
+                            "release_date": 1,
+                            "score": 1,
+                            "title": 1,
+                            "vote_average": 1,
+                            "vote_count": 1
+                        }
+                    },
+                    {"$limit": 20}
+                ],
+                "genreFacet": [
+                    {"$unwind": "$genres"},
+                    {
+                        "$group": {
+                            "_id": "$genres",
+                            "count": {"$sum": 1}
+                        }
+                    },
+                    {"$sort": {"count": -1}}
+                ],
+                "releaseYearFacet": [
+                    {
+                        "$match": {
+                            "release_date": {"$exists": True, "$ne": None}
+                        }
+                    },
+                    {
+                        "$group": {
+                            "_id": {"$year": "$release_date"},
+                            "count": {"$sum": 1}
+                        }
+                    },
+                    {"$sort": {"_id": -1}},
+                    {"$limit": 10}
+                ],
+                "votesFacet": [
+                    {
+                        "$group": {
+                            "_id": {
+                                "$switch": {
+                                    "branches": [
+                                        {"case": {"$lte": ["$vote_count", 0]}, "then": 0},
+                                        {"case": {"$lte": ["$vote_count", 1]}, "then": 1},
+                                        {"case": {"$lte": ["$vote_count", 16]}, "then": 16},
+                                        {"case": {"$lte": ["$vote_count", 19155]}, "then": 19155}
+                                    ],
+                                    "default": 19155
+                                }
+                            },
+                            "count": {"$sum": 1}
+                        }
+                    },
+                    {"$sort": {"_id": 1}}
+                ]
+            }
+        }
+    ]
+
+
+def format_search_result(result):
+    """Label the vote facets and make sure every facet exists"""
+    # Transform vote facets to include descriptions
+    if "votesFacet" in result:
+        result["votesFacet"] = [
             {
-                "$facet": {
-                    "searchResults": [
-                        {
-                            "$addFields": {
-                                "score": {"$meta": "textScore"}
-                            }
-                        },
-                        {
-                            "$sort": {
-                                "score": -1,
-                                "popularity": -1,
-                                "vote_average": -1
-                            }
-                        },
-                        {
-                            "$project": {
-                                "_id": 1,
-                                "poster_path": 1,
-                                "release_date": 1,
-                                "score": 1,
-                                "title": 1,
-                                "vote_average": 1,
-                                "vote_count": 1
-                            }
-                        },
-                        {"$limit": 20}
-                    ],
-                    "genreFacet": [
-                        {"$unwind": "$genres"},
-                        {
-                            "$group": {
-                                "_id": "$genres",
-                                "count": {"$sum": 1}
-                            }
-                        },
-                        {"$sort": {"count": -1}}
-                    ],
-                    "releaseYearFacet": [
-                        {
-                            "$match": {
-                                "release_date": {"$exists": True, "$ne": None}
-                            }
-                        },
-                        {
-                            "$group": {
-                                "_id": {"$year": "$release_date"},
-                                "count": {"$sum": 1}
-                            }
-                        },
-                        {"$sort": {"_id": -1}},
-                        {"$limit": 10}
-                    ],
-                    "votesFacet": [
-                        {
-                            "$group": {
-                                "_id": {
-                                    "$switch": {
-                                        "branches": [
-                                            {"case": {"$lte": ["$vote_count", 0]}, "then": 0},
-                                            {"case": {"$lte": ["$vote_count", 1]}, "then": 1},
-                                            {"case": {"$lte": ["$vote_count", 16]}, "then": 16},
-                                            {"case": {"$lte": ["$vote_count", 19155]}, "then": 19155}
-                                        ],
-                                        "default": 19155
-                                    }
-                                },
-                                "count": {"$sum": 1}
-                            }
-                        },
-                        {"$sort": {"_id": 1}}
-                    ]
-                }
+                "_id": VOTE_BUCKET_DESCRIPTIONS[facet["_id"]],
+                "count": facet["count"]
             }
+            for facet in result["votesFacet"]
         ]
 
-        # Execute aggregation
-        result = list(collection.aggregate(pipeline))[0]
-        
-        # Transform vote facets to include descriptions
-        vote_descriptions = {
-            0: "Unrated (0 votes)",
-            1: "Barely rated (1 vote)",
-            16: "Moderately rated (up to 16 votes)",
-            19155: "Highly rated (up to 19155 votes)"
-        }
+    # Ensure all facets exist
+    if "searchResults" not in result:
+        result["searchResults"] = []
+    if "genreFacet" not in result:
+        result["genreFacet"] = []
+    if "releaseYearFacet" not in result:
+        result["releaseYearFacet"] = []
+    if "votesFacet" not in result:
+        result["votesFacet"] = []
+
+    return result
+
+
+def empty_search_result():
+    return {
+        "searchResults": [],
+        "genreFacet": [],
+        "releaseYearFacet": [],
+        "votesFacet": []
+    }
+
+
+@observed
+def search_movie(text):
+
+    try:
+        if _search_engine is not None:
+            return _search_engine.search(text)
+
+        collection = get_movies_collection()
         
-        if "votesFacet" in result:
-            result["votesFacet"] = [
-                {
-                    "_id": vote_descriptions[facet["_id"]],
-                    "count": facet["count"]
-                }
-                for facet in result["votesFacet"]
-            ]
-
-        # Ensure all facets exist
-        if "searchResults" not in result:
-            result["searchResults"] = []
-        if "genreFacet" not in result:
-            result["genreFacet"] = []
-        if "releaseYearFacet" not in result:
-            result["releaseYearFacet"] = []
-        if "votesFacet" not in result:
-            result["votesFacet"] = []
+        pipeline = search_pipeline(text)
 
-        return result
+        # Execute aggregation
+        return format_search_result(list(collection.aggregate(pipeline))[0])
 
     except Exception as e:
         print(f"Error searching movies: {e}")
-        return {
-            "searchResults": [],
-            "genreFacet": [],
-            "releaseYearFacet": [],
-            "votesFacet": []
-        }
+        SERVICE_ERRORS.inc(function="search_movie")
+        return empty_search_result()
+
+
+@observed
+def search_movie_page(text, after=None, limit=20):
+    """
+    Search results after a keyset position, ranked like search_movie (without facets).
+
+    Always queries MongoDB: the keyset filter runs on the text score, which the
+    in-memory engine does not share.
+
+    Returns:
+        tuple: (results, position of the next page or None)
+    """
+    try:
+        pipeline = [
+            {"$match": {"$text": {"$search": text}}},
+            {"$addFields": {"score": {"$meta": "textScore"}}},
+        ]
+        if after is not None:
+            pipeline.append({"$match": keyset_filter(SEARCH_SORT, after)})
+        pipeline += [
+            {"$sort": dict(SEARCH_SORT)},
+            {"$limit": limit},
+            {"$project": {**CARD_PROJECTION, "score": 1, "popularity": 1}},
+        ]
+        movies = list(get_movies_collection().aggregate(pipeline))
+        next_after = _next_after(movies, SEARCH_SORT, limit)
+        for movie in movies:
+            movie.pop("popularity", None)
+        return movies, next_after
+
+    except Exception as e:
+        print(f"Error searching movies: {e}")
+        SERVICE_ERRORS.inc(function="search_movie_page")
+        return [], None
+
+
+
 
+# Fields shown on a movie card (lists, similar movies, recommendations)
+CARD_PROJECTION = {
+    "_id": 1,
+    "poster_path": 1,
+    "release_date": 1,
+    "title": 1,
+    "vote_average": 1,
+    "vote_count": 1
+}
 
 
+def movie_card(movie):
+    """Card dict with defaults for missing fields"""
+    return {
+        "_id": movie["_id"],
+        "poster_path": movie.get("poster_path", ""),
+        "release_date": movie.get("release_date"),
+        "title": movie.get("title", ""),
+        "vote_average": movie.get("vote_average", 0),
+        "vote_count": movie.get("vote_count", 0)
+    }
 
 
+# Movies with vote_count > 5000, sorted by vote_average descending
+TOP_RATED_FILTER = {"vote_count": {"$gt": 5000}}
+
+# Sort orders of the lists; _id breaks ties so keyset pages (see keyset_filter) are stable
+TOP_RATED_SORT = [("vote_average", pymongo.DESCENDING), ("_id", pymongo.ASCENDING)]
+RECENT_SORT = [("release_date", pymongo.DESCENDING), ("_id", pymongo.ASCENDING)]
+SEARCH_SORT = [("score", -1), ("popularity", -1), ("vote_average", -1), ("_id", 1)]
+SIMILAR_SORT = [("genres", -1), ("vote_average", -1), ("_id", 1)]
+
+
+def keyset_filter(sort, after):
+    """
+    Filter matching the documents that come after a position in a sort order,
+    so a page starts with an index seek instead of skipping the earlier pages.
+
+    Args:
+        sort (list): (field, direction) pairs, ending with a unique field
+        after (list): Sort values of the last document of the previous page
+    """
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        clause = {previous: value for (previous, _), value in zip(sort[:i], after[:i])}
+        clause[field] = {"$lt" if direction < 0 else "$gt": after[i]}
+        clauses.append(clause)
+    return {"$or": clauses}
+
+
+def sort_values(document, sort):
+    """Position of a document in a sort order (the "after" of the next page)"""
+    return [document.get(field) for field, _ in sort]
+
+
+def _next_after(documents, sort, limit):
+    """Position after the last document, or None on the last page"""
+    if len(documents) < limit:
+        return None
+    return sort_values(documents[-1], sort)
+
+
+def _find_page(query, sort, after, limit):
+    """One keyset page of movie cards: (cards, after of the next page)"""
+    if after is not None:
+        query = {"$and": [query, keyset_filter(sort, after)]}
+    movies = list(get_movies_collection().find(query, projection=CARD_PROJECTION).sort(sort).limit(limit))
+    return [movie_card(movie) for movie in movies], _next_after(movies, sort, limit)
+
+
+def start_of_today():
+    """Midnight today, so the recent movies query only changes once a day"""
+    return datetime.datetime.combine(datetime.date.today(), datetime.time.min)
+
+
+def recent_movies_filter(current_date):
+    """Movies with at least 50 votes released in the 720 days before current_date"""
+    # Calculate date 3 months ago
+    three_months_ago = current_date - datetime.timedelta(days=720)
+
+    return {
+        "vote_count": {"$gte": 50},
+        "release_date": {
+            "$gte": three_months_ago,
+            "$lte": current_date
+        }
+    }
+
+
+@observed
 def get_top_rated_movies():
 
     try:
+        if (snapshot := catalog_snapshot()) is not None:
+            return snapshot.top_rated(25)
 
+        collection = get_movies_collection()
         
         # Query movies with vote_count > 5000, sort by vote_average descending
         # Limit to 25 results
         top_movies = collection.find(
-            {"vote_count": {"$gt": 5000}},
-            projection={
-                "_id": 1,
-                "poster_path": 1,
-                "release_date": 1,
-                "title": 1,
-                "vote_average": 1,
-                "vote_count": 1
-            }
-        ).sort("vote_average", pymongo.DESCENDING).limit(25)
+            TOP_RATED_FILTER,
+            projection=CARD_PROJECTION
+        ).sort(TOP_RATED_SORT).limit(25)
         
         # Convert cursor to list and ensure consistent format
         result = []
         for movie in top_movies:
-            result.append({
-                "_id": movie["_id"],
-                "poster_path": movie.get("poster_path", ""),
-                "release_date": movie.get("release_date"),
-                "title": movie.get("title", ""),
-                "vote_average": movie.get("vote_average", 0),
-                "vote_count": movie.get("vote_count", 0)
-            })
+            result.append(movie_card(movie))
             
         return result
         
     except Exception as e:
         print(f"Error retrieving top rated movies: {e}")
+        SERVICE_ERRORS.inc(function="get_top_rated_movies")
+        return []
+
+
+@observed
+def get_top_rated_movies_page(after=None, limit=25):
+    """
+    Top rated movies after a keyset position, in the order of get_top_rated_movies.
+
+    Returns:
+        tuple: (cards, position of the next page or None)
+    """
+    try:
+        return _find_page(TOP_RATED_FILTER, TOP_RATED_SORT, after, limit)
+
+    except Exception as e:
+        print(f"Error retrieving top rated movies: {e}")
+        SERVICE_ERRORS.inc(function="get_top_rated_movies_page")
+        return [], None
+
+
+# Minimum vote_count for the per-genre top lists (smaller genres have few movies above 5000)
+GENRE_TOP_MIN_VOTES = 1000
+
+
+@observed
+def get_genres():
+    """Genres that have at least one movie eligible for a per-genre top list"""
+    try:
+        return sorted(get_movies_collection().distinct("genres", {"vote_count": {"$gt": GENRE_TOP_MIN_VOTES}}))
+
+    except Exception as e:
+        print(f"Error retrieving genres: {e}")
+        SERVICE_ERRORS.inc(function="get_genres")
+        return []
+
+
+@observed
+def get_top_rated_movies_by_genre(genre):
+
+    try:
+        if (snapshot := catalog_snapshot()) is not None:
+            return snapshot.top_rated(25, GENRE_TOP_MIN_VOTES, genre)
+
+        collection = get_movies_collection()
+
+        top_movies = collection.find(
+            {"genres": genre, "vote_count": {"$gt": GENRE_TOP_MIN_VOTES}},
+            projection=CARD_PROJECTION
+        ).sort(TOP_RATED_SORT).limit(25)
+
+        return [movie_card(movie) for movie in top_movies]
+
+    except Exception as e:
+        print(f"Error retrieving top rated {genre} movies: {e}")
+        SERVICE_ERRORS.inc(function="get_top_rated_movies_by_genre")
         return []
 
 
@@ -210,7 +406,7 @@ def get_top_rated_movies():
         }
 
         # Execute the query: sort by descending rating, limit results to 25
-        top_movies_cursor = collection.find(query, projection).sort("vote_average", DESCENDING).limit(25)
+        top_movies_cursor = collection.find(query, projection).sort(TOP_RATED_SORT).limit(25)
 
         # Convert the results to a list
         top_movies = list(top_movies_cursor)
@@ -221,141 +417,237 @@ def get_top_rated_movies():
         return []
 """
 
+@observed
 def get_recent_released_movies():
 
     try:
+        if (snapshot := catalog_snapshot()) is not None:
+            return snapshot.recent(start_of_today(), 25)
 
+        collection = get_movies_collection()
 
-        # Get current date
-        current_date = datetime.datetime.now()
-        
-        # Calculate date 3 months ago
-        three_months_ago = current_date - datetime.timedelta(days=720)
-        
         # Query for recent movies with at least 50 votes
         recent_movies = collection.find(
-            {
-                "vote_count": {"$gte": 50},
-                "release_date": {
-                    "$gte": three_months_ago,
-                    "$lte": current_date
-                }
-            },
-            projection={
-                "_id": 1,
-                "poster_path": 1,
-                "release_date": 1,
-                "title": 1,
-                "vote_average": 1,
-                "vote_count": 1
-            }
-        ).sort("release_date", pymongo.DESCENDING).limit(25)
+            recent_movies_filter(start_of_today()),
+            projection=CARD_PROJECTION
+        ).sort(RECENT_SORT).limit(25)
         
         # Convert cursor to list and ensure consistent format
         result = []
         for movie in recent_movies:
-            result.append({
-                "_id": movie["_id"],
-                "poster_path": movie.get("poster_path", ""),
-                "release_date": movie.get("release_date"),
-                "title": movie.get("title", ""),
-                "vote_average": movie.get("vote_average", 0),
-                "vote_count": movie.get("vote_count", 0)
-            })
+            result.append(movie_card(movie))
             
         return result
         
     except Exception as e:
         print(f"Error retrieving recent movies: {e}")
+        SERVICE_ERRORS.inc(function="get_recent_released_movies")
         return []
 
 
+@observed
+def get_recent_released_movies_page(after=None, limit=25):
+    """
+    Recent movies after a keyset position, in the order of get_recent_released_movies.
 
+    Returns:
+        tuple: (cards, position of the next page or None)
+    """
+    try:
+        return _find_page(recent_movies_filter(start_of_today()), RECENT_SORT, after, limit)
+
+    except Exception as e:
+        print(f"Error retrieving recent movies: {e}")
+        SERVICE_ERRORS.inc(function="get_recent_released_movies_page")
+        return [], None
+
+
+
+DETAILS_PROJECTION = {
+    "_id": 1,
+    "title": 1,
+    "genres": 1,
+    "overview": 1,
+    "poster_path": 1,
+    "release_date": 1,
+    "tagline": 1,
+    "vote_average": 1,
+    "vote_count": 1
+}
+
+
+def movie_details_doc(movie):
+    """Ensure the return format matches the expected structure"""
+    return {
+        "_id": movie["_id"],
+        "genres": movie.get("genres", []),
+        "overview": movie.get("overview", ""),
+        "poster_path": movie.get("poster_path", ""),
+        "release_date": movie.get("release_date"),
+        "tagline": movie.get("tagline", ""),
+        "title": movie.get("title", ""),
+        "vote_average": movie.get("vote_average", 0),
+        "vote_count": movie.get("vote_count", 0)
+    }
+
+
+@observed
 def get_movie_details(movie_id):
  
     try:
+        # Movies added after the snapshot was exported are still read from MongoDB
+        if (snapshot := catalog_snapshot()) is not None:
+            details = snapshot.details(movie_id)
+            if details is not None:
+                return details
 
+        collection = get_movies_collection()
         
         # Query for the specific movie
-        movie = collection.find_one(
-            {"_id": movie_id},
-            projection={
-                "_id": 1,
-                "title": 1,
-                "genres": 1,
-                "overview": 1,
-                "poster_path": 1,
-                "release_date": 1,
-                "tagline": 1,
-                "vote_average": 1,
-                "vote_count": 1
-            }
-        )
+        movie = collection.find_one({"_id": movie_id}, projection=DETAILS_PROJECTION)
         
         # Return None if movie not found
         if not movie:
             return None
             
-        # Ensure the return format matches the expected structure
-        return {
-            "_id": movie["_id"],
-            "genres": movie.get("genres", []),
-            "overview": movie.get("overview", ""),
-            "poster_path": movie.get("poster_path", ""),
-            "release_date": movie.get("release_date"),
-            "tagline": movie.get("tagline", ""),
-            "title": movie.get("title", ""),
-            "vote_average": movie.get("vote_average", 0),
-            "vote_count": movie.get("vote_count", 0)
-        }
+        return movie_details_doc(movie)
         
     except Exception as e:
         print(f"Error retrieving movie details: {e}")
+        SERVICE_ERRORS.inc(function="get_movie_details")
         return None
 
 
 
-def get_similar_movies(movie_id, genres):
+@observed
+def get_movie_cards(movie_ids):
+    """
+    Movie cards for several ids with one projected $in query.
+
+    Args:
+        movie_ids (list): Movie ids, duplicates allowed
 
+    Returns:
+        list: Cards in the order of movie_ids; unknown ids are left out
+    """
     try:
+        if not movie_ids:
+            return []
 
-        
-        # Build the query
-        query = {
-            "_id": {"$ne": movie_id},  # Exclude the reference movie
-            "vote_count": {"$gte": 500},  # At least 500 votes
-            "genres": {"$in": genres}  # Match at least one genre
-        }
-        
-        # Use aggregation pipeline to calculate genre matches and sort
-        pipeline = [
-            {"$match": query},
-            {
-                "$addFields": {
-                    "genres": {  # Count matching genres
-                        "$size": {
-                            "$setIntersection": ["$genres", genres]
-                        }
+        snapshot = catalog_snapshot()
+        movie_dict = snapshot.cards(movie_ids) if snapshot is not None else {}
+        missing = list(set(movie_ids) - movie_dict.keys())
+
+        if missing:
+            movies = get_movies_collection().find(
+                {"_id": {"$in": missing}},
+                projection=CARD_PROJECTION
+            )
+
+            # Create a mapping of movie_id to movie details to keep the input order
+            movie_dict.update({movie["_id"]: movie_card(movie) for movie in movies})
+        return [movie_dict[movie_id] for movie_id in movie_ids if movie_id in movie_dict]
+
+    except Exception as e:
+        print(f"Error retrieving movie cards: {e}")
+        SERVICE_ERRORS.inc(function="get_movie_cards")
+        return []
+
+
+def get_movie_card(movie_id):
+    """Card of one movie, or None if it does not exist"""
+    cards = get_movie_cards([movie_id])
+    return cards[0] if cards else None
+
+
+# Optional in-memory genre bitmask index (genre_index.GenreIndex)
+_genre_index = None
+
+# Read the similar_movies collection written by GenreIndex.precompute()
+_use_precomputed_similar = False
+
+
+def use_genre_index(genre_index):
+    """Serve get_similar_movies from a GenreIndex, or pass None to use the aggregation"""
+    global _genre_index
+    _genre_index = genre_index
+
+
+def use_precomputed_similar(enabled=True):
+    """Look up the similar_movies collection before running the aggregation"""
+    global _use_precomputed_similar
+    _use_precomputed_similar = enabled
+
+
+def similar_movies_pipeline(movie_id, genres):
+    """Movies sharing the most genres with a movie (shared with async_service)"""
+    # Build the query
+    query = {
+        "_id": {"$ne": movie_id},  # Exclude the reference movie
+        "vote_count": {"$gte": 500},  # At least 500 votes
+        "genres": {"$in": genres}  # Match at least one genre
+    }
+    
+    # Use aggregation pipeline to calculate genre matches and sort
+    return [
+        {"$match": query},
+        {
+            "$addFields": {
+                "genres": {  # Count matching genres
+                    "$size": {
+                        "$setIntersection": ["$genres", genres]
                     }
                 }
-            },
-            {"$sort": {
-                "genres": -1,  # Sort by number of matching genres (descending)
-                "vote_average": -1  # Then by rating (descending)
-            }},
-            {"$limit": 10},  # Limit to 10 results as specified
-            {
-                "$project": {
-                    "_id": 1,
-                    "genres": 1,  # This will now be the count of matching genres
-                    "poster_path": 1,
-                    "release_date": 1,
-                    "title": 1,
-                    "vote_average": 1,
-                    "vote_count": 1
-                }
             }
-        ]
+        },
+        {"$sort": {
+            "genres": -1,  # Sort by number of matching genres (descending)
+            "vote_average": -1,  # Then by rating (descending)
+            "_id": 1  # Stable order for ties
+        }},
+        {"$limit": 10},  # Limit to 10 results as specified
+        {
+            "$project": {
+                "_id": 1,
+                "genres": 1,  # This will now be the count of matching genres
+                "poster_path": 1,
+                "release_date": 1,
+                "title": 1,
+                "vote_average": 1,
+                "vote_count": 1
+            }
+        }
+    ]
+
+
+def similar_movie_card(movie):
+    card = movie_card(movie)
+    card["genres"] = movie["genres"]  # Number of matching genres
+    return card
+
+
+@observed
+def get_similar_movies(movie_id, genres):
+
+    try:
+
+        # In-memory index: same top 10 without touching Mongo
+        if _genre_index is not None:
+            return _genre_index.similar(movie_id, genres)
+
+        if (snapshot := catalog_snapshot()) is not None:
+            return snapshot.similar(movie_id, genres)
+
+        # Offline mode: results stored for every movie with vote_count >= 500
+        if _use_precomputed_similar:
+            precomputed = get_db().similar_movies.find_one({"_id": movie_id})
+            if precomputed:
+                return precomputed["similar"]
+
+        collection = get_movies_collection()
+        
+        # Use aggregation pipeline to calculate genre matches and sort
+        pipeline = similar_movies_pipeline(movie_id, genres)
         
         # Execute aggregation pipeline
         similar_movies = collection.aggregate(pipeline)
@@ -363,59 +655,300 @@ def get_similar_movies(movie_id, genres):
         # Convert cursor to list and ensure consistent format
         result = []
         for movie in similar_movies:
-            result.append({
-                "_id": movie["_id"],
-                "genres": movie["genres"],  # Number of matching genres
-                "poster_path": movie.get("poster_path", ""),
-                "release_date": movie.get("release_date"),
-                "title": movie.get("title", ""),
-                "vote_average": movie.get("vote_average", 0),
-                "vote_count": movie.get("vote_count", 0)
-            })
+            result.append(similar_movie_card(movie))
             
         return result
         
     except Exception as e:
         print(f"Error retrieving similar movies: {e}")
+        SERVICE_ERRORS.inc(function="get_similar_movies")
         return []
 
 
+@observed
+def get_similar_movies_page(movie_id, genres, after=None, limit=10):
+    """
+    Similar movies after a keyset position, in the order of get_similar_movies.
+
+    Returns:
+        tuple: (cards, position of the next page or None)
+    """
+    try:
+        pipeline = similar_movies_pipeline(movie_id, genres)
+        # Replace the $limit stage: filter on the position, then cut the page
+        sort_stage = pipeline.index(next(stage for stage in pipeline if "$sort" in stage))
+        pipeline[sort_stage + 1] = {"$limit": limit}
+        if after is not None:
+            pipeline.insert(sort_stage, {"$match": keyset_filter(SIMILAR_SORT, after)})
+
+        movies = [similar_movie_card(movie) for movie in get_movies_collection().aggregate(pipeline)]
+        return movies, _next_after(movies, SIMILAR_SORT, limit)
+
+    except Exception as e:
+        print(f"Error retrieving similar movies: {e}")
+        SERVICE_ERRORS.inc(function="get_similar_movies_page")
+        return [], None
+
+
+
+# Other users who like a movie
+MOVIE_LIKES_QUERY = """
+    MATCH (u:User)-[:LIKES]->(m:Movie {id: $movie_id})
+    WHERE u.username <> $username
+    RETURN u.username AS username
+    ORDER BY u.username
+    """
+
 
+@observed
 def get_movie_likes(username, movie_id):
     #print(f"Debug - username: {username}, movie_id: {movie_id}, type(movie_id): {type(movie_id)}")
     #print(f"Getting likes with username: {username}")
     try:
-        # Connect to Neo4j
-        driver = GraphDatabase.driver(
-            "bolt://localhost:7687",
-            auth=("neo4j", "password")  # Make sure to use your actual Neo4j password
-        )
-        
-        with driver.session() as session:
-            # Query to find other users who like the specified movie
-            result = session.run("""
-                MATCH (u:User)-[:LIKES]->(m:Movie {id: $movie_id})
-                WHERE u.username <> $username
-                RETURN u.username AS username
-                ORDER BY u.username
-                """, 
-                movie_id=movie_id,
-                username=username
-            )
-            
-            # Convert results to list of usernames
-            usernames = [record["username"] for record in result]
+        with get_neo4j_driver().session() as session:
+            with watch_cypher(MOVIE_LIKES_QUERY, {"movie_id": movie_id, "username": username}):
+                # Query to find other users who like the specified movie
+                result = session.run(
+                    MOVIE_LIKES_QUERY,
+                    movie_id=movie_id,
+                    username=username
+                )
+
+                # Convert results to list of usernames
+                usernames = [record["username"] for record in result]
             return usernames
             
     except Exception as e:
         print(f"Error getting movie likes: {e}")
+        SERVICE_ERRORS.inc(function="get_movie_likes")
+        return []
+
+
+# Jaccard top-3 neighbour recommendation query, also used by
+# like_matrix.verify_against_cypher to check the in-memory engine
+RECOMMENDATION_QUERY = """
+        // Find active user's liked movies
+        MATCH (active:User {username: $username})-[:LIKES]->(m:Movie)
+        WITH active, collect(m.id) as active_movies
+
+        // Find other users and their liked movies
+        MATCH (other:User)-[:LIKES]->(m:Movie)
+        WHERE other.username <> active.username
+        WITH active, active_movies, other, collect(m.id) as other_movies
+
+        // Calculate Jaccard similarity in a single step
+        WITH 
+            active,
+            other,
+            active_movies,
+            other_movies,
+            size([x IN active_movies WHERE x IN other_movies]) as intersection_size,
+            size(active_movies + [x IN other_movies WHERE NOT x IN active_movies]) as union_size,
+            toFloat(size([x IN active_movies WHERE x IN other_movies])) / 
+            size(active_movies + [x IN other_movies WHERE NOT x IN active_movies]) as jaccard_index
+
+        // Filter and rank similar users
+        WHERE jaccard_index > 0
+        WITH active, other, jaccard_index
+        ORDER BY jaccard_index DESC
+        LIMIT 3
+
+        // Get movie recommendations from similar users
+        WITH collect(other) as similar_users, active
+        UNWIND similar_users as neighbor
+        MATCH (neighbor)-[:LIKES]->(recommended:Movie)
+        WHERE NOT (active)-[:LIKES]->(recommended)
+
+        // Group and rank recommendations
+        WITH recommended.id as movie_id, count(*) as num_likes
+        WHERE num_likes > 0
+        ORDER BY num_likes DESC
+        LIMIT 10
+        RETURN movie_id, num_likes
+    """
+
+# Recommendations from an already known list of neighbours (neighbour_index)
+NEIGHBOUR_RECOMMENDATION_QUERY = """
+        MATCH (active:User {username: $username})
+        MATCH (neighbor:User)-[:LIKES]->(recommended:Movie)
+        WHERE neighbor.username IN $neighbours
+          AND NOT (active)-[:LIKES]->(recommended)
+        WITH recommended.id as movie_id, count(*) as num_likes
+        ORDER BY num_likes DESC
+        LIMIT 10
+        RETURN movie_id, num_likes
+    """
+
+# ALS ranks movies from the likes it was trained on; this drops the ones the
+# user has liked since, keeping the model's order
+ALS_FILTER_QUERY = """
+        MATCH (active:User {username: $username})
+        UNWIND range(0, size($movie_ids) - 1) AS rank
+        WITH active, rank, $movie_ids[rank] AS movie_id
+        WHERE NOT (active)-[:LIKES]->(:Movie {id: movie_id})
+        RETURN movie_id
+        ORDER BY rank
+        LIMIT 10
+    """
+
+# ALS candidates ranked per request, so that 10 remain after dropping movies
+# liked since training
+ALS_CANDIDATES = 30
+
+# Optional in-memory engine (like_matrix.LikeMatrix); None means Cypher only
+_like_matrix = None
+
+# Optional precomputed neighbours (catalog_snapshot.SnapshotReloader of a
+# neighbour_index.UserNeighbourIndex)
+_neighbour_index = None
+
+# Optional approximate neighbour search (minhash.MinHashLSH)
+_minhash_index = None
+
+# Optional "also liked" table (catalog_snapshot.SnapshotReloader of an
+# item_similarity.CoLikeTable); None means no section
+_also_liked_table = None
+
+# Optional matrix-factorization model (als.ALSModel); None means similar users only
+_als_model = None
+
+
+def use_like_matrix(like_matrix):
+    """Serve recommendations from an in-memory LikeMatrix, or pass None to use Neo4j only"""
+    global _like_matrix
+    _like_matrix = like_matrix
+
+
+def use_neighbour_index(reloader):
+    """Read similar users from a reloaded UserNeighbourIndex, or pass None to compute them live"""
+    global _neighbour_index
+    _neighbour_index = reloader
+
+
+def use_minhash_index(minhash_index):
+    """Find similar users with a MinHashLSH index, or pass None for the exact Jaccard over every user"""
+    global _minhash_index
+    _minhash_index = minhash_index
+
+
+def use_als_model(als_model):
+    """Rank recommendations with an ALSModel, or pass None to use the similar-user methods"""
+    global _als_model
+    _als_model = als_model
+
+
+def use_also_liked_table(reloader):
+    """Serve get_also_liked_movies from a reloaded CoLikeTable, or pass None to disable it"""
+    global _also_liked_table
+    _also_liked_table = reloader
+
+
+def update_user_likes(username, movie_ids):
+    """
+    Apply a user's new set of liked movies to the in-memory engines, so that
+    recommendations follow without waiting for a rebuild.
+
+    Args:
+        username (str): User whose likes changed
+        movie_ids (iterable): Every movie the user now likes
+    """
+    if _like_matrix is None:
+        return
+    if _neighbour_index is not None:
+        # Also sets the likes on the matrix
+        _neighbour_index.get().update_user(_like_matrix, username, movie_ids)
+    else:
+        _like_matrix.set_user_likes(username, movie_ids)
+    if _minhash_index is not None:
+        _minhash_index.update_user(username)
+
+
+@observed
+def get_also_liked_movies(movie_id, limit=10):
+    """
+    Movies most often liked by the users who liked a movie, from the offline
+    co-like table (see item_similarity.py).
+
+    Returns:
+        list: Movie cards, best first; empty when no table is loaded
+    """
+    try:
+        if _also_liked_table is None:
+            return []
+        return get_movie_cards([neighbour for neighbour, _ in _also_liked_table.get().also_liked(movie_id, limit)])
+
+    except Exception as e:
+        print(f"Error retrieving also liked movies: {e}")
+        SERVICE_ERRORS.inc(function="get_also_liked_movies")
         return []
-    finally:
-        if 'driver' in locals():
-            driver.close()
+
+
+def recommendation_plan(username):
+    """
+    Decide how to rank a user's recommendations (shared with async_service).
+
+    Returns:
+        tuple: (movie_ids, None, None) when answered in memory, otherwise
+            (None, cypher_query, parameters) for Neo4j
+    """
+    # ALS backend; users trained after the model fall through to the neighbours
+    if _als_model is not None:
+        ranked = _als_model.recommend(username, ALS_CANDIDATES)
+        if ranked is not None:
+            movie_ids = [movie_id for movie_id, _ in ranked]
+            if _like_matrix is None:
+                return None, ALS_FILTER_QUERY, {"username": username, "movie_ids": movie_ids}
+            liked = set(_like_matrix.liked_movies(username) or [])
+            return [movie_id for movie_id in movie_ids if movie_id not in liked][:10], None, None
+
+    neighbours = _neighbour_index.get().get(username) if _neighbour_index is not None else None
+
+    # Approximate mode: candidates from the LSH buckets, re-ranked with the exact Jaccard
+    if neighbours is None and _minhash_index is not None:
+        approximate = _minhash_index.neighbours(username)
+        if approximate is not None:
+            neighbours = [name for name, _ in approximate]
+
+    # Try the in-memory engine first; it returns None for users it has not loaded
+    if _like_matrix is not None:
+        if neighbours is not None:
+            ranked = _like_matrix.recommend_from_neighbours(username, neighbours)
+        else:
+            ranked = _like_matrix.recommend(username)
+        if ranked is not None:
+            return [movie_id for movie_id, _ in ranked], None, None
+
+    if neighbours == []:
+        return [], None, None
+
+    if neighbours is not None:
+        return None, NEIGHBOUR_RECOMMENDATION_QUERY, {"username": username, "neighbours": neighbours}
+
+    # Get recommended movie IDs using optimized Neo4j query
+    return None, RECOMMENDATION_QUERY, {"username": username}
+
+
+def _recommended_movie_ids(username):
+    """
+    Rank recommended movie ids for a user.
+
+    Neighbours come from the neighbour index when the user has an entry, and are
+    computed live otherwise. Votes are counted in memory when a LikeMatrix is
+    loaded, and in Neo4j otherwise.
+    """
+    movie_ids, query, parameters = recommendation_plan(username)
+    if movie_ids is not None:
+        return movie_ids
+
+    with get_neo4j_driver().session() as session, watch_cypher(query, parameters):
+        result = session.run(query, **parameters)
+
+        # Extract movie IDs while preserving order
+        return [record["movie_id"] for record in result]
 
 
 """"""
+@observed
 def get_recommendations_for_me(username):
     """
     Get movie recommendations for a user based on similar users' preferences using an optimized single-query approach.
@@ -438,112 +971,13 @@ def get_recommendations_for_me(username):
         ]
     """
     try:
-        # Connect to Neo4j
-        neo4j_driver = GraphDatabase.driver(
-            "bolt://localhost:7687",
-            auth=("neo4j", "password")
-        )
-        
-        # Connect to MongoDB
-        mongo_client = MongoClient()
-        mongo_db = mongo_client["websitedb"]
-        movies_collection = mongo_db.movies
-        
-        # Get recommended movie IDs using optimized Neo4j query
-        with neo4j_driver.session() as session:
-            result = session.run("""
-                // Find active user's liked movies
-                MATCH (active:User {username: $username})-[:LIKES]->(m:Movie)
-                WITH active, collect(m.id) as active_movies
-
-                // Find other users and their liked movies
-                MATCH (other:User)-[:LIKES]->(m:Movie)
-                WHERE other.username <> active.username
-                WITH active, active_movies, other, collect(m.id) as other_movies
-
-                // Calculate Jaccard similarity in a single step
-                WITH 
-                    active,
-                    other,
-                    active_movies,
-                    other_movies,
-                    size([x IN active_movies WHERE x IN other_movies]) as intersection_size,
-                    size(active_movies + [x IN other_movies WHERE NOT x IN active_movies]) as union_size,
-                    toFloat(size([x IN active_movies WHERE x IN other_movies])) / 
-                    size(active_movies + [x IN other_movies WHERE NOT x IN active_movies]) as jaccard_index
-
-                // Filter and rank similar users
-                WHERE jaccard_index > 0
-                WITH active, other, jaccard_index
-                ORDER BY jaccard_index DESC
-                LIMIT 3
-
-                // Get movie recommendations from similar users
-                WITH collect(other) as similar_users, active
-                UNWIND similar_users as neighbor
-                MATCH (neighbor)-[:LIKES]->(recommended:Movie)
-                WHERE NOT (active)-[:LIKES]->(recommended)
-
-                // Group and rank recommendations
-                WITH recommended.id as movie_id, count(*) as num_likes
-                WHERE num_likes > 0
-                ORDER BY num_likes DESC
-                LIMIT 10
-                RETURN movie_id, num_likes
-            """, username=username)
-            
-            # Extract movie IDs while preserving order
-            movie_ids = [record["movie_id"] for record in result]
-        
-        # Get detailed movie information from MongoDB
-        recommendations = []
-        if movie_ids:
-            # Create an index on _id if it doesn't exist
-            movies_collection.create_index([("_id", 1)])
-            
-            # Fetch movies and create a mapping to preserve order
-            movies_cursor = movies_collection.find(
-                {"_id": {"$in": movie_ids}},
-                projection={
-                    "_id": 1,
-                    "poster_path": 1,
-                    "release_date": 1,
-                    "title": 1,
-                    "vote_average": 1,
-                    "vote_count": 1
-                }
-            )
-            
-            # Create a mapping of movie_id to movie details
-            movie_dict = {
-                movie["_id"]: {
-                    "_id": movie["_id"],
-                    "poster_path": movie.get("poster_path", ""),
-                    "release_date": movie.get("release_date"),
-                    "title": movie.get("title", ""),
-                    "vote_average": movie.get("vote_average", 0),
-                    "vote_count": movie.get("vote_count", 0)
-                }
-                for movie in movies_cursor
-            }
-            
-            # Maintain the order from Neo4j recommendations
-            recommendations = [
-                movie_dict[movie_id]
-                for movie_id in movie_ids
-                if movie_id in movie_dict
-            ]
+        movie_ids = _recommended_movie_ids(username)
 
-        return recommendations
+        # Get detailed movie information from MongoDB, in the order of the ranking
+        return get_movie_cards(movie_ids)
 
     except Exception as e:
         print(f"Error getting recommendations: {e}")
+        SERVICE_ERRORS.inc(function="get_recommendations_for_me")
         return []
-    
-    finally:
-        # Ensure connections are properly closed
-        if 'neo4j_driver' in locals():
-            neo4j_driver.close()
-        if 'mongo_client' in locals():
-            mongo_client.close()
             
\ No newline at end of file
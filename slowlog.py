@@ -0,0 +1,384 @@
+import argparse
+import json
+import logging
+import logging.handlers
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from pymongo import monitoring
+
+from . import config
+
+# Mongo commands the hook watches (service.py only reads)
+WATCHED_COMMANDS = ("find", "aggregate")
+# Session and routing fields that cannot be sent back in an explain command
+_COMMAND_META_FIELDS = {"lsid", "$db", "$clusterTime", "$readPreference", "txnNumber", "signature", "apiVersion"}
+
+_logger = None
+_logger_lock = threading.Lock()
+
+# Plans are captured off the request path, one at a time
+_plan_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="slowlog-plan")
+
+
+def _get_logger():
+    """
+    JSON-lines logger appending to config.SLOWLOG_PATH.
+
+    Every pre-forked worker appends to the same file, so rotation is left to
+    logrotate, which renames it (see logrotate_config); each worker reopens the
+    path once it moved.
+    """
+    global _logger
+    if _logger is None:
+        with _logger_lock:
+            if _logger is None:
+                logger = logging.getLogger("slowlog")
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+                handler = logging.handlers.WatchedFileHandler(config.SLOWLOG_PATH)
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger.addHandler(handler)
+                _logger = logger
+    return _logger
+
+
+def _write(record):
+    _get_logger().info(json.dumps(record, default=str))
+
+
+class _PlanSampler:
+    """
+    Decides which slow queries get an explain/PROFILE plan.
+
+    A query is sampled with probability config.SLOWLOG_PLAN_SAMPLE_RATE, at most
+    config.SLOWLOG_MAX_PLANS_PER_MINUTE times per minute, and only while no other
+    plan is being captured, so a burst of slow queries cannot turn into a burst
+    of extra load on the database that is already struggling.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._window_start = 0.0
+        self._taken = 0
+        self._busy = False
+
+    def acquire(self):
+        if random.random() >= config.SLOWLOG_PLAN_SAMPLE_RATE:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= 60:
+                self._window_start, self._taken = now, 0
+            if self._busy or self._taken >= config.SLOWLOG_MAX_PLANS_PER_MINUTE:
+                return False
+            self._taken += 1
+            self._busy = True
+            return True
+
+    def release(self):
+        with self._lock:
+            self._busy = False
+
+
+_sampler = _PlanSampler()
+
+
+def _capture_plan(record, get_plan):
+    """Log record, with a plan when sampled; the plan is fetched on the plan thread"""
+    if not _sampler.acquire():
+        _write(record)
+        return
+
+    def capture():
+        try:
+            record["plan"] = get_plan()
+        except Exception as e:
+            record["plan_error"] = str(e)
+        finally:
+            _sampler.release()
+        _write(record)
+
+    try:
+        _plan_executor.submit(capture)
+    except RuntimeError:
+        # Interpreter shutting down
+        _sampler.release()
+        _write(record)
+
+
+def query_shape(value):
+    """Filter/pipeline with every literal replaced by "?", so equal shapes group together"""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        # Lists of literals ($in, genres) collapse to one placeholder
+        shapes = [query_shape(item) for item in value]
+        if all(shape == "?" for shape in shapes):
+            return "?"
+        return shapes
+    return "?"
+
+
+def _truncate(value, limit=2000):
+    text = json.dumps(value, default=str)
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+class SlowQueryListener(monitoring.CommandListener):
+    """
+    Logs MongoDB find/aggregate commands slower than config.SLOWLOG_THRESHOLD_MS,
+    with a sampled explain() plan. Registered on the clients in clients.py.
+    """
+
+    def __init__(self, max_in_flight=10000):
+        """
+        Args:
+            max_in_flight (int): Started commands kept until their succeeded or
+                failed event; past it the oldest are dropped, so commands that
+                never get one cannot grow the map without bound
+        """
+        self.max_in_flight = max_in_flight
+        self._started = OrderedDict()
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        if event.command_name in WATCHED_COMMANDS:
+            with self._lock:
+                self._started[(event.connection_id, event.request_id)] = event.command
+                while len(self._started) > self.max_in_flight:
+                    self._started.popitem(last=False)
+
+    def _pop(self, event):
+        with self._lock:
+            return self._started.pop((event.connection_id, event.request_id), None)
+
+    def succeeded(self, event):
+        command = self._pop(event)
+        if command is not None and event.duration_micros >= config.SLOWLOG_THRESHOLD_MS * 1000:
+            self._record(event, command)
+
+    def failed(self, event):
+        command = self._pop(event)
+        if command is not None and event.duration_micros >= config.SLOWLOG_THRESHOLD_MS * 1000:
+            self._record(event, command, error=str(event.failure))
+
+    @staticmethod
+    def _record(event, command, error=None):
+        name = event.command_name
+        body = command.get("filter", {}) if name == "find" else command.get("pipeline", [])
+        shape = {"filter": query_shape(body)} if name == "find" else {"pipeline": query_shape(body)}
+        for option in ("sort", "projection", "limit"):
+            if option in command:
+                shape[option] = command[option] if option != "limit" else "?"
+
+        record = {
+            "time": time.time(),
+            "backend": "mongo",
+            "shape": f"{name} {command.get(name)} {json.dumps(shape, sort_keys=True, default=str)}",
+            "duration_ms": event.duration_micros / 1000,
+            "parameters": _truncate(body),
+        }
+        if error:
+            record["error"] = error
+
+        explain_command = {key: value for key, value in command.items() if key not in _COMMAND_META_FIELDS}
+        database = event.database_name
+
+        def get_plan():
+            from .clients import get_mongo_client
+            explained = get_mongo_client()[database].command(
+                {"explain": explain_command, "verbosity": config.SLOWLOG_EXPLAIN_VERBOSITY}
+            )
+            return _summarize_explain(explained)
+
+        _capture_plan(record, get_plan)
+
+
+def _summarize_explain(explained):
+    """The parts of an explain() result that say why a query is slow"""
+    planner = explained.get("queryPlanner")
+    if planner is None and explained.get("stages"):
+        # Aggregations wrap the planner of their first ($cursor) stage
+        planner = explained["stages"][0].get("$cursor", {}).get("queryPlanner")
+    summary = {"winningPlan": (planner or {}).get("winningPlan")}
+    stats = explained.get("executionStats")
+    if stats:
+        summary["executionStats"] = {
+            key: stats.get(key) for key in ("nReturned", "totalKeysExamined", "totalDocsExamined", "executionTimeMillis")
+        }
+    return summary
+
+
+slow_query_listener = SlowQueryListener()
+
+
+def cypher_shape(query):
+    """Cypher text with whitespace and comments collapsed (queries are already parameterized)"""
+    query = re.sub(r"//[^\n]*", "", query)
+    return re.sub(r"\s+", " ", query).strip()
+
+
+@contextmanager
+def watch_cypher(query, parameters):
+    """
+    Time a Neo4j query (run and read its records inside the block) and log it
+    with a sampled PROFILE plan when it exceeds config.SLOWLOG_THRESHOLD_MS.
+    """
+    if not config.SLOWLOG_ENABLED:
+        yield
+        return
+
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = str(e)
+        raise
+    finally:
+        duration_ms = (time.perf_counter() - start) * 1000
+        if duration_ms >= config.SLOWLOG_THRESHOLD_MS:
+            record = {
+                "time": time.time(),
+                "backend": "neo4j",
+                "shape": cypher_shape(query),
+                "duration_ms": duration_ms,
+                "parameters": _truncate(parameters),
+            }
+            if error:
+                record["error"] = error
+            _capture_plan(record, lambda: _profile(query, parameters))
+
+
+def _profile(query, parameters):
+    """Run the query again under PROFILE and return its operator tree"""
+    from .clients import get_neo4j_driver
+    with get_neo4j_driver().session() as session:
+        summary = session.run("PROFILE " + query, **parameters).consume()
+    return _summarize_profile(summary.profile)
+
+
+def _summarize_profile(profile):
+    if not profile:
+        return None
+    return {
+        "operator": profile.get("operatorType"),
+        "rows": profile.get("rows"),
+        "dbHits": profile.get("dbHits"),
+        "details": profile.get("args", {}).get("Details"),
+        "children": [_summarize_profile(child) for child in profile.get("children", [])],
+    }
+
+
+def logrotate_config(path=None, max_size="50M"):
+    """
+    logrotate stanza for the slow-query log.
+
+    Files are renamed, never copied and truncated (workers may be writing), and
+    left uncompressed as the config.SLOWLOG_BACKUPS files read_records reads.
+    """
+    path = os.path.abspath(path or config.SLOWLOG_PATH)
+    return (
+        f"{path} {{\n"
+        f"    daily\n"
+        f"    maxsize {max_size}\n"
+        f"    rotate {config.SLOWLOG_BACKUPS}\n"
+        f"    missingok\n"
+        f"    notifempty\n"
+        f"    nocompress\n"
+        f"    nocopytruncate\n"
+        f"    create\n"
+        f"}}\n"
+    )
+
+
+def read_records(path):
+    """Slow-query records from a log file and its rotated backups"""
+    for suffix in [f".{i}" for i in range(config.SLOWLOG_BACKUPS, 0, -1)] + [""]:
+        try:
+            with open(path + suffix) as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            continue
+
+
+def _plan_headline(record):
+    """One line describing a record's plan"""
+    plan = record.get("plan")
+    if not plan:
+        return record.get("plan_error", "")
+    if record["backend"] == "mongo":
+        stages, node = [], plan.get("winningPlan") or {}
+        while node:
+            stages.append(node.get("stage", "?"))
+            node = node.get("inputStage") or (node.get("inputStages") or [None])[0]
+        return " <- ".join(stages)
+
+    def db_hits(node):
+        return (node.get("dbHits") or 0) + sum(db_hits(child) for child in node.get("children") or [])
+    return f"{plan.get('operator')} ({db_hits(plan)} db hits)"
+
+
+def summarize(path, top=10, backend=None):
+    """
+    Group slow queries by shape, worst total time first.
+
+    Returns:
+        list: dicts with shape, backend, count, total/p50/max ms and the latest plan headline
+    """
+    groups = defaultdict(list)
+    for record in read_records(path):
+        if backend is None or record.get("backend") == backend:
+            groups[(record["backend"], record["shape"])].append(record)
+
+    rows = []
+    for (record_backend, shape), records in groups.items():
+        durations = sorted(record["duration_ms"] for record in records)
+        with_plan = [record for record in records if record.get("plan")]
+        rows.append({
+            "backend": record_backend,
+            "shape": shape,
+            "count": len(records),
+            "total_ms": sum(durations),
+            "p50_ms": durations[len(durations) // 2],
+            "max_ms": durations[-1],
+            "plan": _plan_headline(with_plan[-1]) if with_plan else "",
+        })
+    rows.sort(key=lambda row: row["total_ms"], reverse=True)
+    return rows[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize the slow-query log by query shape")
+    parser.add_argument("--path", default=config.SLOWLOG_PATH)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--backend", choices=["mongo", "neo4j"])
+    parser.add_argument("--logrotate", action="store_true",
+                        help="Print a logrotate stanza for the log instead (e.g. into /etc/logrotate.d/)")
+    args = parser.parse_args()
+
+    if args.logrotate:
+        print(logrotate_config(args.path), end="")
+        return
+
+    for row in summarize(args.path, args.top, args.backend):
+        print(f"[{row['backend']}] {row['count']} calls, total {row['total_ms']:.0f} ms, "
+              f"p50 {row['p50_ms']:.0f} ms, max {row['max_ms']:.0f} ms")
+        print(f"    {row['shape'][:300]}")
+        if row["plan"]:
+            print(f"    plan: {row['plan']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import os
+from collections import Counter
+
+import pytest
+
+from .. import config
+from ..like_matrix import LikeMatrix, verify_against_cypher
+from ..minhash import MinHashLSH
+from ..service import RECOMMENDATION_QUERY
+
+# alice's Jaccard index with each user: carol 3/4, bob 2/5, dave 1/4 and
+# erin 1/4 (a tie), frank 0
+LIKES = {
+    "alice": {1, 2, 3},
+    "bob": {1, 2, 4, 5},
+    "carol": {1, 2, 3, 5},
+    "dave": {3, 6},
+    "erin": {1, 7},
+    "frank": {8},
+}
+
+
+def cypher_recommendations(likes, username, k=3, limit=10):
+    """
+    RECOMMENDATION_QUERY in plain Python: the k users with the highest Jaccard
+    index above 0, then the movies they like that the user does not, by number
+    of neighbours liking them. Ties are broken by username and movie id, where
+    Neo4j breaks them arbitrarily.
+    """
+    active = likes[username]
+    scores = []
+    for other, movies in likes.items():
+        if other == username:
+            continue
+        jaccard = len(active & movies) / len(active | movies)
+        if jaccard > 0:
+            scores.append((-jaccard, other))
+    neighbours = [other for _, other in sorted(scores)[:k]]
+
+    votes = Counter(movie_id for other in neighbours for movie_id in likes[other] - active)
+    ranked = sorted(votes.items(), key=lambda item: (-item[1], item[0]))
+    return ranked[:limit]
+
+
+@pytest.fixture
+def like_matrix():
+    return LikeMatrix(LIKES)
+
+
+def test_neighbours_rank_by_jaccard_without_the_user(like_matrix):
+    # dave and erin tie at 1/4; the row order (usernames sorted) breaks it
+    assert like_matrix.neighbours("alice") == [("carol", 0.75), ("bob", 0.4), ("dave", 0.25)]
+
+
+def test_recommend_matches_cypher_ranking(like_matrix):
+    # carol and bob both like 5; 4 (bob) and 6 (dave) tie and come by movie id.
+    # 1, 2 and 3 are liked by neighbours but already liked by alice.
+    expected = [(5, 2), (4, 1), (6, 1)]
+    assert cypher_recommendations(LIKES, "alice") == expected
+    assert like_matrix.recommend("alice") == expected
+
+
+def test_recommend_matches_cypher_for_every_user(like_matrix):
+    for username in LIKES:
+        actual = like_matrix.recommend(username)
+        assert actual == cypher_recommendations(LIKES, username), username
+        assert not {movie_id for movie_id, _ in actual} & LIKES[username]
+
+
+def test_recommend_limit_keeps_best_votes(like_matrix):
+    assert like_matrix.recommend("alice", limit=2) == [(5, 2), (4, 1)]
+
+
+def test_user_without_similar_users_gets_nothing(like_matrix):
+    assert like_matrix.neighbours("frank") == []
+    assert like_matrix.recommend("frank") == []
+
+
+def test_unknown_user(like_matrix):
+    assert like_matrix.neighbours("mallory") is None
+    assert like_matrix.recommend("mallory") is None
+
+
+def test_set_user_likes_updates_recommendations(like_matrix):
+    like_matrix.set_user_likes("alice", {1, 2, 3, 5})
+    likes = dict(LIKES, alice={1, 2, 3, 5})
+    assert like_matrix.recommend("alice") == cypher_recommendations(likes, "alice")
+    assert 5 not in {movie_id for movie_id, _ in like_matrix.recommend("alice")}
+
+
+def test_fingerprint_follows_set_user_likes(like_matrix):
+    before = like_matrix.fingerprint()
+    like_matrix.set_user_likes("alice", {1, 2})
+    like_matrix.set_user_likes("grace", {9})
+    assert like_matrix.fingerprint() != before
+    assert like_matrix.fingerprint() == LikeMatrix(dict(LIKES, alice={1, 2}, grace={9})).fingerprint()
+
+    like_matrix.set_user_likes("alice", {1, 2, 3})
+    assert like_matrix.fingerprint() == LikeMatrix(dict(LIKES, grace={9})).fingerprint()
+
+
+def test_minhash_update_user_follows_set_user_likes(like_matrix):
+    index = MinHashLSH(like_matrix, num_perm=64, bands=64)
+    like_matrix.set_user_likes("frank", {1, 2, 3})
+    like_matrix.set_user_likes("grace", {1, 2, 3})
+    index.update_user("frank")
+    index.update_user("grace")
+    # Identical signatures share every bucket, so the exact neighbours are found
+    assert index.neighbours("frank")[:2] == [("alice", 1.0), ("grace", 1.0)]
+
+    like_matrix.set_user_likes("frank", {8})
+    index.update_user("frank")
+    assert index.neighbours("frank") == []
+    assert "frank" not in {other for other, _ in index.neighbours("alice")}
+
+
+@pytest.fixture
+def neo4j_driver():
+    """
+    The LIKES fixture written to the Neo4j at NEO4J_TEST_URI (skipped if unset).
+
+    RECOMMENDATION_QUERY scores every user in the database, so the database
+    must be empty; the fixture nodes are deleted afterwards.
+    """
+    uri = os.environ.get("NEO4J_TEST_URI")
+    if not uri:
+        pytest.skip("NEO4J_TEST_URI is not set")
+    from neo4j import GraphDatabase
+
+    driver = GraphDatabase.driver(uri, auth=(config.NEO4J_USER, config.NEO4J_PASSWORD))
+    with driver.session() as session:
+        nodes = session.run("MATCH (n) RETURN count(n) AS nodes").single()["nodes"]
+    if nodes:
+        driver.close()
+        pytest.skip("The test database is not empty")
+    try:
+        with driver.session() as session:
+            session.run("""
+                UNWIND $likes AS like
+                MERGE (u:User {username: like[0]})
+                MERGE (m:Movie {id: like[1]})
+                MERGE (u)-[:LIKES]->(m)
+            """, likes=[[username, movie_id] for username, movie_ids in LIKES.items() for movie_id in movie_ids]).consume()
+        yield driver
+    finally:
+        with driver.session() as session:
+            session.run("""
+                MATCH (n)
+                WHERE (n:User AND n.username IN $usernames) OR (n:Movie AND n.id IN $movie_ids)
+                DETACH DELETE n
+            """, usernames=list(LIKES), movie_ids=sorted(set().union(*LIKES.values()))).consume()
+        driver.close()
+
+
+def test_cypher_query_matches_fixture(neo4j_driver, like_matrix):
+    # carol and bob are alice's first neighbours, so 5 gets 2 votes whichever
+    # of the tied dave and erin Neo4j picks third
+    with neo4j_driver.session() as session:
+        result = session.run(RECOMMENDATION_QUERY, username="alice")
+        expected = [(record["movie_id"], record["num_likes"]) for record in result]
+    assert expected[0] == (5, 2)
+    assert [votes for _, votes in expected] == [votes for _, votes in like_matrix.recommend("alice")]
+    assert verify_against_cypher(neo4j_driver, like_matrix) == []
@@ -0,0 +1,34 @@
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+
+
+def record(name, seconds):
+    """Add a duration to the current request's timing breakdown (no-op outside requests)"""
+    if not has_request_context():
+        return
+    timings = g.setdefault("timings", {})
+    timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def timed(name):
+    """Record how long a block takes under name"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def get_timings():
+    """{name: seconds} recorded so far in the current request"""
+    if not has_request_context():
+        return {}
+    return dict(g.get("timings", {}))
+
+
+def server_timing_header(timings):
+    """Format timings as a Server-Timing header value (durations in milliseconds)"""
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())